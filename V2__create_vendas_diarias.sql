@@ -0,0 +1,18 @@
+-- Migração V2: Rollup diário de vendas
+-- Data: 2025-01-20
+-- Descrição: Cria a tabela vendas_diarias, mantida incrementalmente pela aplicação
+-- (rollups.py), e preenche os dias já existentes
+
+CREATE TABLE vendas_diarias (
+    data DATE PRIMARY KEY,
+    total_pedidos INT NOT NULL DEFAULT 0,
+    total_vendas DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Backfill a partir dos pedidos existentes
+INSERT INTO vendas_diarias (data, total_pedidos, total_vendas, atualizado_em)
+SELECT DATE(data_pedido), COUNT(*), SUM(valor_total), UTC_TIMESTAMP()
+FROM pedidos
+WHERE status != 'cancelado'
+GROUP BY DATE(data_pedido);
@@ -0,0 +1,42 @@
+-- Migração V3: Rollups de vendas por produto
+-- Data: 2025-01-21
+-- Descrição: Cria vendas_produto (totais) e vendas_produto_diarias (por dia),
+-- mantidas incrementalmente pela aplicação (rollups.py), e preenche a partir
+-- dos pedidos não cancelados existentes
+
+CREATE TABLE vendas_produto_diarias (
+    data DATE NOT NULL,
+    id_produto INT NOT NULL,
+    quantidade_vendida INT NOT NULL DEFAULT 0,
+    receita_total DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    total_pedidos INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (data, id_produto),
+    FOREIGN KEY (id_produto) REFERENCES produtos(id_produto)
+);
+
+CREATE TABLE vendas_produto (
+    id_produto INT PRIMARY KEY,
+    quantidade_vendida INT NOT NULL DEFAULT 0,
+    receita_total DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    total_pedidos INT NOT NULL DEFAULT 0,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (id_produto) REFERENCES produtos(id_produto)
+);
+
+-- Índices para consultas top-N
+CREATE INDEX idx_vendas_produto_quantidade ON vendas_produto(quantidade_vendida);
+CREATE INDEX idx_vendas_produto_receita ON vendas_produto(receita_total);
+CREATE INDEX idx_vendas_produto_diarias_produto ON vendas_produto_diarias(id_produto, data);
+
+-- Backfill a partir dos pedidos existentes
+INSERT INTO vendas_produto_diarias (data, id_produto, quantidade_vendida, receita_total, total_pedidos)
+SELECT DATE(p.data_pedido), ip.id_produto, SUM(ip.quantidade), SUM(ip.subtotal), COUNT(DISTINCT ip.id_pedido)
+FROM itens_pedido ip
+JOIN pedidos p ON p.id_pedido = ip.id_pedido
+WHERE p.status != 'cancelado'
+GROUP BY DATE(p.data_pedido), ip.id_produto;
+
+INSERT INTO vendas_produto (id_produto, quantidade_vendida, receita_total, total_pedidos, atualizado_em)
+SELECT id_produto, SUM(quantidade_vendida), SUM(receita_total), SUM(total_pedidos), UTC_TIMESTAMP()
+FROM vendas_produto_diarias
+GROUP BY id_produto;
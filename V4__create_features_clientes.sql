@@ -0,0 +1,35 @@
+-- Migração V4: Features RFM de clientes
+-- Data: 2025-01-22
+-- Descrição: Cria features_clientes (estatísticas por cliente) e watermarks
+-- (posição dos jobs incrementais) e preenche a partir dos pedidos existentes
+
+CREATE TABLE watermarks (
+    nome VARCHAR(100) PRIMARY KEY,
+    valor BIGINT NOT NULL DEFAULT 0,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE features_clientes (
+    id_cliente INT PRIMARY KEY,
+    ultimo_pedido DATETIME,
+    total_pedidos INT NOT NULL DEFAULT 0,
+    valor_total_gasto DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    dias_com_compras INT NOT NULL DEFAULT 0,
+    atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (id_cliente) REFERENCES clientes(id_cliente)
+);
+
+-- Usado pelo cálculo de dias distintos com compra do job incremental
+CREATE INDEX idx_pedidos_cliente_data ON pedidos(id_cliente, data_pedido);
+
+-- Backfill a partir dos pedidos existentes; o job continua a partir do watermark
+INSERT INTO watermarks (nome, valor, atualizado_em)
+SELECT 'features_clientes', COALESCE(MAX(id_pedido), 0), UTC_TIMESTAMP() FROM pedidos;
+
+INSERT INTO features_clientes
+    (id_cliente, ultimo_pedido, total_pedidos, valor_total_gasto, dias_com_compras, atualizado_em)
+SELECT id_cliente, MAX(data_pedido), COUNT(*), SUM(valor_total), COUNT(DISTINCT DATE(data_pedido)), UTC_TIMESTAMP()
+FROM pedidos
+WHERE status != 'cancelado'
+AND id_pedido <= (SELECT valor FROM watermarks WHERE nome = 'features_clientes')
+GROUP BY id_cliente;
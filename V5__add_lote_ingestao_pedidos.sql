@@ -0,0 +1,10 @@
+-- Migração V5: Lote de ingestão dos pedidos
+-- Data: 2025-01-24
+-- Descrição: Adiciona pedidos.lote_ingestao, o identificador do lote da
+-- ingestão em massa (ingestao.py) que gravou o pedido; os ids gerados por um
+-- INSERT multi-linha são lidos de volta por ele, em qualquer
+-- innodb_autoinc_lock_mode
+
+ALTER TABLE pedidos ADD COLUMN lote_ingestao CHAR(32) NULL;
+
+CREATE INDEX idx_pedidos_lote_ingestao ON pedidos(lote_ingestao);
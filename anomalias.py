@@ -0,0 +1,267 @@
+"""
+Detecção contínua de anomalias em vendas
+Mantém estatísticas móveis incrementais (Welford, EWMA e por dia da semana) que
+são atualizadas a cada novo dia/hora de vendas, sem reprocessar a janela inteira
+"""
+
+import os
+import json
+import math
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from ..database.consultas import consultas
+
+logger = logging.getLogger(__name__)
+
+# Arquivo com o estado do detector diário entre execuções do job
+ARQUIVO_ESTADO_ANOMALIAS = os.getenv('ANOMALIAS_ESTADO_ARQUIVO', 'anomalias_vendas.json')
+
+class EstatisticaOnline:
+    """
+    Média e variância acumuladas pelo algoritmo de Welford (numericamente estável)
+    """
+    
+    def __init__(self, n=0, media=0.0, m2=0.0):
+        self.n = n
+        self.media = media
+        self.m2 = m2
+    
+    def atualizar(self, valor):
+        self.n += 1
+        delta = valor - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (valor - self.media)
+    
+    @property
+    def desvio(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+    
+    def para_dict(self):
+        return {'n': self.n, 'media': self.media, 'm2': self.m2}
+
+class EWMA:
+    """
+    Média e variância com pesos exponenciais (dão mais peso aos valores recentes)
+    """
+    
+    def __init__(self, alpha, n=0, media=0.0, variancia=0.0):
+        self.alpha = alpha
+        self.n = n
+        self.media = media
+        self.variancia = variancia
+    
+    def atualizar(self, valor):
+        self.n += 1
+        if self.n == 1:
+            self.media = valor
+            return
+        diferenca = valor - self.media
+        incremento = self.alpha * diferenca
+        self.media += incremento
+        self.variancia = (1 - self.alpha) * (self.variancia + diferenca * incremento)
+    
+    @property
+    def desvio(self):
+        return math.sqrt(self.variancia)
+    
+    def para_dict(self):
+        return {'n': self.n, 'media': self.media, 'variancia': self.variancia}
+
+class DetectorAnomaliasVendas:
+    """
+    Detector online de anomalias em séries de vendas (diárias ou horárias)
+    
+    Cada valor recebido é comparado com o esperado antes de atualizar as
+    estatísticas: a EWMA do mesmo período sazonal (dia da semana, ou dia da
+    semana + hora) quando já tem observações suficientes, senão a EWMA geral.
+    O valor é anômalo quando se afasta mais de `limiar` desvios do esperado.
+    As estatísticas gerais de Welford guardam média e desvio de toda a série.
+    
+    Valores com instante menor ou igual ao último recebido são ignorados, então
+    reenviar um período já processado não altera o estado.
+    """
+    
+    def __init__(self, limiar=2.0, alpha=0.1, alpha_sazonal=0.2, minimo_observacoes=7,
+                 minimo_sazonal=3, granularidade='dia'):
+        """
+        Args:
+            limiar (float): Desvios em relação ao esperado para considerar anomalia
+            alpha (float): Peso dos valores novos na EWMA geral
+            alpha_sazonal (float): Peso dos valores novos na EWMA de cada período sazonal
+            minimo_observacoes (int): Observações antes de começar a sinalizar anomalias
+            minimo_sazonal (int): Observações de um período sazonal antes de usá-lo
+            granularidade (str): 'dia' (sazonalidade por dia da semana) ou 'hora'
+                (por dia da semana e hora)
+        """
+        self.limiar = limiar
+        self.alpha = alpha
+        self.alpha_sazonal = alpha_sazonal
+        self.minimo_observacoes = minimo_observacoes
+        self.minimo_sazonal = minimo_sazonal
+        self.granularidade = granularidade
+        self.geral = EstatisticaOnline()
+        self.ewma = EWMA(alpha)
+        self.sazonal = {}
+        self.ultimo_instante = None
+        self.total_anomalias = 0
+        self._lock = threading.Lock()
+    
+    def _periodo_sazonal(self, instante):
+        if self.granularidade == 'hora':
+            return f"{instante.weekday()}-{instante.hour}"
+        return str(instante.weekday())
+    
+    def _esperado(self, periodo):
+        sazonal = self.sazonal.get(periodo)
+        if sazonal is not None and sazonal.n >= self.minimo_sazonal:
+            return sazonal.media, sazonal.desvio
+        return self.ewma.media, self.ewma.desvio
+    
+    def registrar(self, instante, valor):
+        """
+        Recebe o valor de um novo período (dia ou hora) e avalia se é anômalo
+        
+        Args:
+            instante (date ou datetime): Início do período
+            valor (float): Vendas do período
+        
+        Returns:
+            dict: Avaliação do período, ou None se o instante já foi processado
+        """
+        valor = float(valor)
+        with self._lock:
+            if self.ultimo_instante is not None and instante <= self.ultimo_instante:
+                return None
+            
+            periodo = self._periodo_sazonal(instante)
+            esperado, desvio = self._esperado(periodo)
+            aquecido = self.geral.n >= self.minimo_observacoes
+            
+            z = (valor - esperado) / desvio if desvio > 0 else 0.0
+            anomalia = aquecido and abs(z) > self.limiar
+            avaliacao = {
+                'data': instante.isoformat(),
+                'valor': valor,
+                'esperado': esperado,
+                'desvio': desvio,
+                'z_score': z,
+                'anomalia': anomalia,
+                'tipo_anomalia': ('acima_normal' if z > 0 else 'abaixo_normal') if anomalia else 'normal'
+            }
+            
+            # Atualizar as estatísticas com o novo valor (O(1))
+            self.geral.atualizar(valor)
+            self.ewma.atualizar(valor)
+            self.sazonal.setdefault(periodo, EWMA(self.alpha_sazonal)).atualizar(valor)
+            self.ultimo_instante = instante
+            if anomalia:
+                self.total_anomalias += 1
+            
+            return avaliacao
+    
+    def resumo(self):
+        return {
+            'observacoes': self.geral.n,
+            'media_vendas': self.geral.media,
+            'desvio_padrao': self.geral.desvio,
+            'media_recente': self.ewma.media,
+            'desvio_recente': self.ewma.desvio,
+            'ultimo_periodo': self.ultimo_instante.isoformat() if self.ultimo_instante else None,
+            'total_anomalias': self.total_anomalias
+        }
+    
+    def para_dict(self):
+        """
+        Estado serializável em JSON, para retomar o detector em outra execução
+        """
+        with self._lock:
+            return {
+                'parametros': {
+                    'limiar': self.limiar,
+                    'alpha': self.alpha,
+                    'alpha_sazonal': self.alpha_sazonal,
+                    'minimo_observacoes': self.minimo_observacoes,
+                    'minimo_sazonal': self.minimo_sazonal,
+                    'granularidade': self.granularidade
+                },
+                'geral': self.geral.para_dict(),
+                'ewma': self.ewma.para_dict(),
+                'sazonal': {p: e.para_dict() for p, e in self.sazonal.items()},
+                'ultimo_instante': self.ultimo_instante.isoformat() if self.ultimo_instante else None,
+                'total_anomalias': self.total_anomalias
+            }
+    
+    @classmethod
+    def de_dict(cls, estado):
+        detector = cls(**estado['parametros'])
+        detector.geral = EstatisticaOnline(**estado['geral'])
+        detector.ewma = EWMA(detector.alpha, **estado['ewma'])
+        detector.sazonal = {p: EWMA(detector.alpha_sazonal, **e) for p, e in estado['sazonal'].items()}
+        if estado['ultimo_instante']:
+            conversor = datetime if detector.granularidade == 'hora' else date
+            detector.ultimo_instante = conversor.fromisoformat(estado['ultimo_instante'])
+        detector.total_anomalias = estado['total_anomalias']
+        return detector
+
+def carregar_detector(caminho, **parametros):
+    """
+    Carrega o estado do detector de um arquivo JSON (ou cria um novo)
+    """
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding='utf-8') as f:
+            return DetectorAnomaliasVendas.de_dict(json.load(f))
+    return DetectorAnomaliasVendas(**parametros)
+
+def salvar_detector(detector, caminho):
+    """
+    Grava o estado do detector (arquivo temporário + os.replace)
+    """
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(detector.para_dict(), f)
+    os.replace(temporario, caminho)
+
+def processar_novos_dias(session, detector, dias_aquecimento=90):
+    """
+    Envia ao detector os dias fechados (até ontem) ainda não processados
+    
+    Lê apenas os dias depois do último processado no rollup vendas_diarias; dias
+    sem pedidos entram com vendas 0. Na primeira execução, aquece o detector com
+    os últimos dias_aquecimento dias.
+    
+    Returns:
+        list: Avaliações dos dias processados
+    """
+    ontem = date.today() - timedelta(days=1)
+    ultimo = detector.ultimo_instante or (ontem - timedelta(days=dias_aquecimento))
+    if ultimo >= ontem:
+        return []
+    
+    result = consultas.executar(session, 'anomalias_vendas_novos_dias', {'desde': ultimo})
+    vendas = {row.data: float(row.total_vendas or 0) for row in result}
+    
+    avaliacoes = []
+    dia = ultimo + timedelta(days=1)
+    while dia <= ontem:
+        avaliacao = detector.registrar(dia, vendas.get(dia, 0.0))
+        if avaliacao is not None:
+            avaliacoes.append(avaliacao)
+        dia += timedelta(days=1)
+    
+    anomalias = [a for a in avaliacoes if a['anomalia']]
+    if anomalias:
+        logger.warning(f"{len(anomalias)} dia(s) com vendas anômalas: "
+                       f"{', '.join(a['data'] for a in anomalias)}")
+    return avaliacoes
+
+if __name__ == "__main__":
+    from ..database.connection import executar_com_retry
+    
+    # Job periódico (ex.: diário via cron): processa só os dias novos; repetir
+    # após uma falha transitória é seguro, o detector ignora dias já recebidos
+    detector = carregar_detector(ARQUIVO_ESTADO_ANOMALIAS)
+    avaliacoes = executar_com_retry(lambda session: processar_novos_dias(session, detector))
+    salvar_detector(detector, ARQUIVO_ESTADO_ANOMALIAS)
+    print(f"{len(avaliacoes)} dia(s) processado(s); "
+          f"{sum(a['anomalia'] for a in avaliacoes)} anomalia(s)")
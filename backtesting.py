@@ -0,0 +1,236 @@
+"""
+Backtesting e busca de hiperparâmetros da previsão de vendas
+Validação cruzada com origem móvel (rolling origin) sobre o histórico diário:
+as matrizes de cada fold são montadas uma vez e compartilhadas por todos os
+candidatos, avaliados em paralelo em um pool de processos. Os dias de teste são
+previstos de forma recursiva a partir da origem (prever_series_recursivo), só
+com o que se sabe na origem, como na previsão real
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_squared_error, mean_absolute_error
+from .ml_integration import FEATURES_PREVISAO_VENDAS, JANELA_PREVISAO, prever_series_recursivo
+
+logger = logging.getLogger(__name__)
+
+# Grade padrão da busca (combinações de todos os valores)
+GRADE_PARAMETROS_PADRAO = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [6, 10, None],
+    'min_samples_leaf': [1, 3]
+}
+
+def gerar_folds(datas, n_folds=5, tamanho_teste=14, minimo_treino=60, janela_treino=None):
+    """
+    Folds de origem móvel por data do calendário: cada fold treina até a origem
+    e testa nos tamanho_teste dias seguintes; as origens recuam tamanho_teste
+    dias a partir do último dia do histórico
+    
+    Args:
+        datas: Datas do histórico (dias sem linha, se houver, não deslocam os folds)
+        n_folds (int): Número máximo de folds
+        tamanho_teste (int): Dias de teste de cada fold
+        minimo_treino (int): Dias mínimos de treino do primeiro fold
+        janela_treino (int): Dias de treino de cada fold (None: expande desde o início)
+    
+    Returns:
+        list: (inicio_treino, origem, fim_teste) em datas; o treino é
+            [inicio_treino, origem) e o teste [origem, fim_teste)
+    """
+    datas = pd.to_datetime(pd.Series(datas)).dt.normalize()
+    primeira = datas.min()
+    folds = []
+    fim_teste = datas.max() + pd.Timedelta(days=1)
+    while len(folds) < n_folds:
+        origem = fim_teste - pd.Timedelta(days=tamanho_teste)
+        if (origem - primeira).days < minimo_treino:
+            break
+        inicio_treino = max(primeira, origem - pd.Timedelta(days=janela_treino)) if janela_treino else primeira
+        folds.append((inicio_treino, origem, fim_teste))
+        fim_teste = origem
+    return folds[::-1]
+
+def _periodo(df, inicio, fim):
+    return df[(df['data'] >= inicio) & (df['data'] < fim)]
+
+def _gravar_folds(df, folds, diretorio):
+    """
+    Monta e grava (.npy) as matrizes de treino normalizadas de cada fold
+    
+    O scaler de cada fold é ajustado só no treino do fold, como no treino real.
+    Do teste vão apenas os alvos e os JANELA_PREVISAO dias anteriores à origem,
+    de onde _avaliar_fold parte a previsão recursiva.
+    """
+    dados = []
+    for i, (inicio, origem, fim) in enumerate(folds):
+        treino = _periodo(df, inicio, origem)
+        teste = _periodo(df, origem, fim)
+        X_treino = treino[FEATURES_PREVISAO_VENDAS].to_numpy(dtype=np.float64)
+        scaler = StandardScaler().fit(X_treino)
+        
+        dados_fold = {
+            'media': scaler.mean_,
+            'escala': scaler.scale_,
+            'historico': _periodo(df, origem - pd.Timedelta(days=JANELA_PREVISAO), origem)
+                         [['data', 'total_vendas', 'total_pedidos']].assign(serie='total'),
+            'origem': origem,
+            'datas_teste': pd.DatetimeIndex(teste['data']),
+            'y_teste': teste['total_vendas'].to_numpy(dtype=np.float64)
+        }
+        arquivos = {
+            'X_treino': scaler.transform(X_treino).astype(np.float32),
+            'y_treino': treino['total_vendas'].to_numpy(dtype=np.float64)
+        }
+        for nome, matriz in arquivos.items():
+            dados_fold[nome] = os.path.join(diretorio, f'fold{i}_{nome}.npy')
+            np.save(dados_fold[nome], matriz)
+        dados.append(dados_fold)
+    return dados
+
+def _avaliar_fold(dados_fold, parametros):
+    """
+    Treina e avalia um candidato em um fold (executado em um processo do pool)
+    
+    Os dias de teste são previstos a partir da origem: as features de cada dia
+    usam as previsões dos dias de teste anteriores, não as vendas reais.
+    """
+    X_treino = np.load(dados_fold['X_treino'], mmap_mode='r')
+    y_treino = np.load(dados_fold['y_treino'], mmap_mode='r')
+    y_teste = dados_fold['y_teste']
+    datas_teste = dados_fold['datas_teste']
+    
+    inicio = time.perf_counter()
+    modelo = RandomForestRegressor(n_jobs=1, **parametros)
+    modelo.fit(X_treino, y_treino)
+    
+    def prever(series, X):
+        return modelo.predict(((X - dados_fold['media']) / dados_fold['escala']).astype(np.float32))
+    
+    horizonte = (datas_teste.max() - dados_fold['origem']).days + 1
+    previsao = prever_series_recursivo(dados_fold['historico'], horizonte, prever,
+                                       dados_fold['origem'] - pd.Timedelta(days=1))
+    previsto = (previsao.set_index('data')['vendas_previstas'].reindex(datas_teste)
+                .fillna(0.0).to_numpy())
+    tempo = time.perf_counter() - inicio
+    
+    return {
+        'rmse': float(np.sqrt(mean_squared_error(y_teste, previsto))),
+        'mae': float(mean_absolute_error(y_teste, previsto)),
+        'tempo_segundos': tempo
+    }
+
+def combinacoes_parametros(grade):
+    """
+    Lista de dicts com todas as combinações de uma grade {parâmetro: [valores]}
+    """
+    nomes = sorted(grade)
+    return [dict(zip(nomes, valores)) for valores in itertools.product(*(grade[n] for n in nomes))]
+
+def backtest_previsao_vendas(df, grade=None, n_folds=5, tamanho_teste=14, minimo_treino=60,
+                             janela_treino=None, max_workers=None, random_state=42):
+    """
+    Avalia cada combinação de parâmetros do RandomForest em todos os folds
+    
+    Args:
+        df (DataFrame): Saída de RDSMLIntegration.preparar_dados_previsao_vendas
+            (features FEATURES_PREVISAO_VENDAS, total_vendas e data)
+        grade (dict): Parâmetro -> valores (padrão GRADE_PARAMETROS_PADRAO)
+        max_workers (int): Processos do pool (padrão: núcleos da máquina)
+        Demais: ver gerar_folds
+    
+    Returns:
+        dict com 'folds' (períodos e erro da previsão ingênua: repetir a última
+        semana antes da origem), 'candidatos' (erro e tempo por fold, do menor
+        para o maior RMSE médio), 'melhor' (parâmetros) e 'tempo_total'; None
+        se não houver folds
+    """
+    inicio_total = time.perf_counter()
+    df = df.copy()
+    df['data'] = pd.to_datetime(df['data']).dt.normalize()
+    df = df.sort_values('data').reset_index(drop=True)
+    folds = gerar_folds(df['data'], n_folds, tamanho_teste, minimo_treino, janela_treino)
+    if not folds:
+        logger.warning(f"Histórico de {len(df)} dias insuficiente para o backtesting")
+        return None
+    
+    candidatos = [{**parametros, 'random_state': random_state}
+                  for parametros in combinacoes_parametros(grade or GRADE_PARAMETROS_PADRAO)]
+    
+    # Referência: repetir a última semana antes da origem (conhecida na origem)
+    vendas_por_data = df.set_index('data')['total_vendas']
+    info_folds = []
+    for inicio, origem, fim in folds:
+        teste = _periodo(df, origem, fim)
+        ultima_semana = (vendas_por_data.reindex(pd.date_range(end=origem - pd.Timedelta(days=1), periods=7))
+                         .fillna(0.0).to_numpy())
+        ingenuo = ultima_semana[(teste['data'] - origem).dt.days.to_numpy() % 7]
+        info_folds.append({
+            'inicio_treino': inicio.date().isoformat(),
+            'inicio_teste': origem.date().isoformat(),
+            'fim_teste': (fim - pd.Timedelta(days=1)).date().isoformat(),
+            'dias_treino': len(_periodo(df, inicio, origem)),
+            'rmse_ingenuo': float(np.sqrt(mean_squared_error(teste['total_vendas'], ingenuo)))
+        })
+    
+    diretorio = tempfile.mkdtemp(prefix='backtest-')
+    try:
+        dados = _gravar_folds(df, folds, diretorio)
+        
+        # Uma tarefa por (candidato, fold): distribui melhor a carga entre os núcleos
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                (c, f): executor.submit(_avaliar_fold, dados[f], parametros)
+                for c, parametros in enumerate(candidatos)
+                for f in range(len(folds))
+            }
+            avaliacoes = {chave: futuro.result() for chave, futuro in futuros.items()}
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    
+    resultados = []
+    for c, parametros in enumerate(candidatos):
+        por_fold = [avaliacoes[(c, f)] for f in range(len(folds))]
+        resultados.append({
+            'parametros': parametros,
+            'rmse_medio': float(np.mean([a['rmse'] for a in por_fold])),
+            'mae_medio': float(np.mean([a['mae'] for a in por_fold])),
+            'tempo_total_segundos': float(sum(a['tempo_segundos'] for a in por_fold)),
+            'por_fold': por_fold
+        })
+    resultados.sort(key=lambda r: r['rmse_medio'])
+    
+    tempo_total = time.perf_counter() - inicio_total
+    logger.info(f"Backtesting: {len(candidatos)} candidatos x {len(folds)} folds em {tempo_total:.1f}s; "
+                f"melhor RMSE médio {resultados[0]['rmse_medio']:.2f} com {resultados[0]['parametros']}")
+    return {
+        'folds': info_folds,
+        'candidatos': resultados,
+        'melhor': resultados[0]['parametros'],
+        'tempo_total': tempo_total
+    }
+
+def tabela_backtest(resultado):
+    """
+    DataFrame com uma linha por candidato e fold (RMSE, MAE e tempo de treino)
+    """
+    linhas = []
+    for candidato in resultado['candidatos']:
+        for fold, avaliacao in enumerate(candidato['por_fold']):
+            linhas.append({
+                **candidato['parametros'],
+                'fold': fold,
+                'inicio_teste': resultado['folds'][fold]['inicio_teste'],
+                'rmse_ingenuo': resultado['folds'][fold]['rmse_ingenuo'],
+                **avaliacao
+            })
+    return pd.DataFrame(linhas)
@@ -0,0 +1,296 @@
+"""
+Benchmarks de desempenho do projeto Amazon RDS
+Execute contra um banco de testes: python -m benchmarks
+"""
+
+import json
+import random
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from ..database.connection import get_db_session
+from ..database.ingestao import ingerir_ndjson, TAMANHO_LOTE_PADRAO
+from ..analytics.ml_integration import (atribuir_segmentos_rfm, _segmento_rfm, prever_series,
+                                        FEATURES_PREVISAO_VENDAS)
+from ..api.predicao_online import criar_servico_predicao
+
+# Meta de throughput da ingestão em lote (pedidos gravados por segundo)
+META_INGESTAO_PEDIDOS_POR_SEGUNDO = 1000
+
+# Metas de latência da predição online (ms)
+META_PREDICAO_P50_MS = 10
+META_PREDICAO_P99_MS = 100
+
+def _gerar_pedidos_ndjson(ids_clientes, ids_produtos, total_pedidos, itens_por_pedido):
+    """
+    Gera pedidos sintéticos em NDJSON a partir de clientes e produtos existentes
+    """
+    for _ in range(total_pedidos):
+        yield json.dumps({
+            'id_cliente': random.choice(ids_clientes),
+            'status': 'pendente',
+            'observacoes': 'benchmark',
+            'itens': [
+                {'id_produto': random.choice(ids_produtos), 'quantidade': 1}
+                for _ in range(itens_por_pedido)
+            ]
+        })
+
+def benchmark_ingestao(total_pedidos=10000, itens_por_pedido=3, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                       meta=META_INGESTAO_PEDIDOS_POR_SEGUNDO):
+    """
+    Mede o throughput de ingerir_ndjson
+    
+    Os pedidos são gravados sem commit e descartados com rollback no final,
+    então o banco não é alterado.
+    """
+    session = get_db_session()
+    try:
+        ids_clientes = [r[0] for r in session.execute(text("SELECT id_cliente FROM clientes LIMIT 1000"))]
+        ids_produtos = [r[0] for r in session.execute(
+            text("SELECT id_produto FROM produtos WHERE ativo = 1 LIMIT 1000"))]
+        if not ids_clientes or not ids_produtos:
+            print("Benchmark de ingestão requer clientes e produtos cadastrados")
+            return None
+        
+        linhas = list(_gerar_pedidos_ndjson(ids_clientes, ids_produtos, total_pedidos, itens_por_pedido))
+        
+        inicio = time.perf_counter()
+        resultados = ingerir_ndjson(session, linhas, tamanho_lote, commit=False)
+        tempo = time.perf_counter() - inicio
+    finally:
+        session.rollback()
+        session.close()
+    
+    sucesso = sum(1 for r in resultados if r['status'] == 'ok')
+    throughput = sucesso / tempo if tempo > 0 else 0
+    
+    resultado = {
+        'total_pedidos': total_pedidos,
+        'itens_por_pedido': itens_por_pedido,
+        'tamanho_lote': tamanho_lote,
+        'sucesso': sucesso,
+        'tempo_segundos': tempo,
+        'pedidos_por_segundo': throughput,
+        'meta_pedidos_por_segundo': meta,
+        'meta_atingida': throughput >= meta
+    }
+    
+    print(f"Ingestão: {sucesso}/{total_pedidos} pedidos em {tempo:.2f}s "
+          f"({throughput:.0f} pedidos/s, meta {meta}) - "
+          f"{'OK' if resultado['meta_atingida'] else 'ABAIXO DA META'}")
+    return resultado
+
+def _segmentar_rfm_linha_a_linha(df):
+    """
+    Implementação anterior da segmentação RFM (string RFM_score + apply por linha),
+    mantida como referência de desempenho e de resultado
+    """
+    df['R_score'] = pd.qcut(df['dias_desde_ultimo_pedido'], 5, labels=[5, 4, 3, 2, 1]).astype(int)
+    df['F_score'] = pd.qcut(df['total_pedidos'].rank(method='first'), 5, labels=[1, 2, 3, 4, 5]).astype(int)
+    df['M_score'] = pd.qcut(df['valor_total_gasto'], 5, labels=[1, 2, 3, 4, 5]).astype(int)
+    df['RFM_score'] = df['R_score'].astype(str) + df['F_score'].astype(str) + df['M_score'].astype(str)
+    
+    def definir_segmento(row):
+        score = row['RFM_score']
+        return _segmento_rfm(int(score[0]), int(score[1]), int(score[2]))
+    
+    df['segmento'] = df.apply(definir_segmento, axis=1)
+    return df
+
+def benchmark_segmentacao_rfm(total_clientes=1000000, semente=42):
+    """
+    Compara a segmentação RFM vetorizada com a implementação linha a linha
+    
+    Usa clientes sintéticos (não acessa o banco) e verifica que scores e
+    segmentos são idênticos nas duas versões.
+    """
+    rng = np.random.default_rng(semente)
+    base = pd.DataFrame({
+        'dias_desde_ultimo_pedido': rng.integers(0, 720, total_clientes),
+        'total_pedidos': rng.poisson(4, total_clientes),
+        'valor_total_gasto': rng.gamma(2.0, 250.0, total_clientes).round(2)
+    })
+    
+    inicio = time.perf_counter()
+    legado = _segmentar_rfm_linha_a_linha(base.copy())
+    tempo_legado = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    vetorizado = atribuir_segmentos_rfm(base.copy())
+    tempo_vetorizado = time.perf_counter() - inicio
+    
+    identico = (
+        (legado['RFM_score'] == vetorizado['RFM_score']).all() and
+        (legado['segmento'] == vetorizado['segmento'].astype(str)).all()
+    )
+    aceleracao = tempo_legado / tempo_vetorizado if tempo_vetorizado > 0 else float('inf')
+    
+    resultado = {
+        'total_clientes': total_clientes,
+        'tempo_linha_a_linha_segundos': tempo_legado,
+        'tempo_vetorizado_segundos': tempo_vetorizado,
+        'aceleracao': aceleracao,
+        'resultado_identico': bool(identico)
+    }
+    
+    print(f"Segmentação RFM ({total_clientes} clientes): linha a linha {tempo_legado:.2f}s, "
+          f"vetorizada {tempo_vetorizado:.3f}s ({aceleracao:.0f}x) - "
+          f"{'resultado idêntico' if identico else 'RESULTADO DIFERENTE'}")
+    return resultado
+
+def _prever_serie_linha_a_linha(modelo, scaler, df, horizonte):
+    """
+    Caminho anterior a prever_series (o laço de prever_vendas_futuras), aplicado
+    a uma série: features montadas a partir da última linha do DataFrame e uma
+    chamada de scaler.transform/model.predict por dia à frente
+    """
+    df = df.sort_values('data').reset_index(drop=True)
+    ultima_linha = df.iloc[-1].copy()
+    previsoes = []
+    
+    for i in range(horizonte):
+        data_futura = ultima_linha['data'] + timedelta(days=i+1)
+        features_futuras = {
+            'dia_semana': data_futura.dayofweek,
+            'dia_mes': data_futura.day,
+            'mes': data_futura.month,
+            'trimestre': (data_futura.month - 1) // 3 + 1,
+            'semana_ano': data_futura.isocalendar()[1],
+            'vendas_lag_1': ultima_linha['total_vendas'],
+            'vendas_lag_7': df.iloc[-7]['total_vendas'] if len(df) >= 7 else ultima_linha['total_vendas'],
+            'pedidos_lag_1': ultima_linha['total_pedidos'],
+            'ticket_lag_1': ultima_linha['ticket_medio'],
+            'media_movel_7': df['total_vendas'].tail(7).mean(),
+            'media_movel_14': df['total_vendas'].tail(14).mean()
+        }
+        
+        X_pred = np.array([[features_futuras[f] for f in FEATURES_PREVISAO_VENDAS]])
+        vendas_previstas = modelo.predict(scaler.transform(X_pred))[0]
+        previsoes.append(float(max(0, vendas_previstas)))
+        ultima_linha['total_vendas'] = vendas_previstas
+    
+    return previsoes
+
+def benchmark_previsao_series(total_series=5000, horizonte=14, dias_historico=60, amostra_linha_a_linha=50,
+                              semente=42):
+    """
+    Mede prever_series (lote por dia à frente) contra o caminho anterior: o laço
+    de prever_vendas_futuras rodado série a série (_prever_serie_linha_a_linha),
+    extrapolado a partir de uma amostra
+    
+    Usa séries e modelo sintéticos (não acessa o banco).
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+    
+    rng = np.random.default_rng(semente)
+    datas = pd.date_range(end=pd.Timestamp.today().normalize(), periods=dias_historico, freq='D')
+    historico = pd.DataFrame({
+        'serie': np.repeat(np.arange(total_series), dias_historico),
+        'data': np.tile(datas, total_series),
+        'total_vendas': rng.gamma(2.0, 500.0, total_series * dias_historico),
+        'total_pedidos': rng.poisson(10, total_series * dias_historico),
+    })
+    historico['ticket_medio'] = historico['total_vendas'] / historico['total_pedidos'].clip(lower=1)
+    
+    X = rng.random((2000, len(FEATURES_PREVISAO_VENDAS)))
+    scaler = StandardScaler().fit(X)
+    modelo = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=semente, n_jobs=-1)
+    modelo.fit(scaler.transform(X), rng.random(2000))
+    
+    inicio = time.perf_counter()
+    prever_series(modelo, scaler, historico, horizonte)
+    tempo_lote = time.perf_counter() - inicio
+    
+    amostra = historico[historico['serie'] < amostra_linha_a_linha]
+    inicio = time.perf_counter()
+    for _, serie in amostra.groupby('serie'):
+        _prever_serie_linha_a_linha(modelo, scaler, serie, horizonte)
+    tempo_amostra = time.perf_counter() - inicio
+    tempo_linha_a_linha = tempo_amostra / amostra_linha_a_linha * total_series
+    
+    resultado = {
+        'total_series': total_series,
+        'horizonte': horizonte,
+        'tempo_lote_segundos': tempo_lote,
+        'tempo_linha_a_linha_estimado_segundos': tempo_linha_a_linha,
+        'aceleracao': tempo_linha_a_linha / tempo_lote if tempo_lote > 0 else float('inf')
+    }
+    
+    print(f"Previsão de {total_series} séries x {horizonte} dias: lote {tempo_lote:.2f}s, "
+          f"caminho anterior (série a série) ~{tempo_linha_a_linha:.0f}s (estimado)")
+    return resultado
+
+def benchmark_predicao_online(total_requisicoes=5000, concorrencia=32, meta_p50_ms=META_PREDICAO_P50_MS,
+                              meta_p99_ms=META_PREDICAO_P99_MS, semente=42):
+    """
+    Mede a latência (p50/p99) de previsões e segmentos servidos pelo
+    ServicoPredicaoML com requisições concorrentes
+    
+    Requer modelos publicados no registro (RDSMLIntegration.salvar_modelos) e
+    clientes cadastrados. Metade das requisições pede a previsão de 7 dias e
+    metade o segmento de um cliente sorteado (com repetição, como na API).
+    """
+    servico = criar_servico_predicao()
+    if not servico.carregar() or not servico.pronto:
+        print("Benchmark de predição online requer modelos publicados no registro")
+        return None
+    
+    session = get_db_session(readonly=True)
+    try:
+        ids_clientes = [r[0] for r in session.execute(text("SELECT id_cliente FROM clientes WHERE ativo = 1 LIMIT 10000"))]
+    finally:
+        session.close()
+    if not ids_clientes:
+        print("Benchmark de predição online requer clientes cadastrados")
+        return None
+    
+    gerador = random.Random(semente)
+    requisicoes = [('previsao', None) if i % 2 else ('segmento', gerador.choice(ids_clientes))
+                   for i in range(total_requisicoes)]
+    
+    def requisitar(requisicao):
+        tipo, id_cliente = requisicao
+        inicio = time.perf_counter()
+        if tipo == 'previsao':
+            servico.prever_vendas(7)
+        else:
+            servico.segmento_cliente(id_cliente)
+        return tipo, (time.perf_counter() - inicio) * 1000
+    
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        latencias = list(executor.map(requisitar, requisicoes))
+    tempo = time.perf_counter() - inicio
+    
+    resultado = {
+        'total_requisicoes': total_requisicoes,
+        'concorrencia': concorrencia,
+        'requisicoes_por_segundo': total_requisicoes / tempo if tempo > 0 else 0,
+        'meta_p50_ms': meta_p50_ms,
+        'meta_p99_ms': meta_p99_ms,
+        'servico': servico.estatisticas()
+    }
+    meta_atingida = True
+    for tipo in ('previsao', 'segmento'):
+        valores = np.array([ms for t, ms in latencias if t == tipo])
+        p50, p99 = np.percentile(valores, [50, 99])
+        resultado[tipo] = {'p50_ms': float(p50), 'p99_ms': float(p99)}
+        meta_atingida = meta_atingida and p50 <= meta_p50_ms and p99 <= meta_p99_ms
+        print(f"Predição online ({tipo}): p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    resultado['meta_atingida'] = bool(meta_atingida)
+    
+    print(f"Predição online: {total_requisicoes} requisições com concorrência {concorrencia} em {tempo:.2f}s "
+          f"(meta p50 {meta_p50_ms} ms / p99 {meta_p99_ms} ms) - "
+          f"{'OK' if meta_atingida else 'ACIMA DA META'}")
+    return resultado
+
+if __name__ == "__main__":
+    benchmark_ingestao()
+    benchmark_segmentacao_rfm()
+    benchmark_previsao_series()
+    benchmark_predicao_online()
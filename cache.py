@@ -0,0 +1,301 @@
+"""
+Cache de respostas para os endpoints de analytics
+Cache em memória (LRU com TTL) por processo, com backend compartilhado opcional
+compatível com Redis, coalescência de requisições e invalidação por geração
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FuturoTimeoutError
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+class CacheLRU:
+    """
+    Cache em memória com política LRU e expiração por TTL (thread-safe)
+    """
+    
+    def __init__(self, max_itens=256):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obter(self, chave):
+        """
+        Retorna o valor da chave ou None se não existir ou tiver expirado
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            
+            valor, expira_em = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            
+            self._itens.move_to_end(chave)
+            return valor
+    
+    def definir(self, chave, valor, ttl):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+    
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+class CacheRedis:
+    """
+    Backend compartilhado entre processos/workers
+    
+    Aceita qualquer cliente compatível com Redis (redis-py, fakeredis, KeyDB,
+    Valkey...) que implemente get, pttl, set (com nx/px), incr e delete.
+    """
+    
+    def __init__(self, cliente, prefixo='rds-cache:'):
+        self.cliente = cliente
+        self.prefixo = prefixo
+    
+    def obter(self, chave):
+        valor = self.cliente.get(self.prefixo + chave)
+        return json.loads(valor) if valor is not None else None
+    
+    def obter_com_ttl(self, chave):
+        """
+        Retorna (valor, segundos até expirar); o tempo é None se a chave não
+        tiver expiração
+        """
+        valor = self.obter(chave)
+        if valor is None:
+            return None, None
+        restante_ms = self.cliente.pttl(self.prefixo + chave)
+        return valor, (restante_ms / 1000 if restante_ms is not None and restante_ms >= 0 else None)
+    
+    def definir(self, chave, valor, ttl):
+        self.cliente.set(self.prefixo + chave, json.dumps(valor, default=str), px=int(ttl * 1000))
+    
+    def adquirir_lock(self, chave, ttl):
+        return bool(self.cliente.set(self.prefixo + 'lock:' + chave, '1', nx=True, px=int(ttl * 1000)))
+    
+    def liberar_lock(self, chave):
+        self.cliente.delete(self.prefixo + 'lock:' + chave)
+    
+    def geracao(self):
+        return int(self.cliente.get(self.prefixo + 'geracao') or 0)
+    
+    def nova_geracao(self):
+        return self.cliente.incr(self.prefixo + 'geracao')
+
+class CacheRespostas:
+    """
+    Cache de respostas em dois níveis
+    
+    - Nível 1: CacheLRU do processo
+    - Nível 2 (opcional): CacheRedis compartilhado entre os workers
+    
+    Quando uma chave expira, apenas uma requisição recalcula o valor (no processo,
+    por Future; entre processos, por lock no backend compartilhado) e as demais
+    aguardam o resultado. Se o cálculo falhar, as requisições que aguardavam
+    recebem o mesmo erro em vez de recalcular cada uma. invalidar() incrementa a
+    geração que faz parte de todas as chaves, descartando de uma vez tudo o que
+    foi calculado antes.
+    
+    Um valor lido do backend compartilhado entra no cache local só pelo tempo
+    que ainda lhe resta lá, então os workers não o servem além do ttl original.
+    
+    A geração compartilhada é relida do backend no máximo a cada ttl_geracao
+    segundos (não a cada requisição); a invalidação feita por outro processo é
+    vista por este em até ttl_geracao segundos.
+    """
+    
+    def __init__(self, ttl=5, local=None, compartilhado=None, espera_maxima=30, ttl_geracao=1):
+        self.ttl = ttl
+        self.local = local or CacheLRU()
+        self.compartilhado = compartilhado
+        self.espera_maxima = espera_maxima
+        self.ttl_geracao = ttl_geracao
+        self._geracao_local = 0
+        self._geracao_compartilhada = None
+        self._geracao_lida_em = 0.0
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self._lock_contadores = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _chamar_compartilhado(self, metodo, *args, padrao=None):
+        """
+        Chama o backend compartilhado; em caso de falha segue só com o cache local
+        """
+        if self.compartilhado is None:
+            return padrao
+        try:
+            return getattr(self.compartilhado, metodo)(*args)
+        except Exception as e:
+            logger.warning(f"Falha no cache compartilhado ({metodo}): {str(e)}")
+            return padrao
+    
+    def _geracao(self):
+        if self.compartilhado is None:
+            return self._geracao_local
+        agora = time.monotonic()
+        if self._geracao_compartilhada is None or agora - self._geracao_lida_em > self.ttl_geracao:
+            self._geracao_compartilhada = self._chamar_compartilhado('geracao', padrao=self._geracao_local)
+            self._geracao_lida_em = agora
+        return self._geracao_compartilhada
+    
+    def _chave(self, chave):
+        return f"{chave}:g{self._geracao()}"
+    
+    def _contar(self, hit):
+        with self._lock_contadores:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def _buscar(self, chave_completa):
+        valor = self.local.obter(chave_completa)
+        if valor is None:
+            valor, restante = self._chamar_compartilhado('obter_com_ttl', chave_completa,
+                                                         padrao=(None, None))
+            if valor is not None:
+                ttl = self.ttl if restante is None else min(self.ttl, restante)
+                if ttl > 0:
+                    self.local.definir(chave_completa, valor, ttl)
+        return valor
+    
+    def _aguardar_compartilhado(self, chave_completa):
+        """
+        Aguarda outro processo calcular o valor (até espera_maxima segundos)
+        """
+        limite = time.monotonic() + self.espera_maxima
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            valor = self._buscar(chave_completa)
+            if valor is not None:
+                return valor
+        return None
+    
+    def obter_ou_calcular(self, chave, funcao):
+        """
+        Retorna o valor em cache ou calcula com funcao()
+        
+        Returns:
+            tuple: (valor, cache_hit)
+        """
+        chave_completa = self._chave(chave)
+        
+        valor = self._buscar(chave_completa)
+        if valor is not None:
+            self._contar(True)
+            return valor, True
+        
+        # Coalescência no processo: só a primeira thread calcula; as demais
+        # recebem o valor (ou o erro) dela pelo Future
+        with self._lock:
+            futuro = self._em_andamento.get(chave_completa)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_andamento[chave_completa] = futuro
+        
+        if not lider:
+            try:
+                valor = futuro.result(self.espera_maxima)
+            except FuturoTimeoutError:
+                raise TimeoutError(f"Cálculo de {chave} excedeu {self.espera_maxima}s") from None
+            self._contar(True)
+            return valor, True
+        
+        lock_compartilhado = False
+        try:
+            # Coalescência entre processos: quem não obtém o lock aguarda o valor
+            if self.compartilhado is not None:
+                lock_compartilhado = self._chamar_compartilhado(
+                    'adquirir_lock', chave_completa, self.espera_maxima, padrao=True)
+                if not lock_compartilhado:
+                    valor = self._aguardar_compartilhado(chave_completa)
+                    if valor is not None:
+                        self._contar(True)
+                        futuro.set_result(valor)
+                        return valor, True
+            
+            self._contar(False)
+            valor = funcao()
+            self.local.definir(chave_completa, valor, self.ttl)
+            self._chamar_compartilhado('definir', chave_completa, valor, self.ttl)
+            futuro.set_result(valor)
+            return valor, False
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            if lock_compartilhado:
+                self._chamar_compartilhado('liberar_lock', chave_completa)
+            with self._lock:
+                self._em_andamento.pop(chave_completa, None)
+    
+    def invalidar(self):
+        """
+        Descarta todas as respostas em cache (ex.: após gravar pedidos)
+        
+        Sem backend compartilhado, os outros processos só enxergam a invalidação
+        quando suas entradas expiram (no máximo ttl segundos).
+        """
+        self._geracao_local += 1
+        self.local.limpar()
+        geracao = self._chamar_compartilhado('nova_geracao')
+        # A geração nova vale de imediato neste processo
+        self._geracao_compartilhada = geracao if geracao is not None else self._geracao_local
+        self._geracao_lida_em = time.monotonic()
+    
+    def estatisticas(self):
+        with self._lock_contadores:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'taxa_hit': hits / total if total else 0.0,
+            'backend_compartilhado': self.compartilhado is not None
+        }
+
+def criar_cache_respostas(ttl=None, redis_url=None, max_itens=None):
+    """
+    Cria o cache de respostas a partir de variáveis de ambiente
+    
+    Variáveis:
+        ANALYTICS_CACHE_TTL: TTL em segundos (padrão 5)
+        ANALYTICS_CACHE_MAX_ITENS: Itens no cache local (padrão 256)
+        ANALYTICS_CACHE_TTL_GERACAO: Segundos entre leituras da geração no backend
+            compartilhado (padrão 1)
+        REDIS_URL: Backend compartilhado (ex.: redis://localhost:6379/0); sem ele,
+            apenas o cache local é usado
+    """
+    ttl = ttl if ttl is not None else float(os.getenv('ANALYTICS_CACHE_TTL', 5))
+    max_itens = max_itens or int(os.getenv('ANALYTICS_CACHE_MAX_ITENS', 256))
+    redis_url = redis_url or os.getenv('REDIS_URL')
+    
+    compartilhado = None
+    if redis_url:
+        if redis is None:
+            logger.warning("REDIS_URL definido mas o pacote redis não está instalado; usando apenas cache local")
+        else:
+            compartilhado = CacheRedis(redis.Redis.from_url(redis_url))
+    
+    return CacheRespostas(ttl=ttl, local=CacheLRU(max_itens), compartilhado=compartilhado,
+                          ttl_geracao=float(os.getenv('ANALYTICS_CACHE_TTL_GERACAO', 1)))
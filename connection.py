@@ -4,8 +4,15 @@ Este módulo gerencia a conexão com o banco de dados MySQL no Amazon RDS
 """
 
 import os
-from sqlalchemy import create_engine, text
+import time
+import random
+import socket
+import asyncio
+import threading
+from collections import deque
+from sqlalchemy import create_engine, text, exc
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 import logging
 
@@ -16,16 +23,242 @@ logger = logging.getLogger(__name__)
 # Base para os modelos SQLAlchemy
 Base = declarative_base()
 
+def opcoes_pool(**overrides):
+    """
+    Opções de pool de conexões para create_engine, lidas de variáveis de ambiente
+    
+    Cada processo (ex.: worker do gunicorn) tem seu próprio pool, então o total de
+    conexões no RDS chega a workers * (pool_size + max_overflow).
+    
+    Variáveis:
+        RDS_POOL_SIZE: Conexões mantidas abertas no pool (padrão 5)
+        RDS_POOL_MAX_OVERFLOW: Conexões extras permitidas em picos (padrão 10)
+        RDS_POOL_TIMEOUT: Segundos de espera por uma conexão livre (padrão 30)
+        RDS_POOL_RECYCLE: Segundos até reciclar uma conexão (padrão 3600)
+        RDS_POOL_USE_LIFO: 'true' para reutilizar a conexão mais recente (LIFO),
+            deixando as ociosas expirarem; padrão FIFO
+    """
+    opcoes = {
+        'pool_size': int(os.getenv('RDS_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('RDS_POOL_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('RDS_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('RDS_POOL_RECYCLE', 3600)),
+        'pool_use_lifo': os.getenv('RDS_POOL_USE_LIFO', 'false').lower() in ('1', 'true', 'yes'),
+        'pool_pre_ping': True
+    }
+    opcoes.update(overrides)
+    return opcoes
+
+class MetricasPool:
+    """
+    Métricas de uso de um pool de conexões (thread-safe)
+    """
+    
+    def __init__(self, amostras=1000):
+        self._lock = threading.Lock()
+        self._esperas = deque(maxlen=amostras)
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.conexoes_criadas = 0
+        self.tempo_espera_total = 0.0
+        self.tempo_espera_max = 0.0
+        self.tempo_conexao_total = 0.0
+    
+    def registrar_checkout(self, espera):
+        with self._lock:
+            self.checkouts += 1
+            self.tempo_espera_total += espera
+            self.tempo_espera_max = max(self.tempo_espera_max, espera)
+            self._esperas.append(espera)
+    
+    def registrar_checkin(self):
+        with self._lock:
+            self.checkins += 1
+    
+    def registrar_timeout(self, espera):
+        with self._lock:
+            self.timeouts += 1
+            self._esperas.append(espera)
+    
+    def registrar_conexao(self, tempo):
+        with self._lock:
+            self.conexoes_criadas += 1
+            self.tempo_conexao_total += tempo
+    
+    def snapshot(self, pool=None):
+        """
+        Retorna as métricas atuais; com o pool, inclui conexões em uso e ociosas
+        """
+        with self._lock:
+            esperas = sorted(self._esperas)
+            dados = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'timeouts': self.timeouts,
+                'conexoes_criadas': self.conexoes_criadas,
+                'espera_media_ms': self.tempo_espera_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'espera_max_ms': self.tempo_espera_max * 1000,
+                'conexao_media_ms': (self.tempo_conexao_total / self.conexoes_criadas * 1000
+                                     if self.conexoes_criadas else 0.0)
+            }
+        
+        for percentil in (50, 95, 99):
+            indice = min(len(esperas) - 1, int(len(esperas) * percentil / 100))
+            dados[f'espera_p{percentil}_ms'] = esperas[indice] * 1000 if esperas else 0.0
+        
+        if pool is not None:
+            em_uso = pool.checkedout()
+            ociosas = pool.checkedin()
+            dados.update({
+                'tamanho_pool': pool.size(),
+                'em_uso': em_uso,
+                'ociosas': ociosas,
+                'overflow': pool.overflow(),
+                'conexoes_encerradas': max(0, dados['conexoes_criadas'] - em_uso - ociosas)
+            })
+        return dados
+
+class PoolInstrumentado(QueuePool):
+    """
+    QueuePool que registra tempo de espera no checkout, timeouts e criação de conexões
+    """
+    
+    def __init__(self, creator, metricas=None, **kw):
+        super().__init__(creator, **kw)
+        self.metricas = metricas or MetricasPool()
+    
+    def recreate(self):
+        # dispose() recria o pool; as métricas continuam acumulando
+        novo = super().recreate()
+        novo.metricas = self.metricas
+        return novo
+    
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super()._do_get()
+        except exc.TimeoutError:
+            self.metricas.registrar_timeout(time.perf_counter() - inicio)
+            raise
+        self.metricas.registrar_checkout(time.perf_counter() - inicio)
+        return conexao
+    
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self.metricas.registrar_checkin()
+    
+    def _create_connection(self):
+        inicio = time.perf_counter()
+        record = super()._create_connection()
+        self.metricas.registrar_conexao(time.perf_counter() - inicio)
+        return record
+
+def metricas_engine(engine):
+    """
+    Retorna as métricas do pool de um engine (None se o pool não for instrumentado)
+    """
+    metricas = getattr(engine.pool, 'metricas', None)
+    return metricas.snapshot(engine.pool) if metricas else None
+
+# Erros MySQL tratados como transitórios (falhas de conexão, failover, locks)
+ERROS_TRANSITORIOS = {
+    1205: 'lock',             # Lock wait timeout exceeded
+    1213: 'lock',             # Deadlock found when trying to get lock
+    1290: 'somente_leitura',  # --read-only: instância rebaixada após failover
+    1836: 'somente_leitura',  # Running in read-only mode
+    2003: 'conexao',          # Can't connect to MySQL server
+    2006: 'conexao',          # MySQL server has gone away
+    2013: 'conexao',          # Lost connection to MySQL server during query
+    2055: 'conexao'           # Lost connection to MySQL server (system error)
+}
+
+# Categorias em que a transação certamente não foi efetivada, então até
+# operações de escrita podem ser repetidas com segurança
+CATEGORIAS_REPETIVEIS_ESCRITA = ('lock', 'somente_leitura')
+
+def classificar_erro(erro):
+    """
+    Classifica um erro de banco de dados
+    
+    Qualquer sqlalchemy.exc.DBAPIError cujo erro original tenha como primeiro
+    argumento um dos códigos de ERROS_TRANSITORIOS é tratado como transitório,
+    o que permite simular falhas com um banco falso que levanta OperationalError.
+    
+    Returns:
+        str: 'conexao', 'lock' ou 'somente_leitura'; None se o erro não for transitório
+    """
+    if not isinstance(erro, exc.DBAPIError):
+        return None
+    if erro.connection_invalidated:
+        return 'conexao'
+    
+    args = getattr(erro.orig, 'args', ())
+    if args and isinstance(args[0], int):
+        return ERROS_TRANSITORIOS.get(args[0])
+    return None
+
+class ReplicaLeitura:
+    """
+    Réplica de leitura gerenciada pelo RDSConnection
+    """
+    
+    def __init__(self, host, engine, session_factory=None):
+        self.host = host
+        self.engine = engine
+        self.session_factory = session_factory or sessionmaker(bind=engine)
+        self.saudavel = True
+        self.lag_segundos = None
+        self.ultimo_erro = None
+    
+    def __repr__(self):
+        return f"<ReplicaLeitura(host='{self.host}', saudavel={self.saudavel}, lag={self.lag_segundos})>"
+
 class RDSConnection:
     """
     Classe para gerenciar conexões com Amazon RDS
+    
+    Mantém um engine para a instância principal (writer) e, opcionalmente,
+    engines para réplicas de leitura. Sessões somente leitura são distribuídas
+    entre as réplicas saudáveis; sem réplicas disponíveis, usam o writer.
     """
     
     def __init__(self):
         self.engine = None
         self.session_factory = None
+        self.replicas = []
+        self.pool_options = {}
+        self.max_replica_lag = float(os.getenv('RDS_MAX_REPLICA_LAG', 30))
+        self.intervalo_health_check = float(os.getenv('RDS_HEALTH_CHECK_INTERVAL', 10))
+        self.host = None
+        self.port = None
+        self.retry_tentativas = int(os.getenv('RDS_RETRY_TENTATIVAS', 3))
+        self.retry_espera_base = float(os.getenv('RDS_RETRY_ESPERA_BASE', 0.1))
+        self.retry_espera_max = float(os.getenv('RDS_RETRY_ESPERA_MAX', 5))
+        self._ips_writer = None
+        self._ultimo_failover = 0.0
+        self._lock_failover = threading.Lock()
+        self._proxima_replica = 0
+        self._lock_replicas = threading.Lock()
+        self._parar_monitor = threading.Event()
+        self._monitor = None
+    
+    def _criar_engine(self, host, port, database, username, password):
+        """
+        Cria um engine SQLAlchemy para um host do RDS
+        """
+        # String de conexão para MySQL
+        connection_string = f"mysql+pymysql://{username}:{password}@{host}:{port}/{database}"
         
-    def create_connection(self, host, port, database, username, password):
+        return create_engine(
+            connection_string,
+            poolclass=PoolInstrumentado,
+            echo=False,          # Set True para debug SQL
+            **opcoes_pool(**self.pool_options)
+        )
+    
+    def create_connection(self, host, port, database, username, password,
+                          read_replicas=None, max_replica_lag=None, pool_options=None):
         """
         Cria uma conexão com o Amazon RDS
         
@@ -35,37 +268,267 @@ class RDSConnection:
             database (str): Nome do banco de dados
             username (str): Nome do usuário
             password (str): Senha do usuário
+            read_replicas (list): Endpoints das réplicas de leitura (padrão: variável
+                de ambiente RDS_READ_REPLICAS, separada por vírgulas)
+            max_replica_lag (float): Atraso máximo de replicação, em segundos, para
+                uma réplica receber leituras
+            pool_options (dict): Sobrescreve as opções de pool de opcoes_pool()
+                (ex.: {'pool_size': 10, 'pool_use_lifo': True})
         """
         try:
-            # String de conexão para MySQL
-            connection_string = f"mysql+pymysql://{username}:{password}@{host}:{port}/{database}"
+            self.pool_options = pool_options or {}
+            self.host = host
+            self.port = port
+            self._ips_writer = self._resolver_endpoint()
             
             # Criar engine SQLAlchemy
-            self.engine = create_engine(
-                connection_string,
-                pool_pre_ping=True,  # Verifica conexões antes de usar
-                pool_recycle=3600,   # Recicla conexões a cada hora
-                echo=False           # Set True para debug SQL
-            )
+            self.engine = self._criar_engine(host, port, database, username, password)
             
             # Criar factory de sessões
             self.session_factory = sessionmaker(bind=self.engine)
             
-            logger.info(f"Conexão estabelecida com sucesso: {host}:{port}/{database}")
-            return True
+            if read_replicas is None:
+                read_replicas = [h.strip() for h in os.getenv('RDS_READ_REPLICAS', '').split(',') if h.strip()]
+            if max_replica_lag is not None:
+                self.max_replica_lag = max_replica_lag
+            
+            self.replicas = [
+                ReplicaLeitura(replica, self._criar_engine(replica, port, database, username, password))
+                for replica in read_replicas
+            ]
+            
+            if self.replicas:
+                # As réplicas entram na rotação sem verificação; o primeiro health
+                # check roda na thread do monitor, sem atrasar a inicialização
+                self._iniciar_monitor_replicas()
             
+            logger.info(f"Conexão estabelecida com sucesso: {host}:{port}/{database} "
+                        f"({len(self.replicas)} réplicas de leitura)")
+            return True
+        
         except Exception as e:
             logger.error(f"Erro ao conectar com o RDS: {str(e)}")
             return False
     
-    def get_session(self):
+    def get_session(self, readonly=False):
         """
         Retorna uma nova sessão do banco de dados
+        
+        Args:
+            readonly (bool): Sessão apenas para leitura; é roteada para uma réplica
+                saudável quando houver, senão para o writer
         """
-        if self.session_factory:
-            return self.session_factory()
-        else:
+        if not self.session_factory:
             raise Exception("Conexão não estabelecida. Execute create_connection() primeiro.")
+        
+        if readonly:
+            replica = self._escolher_replica()
+            if replica:
+                return replica.session_factory()
+        
+        return self.session_factory()
+    
+    def _escolher_replica(self):
+        """
+        Escolhe uma réplica saudável em round-robin
+        """
+        saudaveis = [r for r in self.replicas if r.saudavel]
+        if not saudaveis:
+            return None
+        
+        with self._lock_replicas:
+            replica = saudaveis[self._proxima_replica % len(saudaveis)]
+            self._proxima_replica += 1
+        return replica
+    
+    def _medir_lag(self, connection):
+        """
+        Retorna o atraso de replicação em segundos (None se não for possível medir)
+        """
+        for comando, coluna in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                                ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                status = connection.execute(text(comando)).mappings().first()
+            except Exception:
+                continue
+            if status is None:
+                # Não é uma réplica MySQL tradicional (ex.: leitor Aurora)
+                return None
+            lag = status.get(coluna)
+            # NULL indica replicação parada
+            return float(lag) if lag is not None else float('inf')
+        return None
+    
+    def verificar_replicas(self):
+        """
+        Executa o health check das réplicas, removendo da rotação as que não
+        respondem ou estão atrasadas além de max_replica_lag
+        """
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                    lag = self._medir_lag(connection)
+                self._atualizar_saude(replica, lag)
+            except Exception as e:
+                self._atualizar_saude(replica, None, erro=str(e))
+        
+        return self.status_replicas()
+    
+    def _atualizar_saude(self, replica, lag, erro=None):
+        """
+        Atualiza o estado de uma réplica após o health check
+        """
+        replica.lag_segundos = lag
+        if erro is None and lag is not None and lag > self.max_replica_lag:
+            erro = f"lag de {lag}s"
+        saudavel = erro is None
+        replica.ultimo_erro = erro
+        
+        if saudavel != replica.saudavel:
+            if saudavel:
+                logger.info(f"Réplica {replica.host} de volta à rotação")
+            else:
+                logger.warning(f"Réplica {replica.host} removida da rotação: {erro}")
+        replica.saudavel = saudavel
+    
+    def status_replicas(self):
+        """
+        Retorna o estado atual das réplicas de leitura
+        """
+        return [{
+            'host': r.host,
+            'saudavel': r.saudavel,
+            'lag_segundos': r.lag_segundos,
+            'ultimo_erro': r.ultimo_erro
+        } for r in self.replicas]
+    
+    def executar_com_retry(self, operacao, readonly=True, idempotente=None, tentativas=None,
+                           manter_sessao=False):
+        """
+        Executa operacao(session) repetindo em falhas transitórias
+        
+        Cada tentativa usa uma sessão nova; entre tentativas há backoff exponencial
+        com jitter. Em perda de conexão ou failover, o endpoint é re-resolvido e o
+        pool é drenado antes da próxima tentativa (ver tratar_failover).
+        
+        Args:
+            operacao (callable): Recebe a sessão e retorna o resultado; se escrever,
+                deve fazer o próprio commit
+            readonly (bool): Usa uma sessão de leitura (réplica, quando disponível)
+            idempotente (bool): Se a operação pode ser repetida após qualquer falha
+                transitória (padrão: igual a readonly). Operações não idempotentes só
+                são repetidas quando a transação certamente não foi efetivada
+                (deadlock, lock timeout, instância somente leitura)
+            tentativas (int): Número máximo de tentativas (padrão RDS_RETRY_TENTATIVAS)
+            manter_sessao (bool): Não fecha a sessão da tentativa bem-sucedida e
+                retorna (session, resultado); o chamador fecha a sessão (ex.: leitura
+                em streaming, em que só a execução inicial é repetida)
+        """
+        if idempotente is None:
+            idempotente = readonly
+        tentativas = tentativas or self.retry_tentativas
+        
+        for tentativa in range(1, tentativas + 1):
+            session = self.get_session(readonly=readonly)
+            sucesso = False
+            try:
+                resultado = operacao(session)
+                sucesso = True
+                return (session, resultado) if manter_sessao else resultado
+            except exc.DBAPIError as e:
+                try:
+                    session.rollback()
+                except Exception:
+                    pass
+                
+                categoria = classificar_erro(e)
+                repetivel = categoria is not None and (
+                    idempotente or categoria in CATEGORIAS_REPETIVEIS_ESCRITA
+                )
+                if not repetivel or tentativa == tentativas:
+                    raise
+                
+                if categoria in ('conexao', 'somente_leitura'):
+                    self.tratar_failover(session.get_bind(), e)
+                
+                # Backoff exponencial com "full jitter"
+                espera = random.uniform(0, min(self.retry_espera_max,
+                                               self.retry_espera_base * 2 ** (tentativa - 1)))
+                logger.warning(f"Erro transitório ({categoria}), tentativa {tentativa}/{tentativas}; "
+                               f"nova tentativa em {espera:.2f}s: {str(e.orig)}")
+                time.sleep(espera)
+            finally:
+                if not (sucesso and manter_sessao):
+                    session.close()
+    
+    def _resolver_endpoint(self):
+        """
+        Resolve o endpoint do writer (os IPs mudam após um failover Multi-AZ)
+        """
+        if not self.host:
+            return None
+        try:
+            return sorted({info[4][0] for info in socket.getaddrinfo(self.host, self.port,
+                                                                     proto=socket.IPPROTO_TCP)})
+        except OSError as e:
+            logger.warning(f"Falha ao resolver {self.host}: {str(e)}")
+            return None
+    
+    def tratar_failover(self, engine, erro=None):
+        """
+        Reage a uma perda de conexão ou failover no engine informado
+        
+        Uma réplica com falha sai da rotação até o próximo health check. Para o
+        writer, o endpoint é re-resolvido e o pool é descartado, para que as
+        próximas conexões sigam o DNS para a nova instância primária em vez de
+        reutilizar conexões antigas.
+        """
+        for replica in self.replicas:
+            if replica.engine is engine:
+                self._atualizar_saude(replica, None, erro=str(erro) if erro else "falha de conexão")
+                engine.dispose()
+                return
+        
+        with self._lock_failover:
+            # Várias requisições falham juntas no failover; drenar o pool uma vez basta
+            if time.monotonic() - self._ultimo_failover < 1:
+                return
+            self._ultimo_failover = time.monotonic()
+            
+            ips = self._resolver_endpoint()
+            if ips and ips != self._ips_writer:
+                logger.warning(f"Endpoint {self.host} agora resolve para {ips} (antes {self._ips_writer})")
+            self._ips_writer = ips or self._ips_writer
+            
+            engine.dispose()
+            logger.info("Pool do writer drenado após falha de conexão/failover")
+    
+    def metricas_pool(self):
+        """
+        Retorna as métricas dos pools de conexão do writer e de cada réplica
+        """
+        return {
+            'writer': metricas_engine(self.engine) if self.engine else None,
+            'replicas': {r.host: metricas_engine(r.engine) for r in self.replicas}
+        }
+    
+    def _iniciar_monitor_replicas(self):
+        """
+        Inicia a thread que executa o health check logo de início e depois
+        periodicamente
+        """
+        if self._monitor and self._monitor.is_alive():
+            return
+        
+        def monitorar():
+            self.verificar_replicas()
+            while not self._parar_monitor.wait(self.intervalo_health_check):
+                self.verificar_replicas()
+        
+        self._parar_monitor.clear()
+        self._monitor = threading.Thread(target=monitorar, name='rds-health-check', daemon=True)
+        self._monitor.start()
     
     def test_connection(self):
         """
@@ -84,18 +547,164 @@ class RDSConnection:
         """
         Fecha a conexão com o banco de dados
         """
+        self._parar_monitor.set()
+        for replica in self.replicas:
+            replica.engine.dispose()
+        
         if self.engine:
             self.engine.dispose()
             logger.info("Conexão fechada.")
 
+def _sqlalchemy_asyncio():
+    """
+    Importa o suporte assíncrono do SQLAlchemy sob demanda
+    
+    Requer SQLAlchemy >= 2.0 com os extras de asyncio; sem eles apenas o
+    AsyncRDSConnection fica indisponível, o restante do módulo funciona.
+    """
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    except ImportError as e:
+        raise ImportError("AsyncRDSConnection requer SQLAlchemy >= 2.0 com suporte a asyncio "
+                          "(pip install 'sqlalchemy[asyncio]' aiomysql)") from e
+    return create_async_engine, async_sessionmaker
+
+class AsyncRDSConnection(RDSConnection):
+    """
+    Contraparte assíncrona do RDSConnection (asyncio + driver aiomysql)
+    
+    Usa a mesma Base/modelos, as mesmas opções de pool e o mesmo roteamento
+    para réplicas de leitura, mas entrega AsyncSession. Os métodos que acessam
+    o banco são corrotinas com sufixo _async (verificar_replicas_async,
+    test_connection_async, close_connection_async); os métodos síncronos
+    herdados não devem ser usados com engines assíncronos.
+    """
+    
+    def _criar_engine(self, host, port, database, username, password):
+        """
+        Cria um AsyncEngine SQLAlchemy para um host do RDS
+        """
+        create_async_engine, _ = _sqlalchemy_asyncio()
+        connection_string = f"mysql+aiomysql://{username}:{password}@{host}:{port}/{database}"
+        
+        # O AsyncEngine usa AsyncAdaptedQueuePool; as demais opções são as mesmas
+        return create_async_engine(
+            connection_string,
+            echo=False,
+            **opcoes_pool(**self.pool_options)
+        )
+    
+    def create_connection(self, host, port, database, username, password,
+                          read_replicas=None, max_replica_lag=None, pool_options=None):
+        """
+        Cria os engines assíncronos (writer e réplicas); mesmos argumentos do RDSConnection
+        
+        Os engines conectam sob demanda. Para o health check das réplicas, aguarde
+        verificar_replicas_async() ou agende iniciar_monitor_replicas() no event loop.
+        """
+        try:
+            _, async_sessionmaker = _sqlalchemy_asyncio()
+            self.pool_options = pool_options or {}
+            
+            self.engine = self._criar_engine(host, port, database, username, password)
+            self.session_factory = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+            
+            if read_replicas is None:
+                read_replicas = [h.strip() for h in os.getenv('RDS_READ_REPLICAS', '').split(',') if h.strip()]
+            if max_replica_lag is not None:
+                self.max_replica_lag = max_replica_lag
+            
+            self.replicas = []
+            for replica in read_replicas:
+                engine = self._criar_engine(replica, port, database, username, password)
+                self.replicas.append(ReplicaLeitura(
+                    replica, engine, async_sessionmaker(bind=engine, expire_on_commit=False)
+                ))
+            
+            logger.info(f"Conexão assíncrona configurada: {host}:{port}/{database} "
+                        f"({len(self.replicas)} réplicas de leitura)")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Erro ao configurar conexão assíncrona com o RDS: {str(e)}")
+            return False
+    
+    async def verificar_replicas_async(self):
+        """
+        Health check assíncrono das réplicas de leitura
+        """
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+                    lag = await connection.run_sync(self._medir_lag)
+                self._atualizar_saude(replica, lag)
+            except Exception as e:
+                self._atualizar_saude(replica, None, erro=str(e))
+        
+        return self.status_replicas()
+    
+    async def iniciar_monitor_replicas(self):
+        """
+        Executa o health check periodicamente (agendar com asyncio.create_task)
+        """
+        while not self._parar_monitor.is_set():
+            await self.verificar_replicas_async()
+            await asyncio.sleep(self.intervalo_health_check)
+    
+    async def test_connection_async(self):
+        """
+        Testa a conexão assíncrona com o banco de dados
+        """
+        try:
+            async with self.engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+                logger.info("Teste de conexão assíncrona bem-sucedido!")
+                return True
+        except Exception as e:
+            logger.error(f"Falha no teste de conexão assíncrona: {str(e)}")
+            return False
+    
+    async def close_connection_async(self):
+        """
+        Fecha os engines assíncronos
+        """
+        self._parar_monitor.set()
+        for replica in self.replicas:
+            await replica.engine.dispose()
+        
+        if self.engine:
+            await self.engine.dispose()
+            logger.info("Conexão assíncrona fechada.")
+
 # Instância global da conexão
 rds_connection = RDSConnection()
+async_rds_connection = AsyncRDSConnection()
 
-def get_db_session():
+def get_db_session(readonly=False):
     """
     Função utilitária para obter uma sessão do banco de dados
+    
+    Args:
+        readonly (bool): Usa uma réplica de leitura quando disponível
+    """
+    return rds_connection.get_session(readonly=readonly)
+
+def executar_com_retry(operacao, **kwargs):
+    """
+    Função utilitária para RDSConnection.executar_com_retry na conexão global
+    """
+    return rds_connection.executar_com_retry(operacao, **kwargs)
+
+def get_async_db_session(readonly=False):
+    """
+    Função utilitária para obter uma AsyncSession do banco de dados
+    
+    Uso:
+        async with get_async_db_session(readonly=True) as session:
+            result = await session.execute(text("SELECT 1"))
     """
-    return rds_connection.get_session()
+    return async_rds_connection.get_session(readonly=readonly)
 
 # Exemplo de uso
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+"""
+Registro central das consultas SQL mais executadas
+Cada consulta é construída uma única vez como text() com parâmetros tipados, então
+a SQL não é re-processada a cada chamada e o cache de compilação do SQLAlchemy
+(compiled cache) é reaproveitado entre execuções
+"""
+
+import time
+import threading
+from sqlalchemy import text, bindparam, BindParameter, Date, DateTime
+from sqlalchemy.engine.default import CACHE_HIT
+
+class ConsultaRegistrada:
+    """
+    Consulta nomeada com estatísticas de execução
+    """
+    
+    def __init__(self, nome, sql, tipos):
+        self.nome = nome
+        self.sql = sql
+        self.statement = text(sql)
+        if tipos:
+            self.statement = self.statement.bindparams(
+                *[tipo if isinstance(tipo, BindParameter) else bindparam(parametro, type_=tipo)
+                  for parametro, tipo in tipos.items()]
+            )
+        self.execucoes = 0
+        self.cache_hits = 0
+        self.tempo_execucao_total = 0.0
+        self.tempo_compilacao = None  # medido na primeira execução
+    
+    def __repr__(self):
+        return f"<ConsultaRegistrada(nome='{self.nome}', execucoes={self.execucoes})>"
+
+class RegistroConsultas:
+    """
+    Registro de consultas nomeadas
+    """
+    
+    def __init__(self):
+        self._consultas = {}
+        self._lock = threading.Lock()
+    
+    def __contains__(self, nome):
+        return nome in self._consultas
+    
+    def registrar(self, nome, sql, **tipos):
+        """
+        Registra uma consulta
+        
+        Args:
+            nome (str): Nome único da consulta
+            sql (str): SQL com parâmetros no formato :parametro
+            **tipos: Tipo SQLAlchemy de cada parâmetro (ex.: dias=Integer), ou um
+                bindparam completo (ex.: ids=bindparam('ids', expanding=True))
+        """
+        consulta = ConsultaRegistrada(nome, sql, tipos)
+        self._consultas[nome] = consulta
+        return consulta.statement
+    
+    def obter(self, nome):
+        """
+        Retorna o statement pré-construído de uma consulta
+        """
+        return self._consultas[nome].statement
+    
+    def executar(self, session, nome, params=None):
+        """
+        Executa uma consulta registrada e atualiza as estatísticas
+        
+        Args:
+            session: Sessão SQLAlchemy (ou Connection)
+            nome (str): Nome da consulta
+            params (dict): Valores dos parâmetros
+        """
+        consulta = self._consultas[nome]
+        
+        if consulta.tempo_compilacao is None:
+            # Custo de compilação que o cache evita nas execuções seguintes
+            inicio = time.perf_counter()
+            consulta.statement.compile(dialect=session.get_bind().dialect)
+            consulta.tempo_compilacao = time.perf_counter() - inicio
+        
+        inicio = time.perf_counter()
+        result = session.execute(consulta.statement, params or {})
+        tempo = time.perf_counter() - inicio
+        
+        cache_hit = getattr(result.context, 'cache_hit', None) is CACHE_HIT
+        with self._lock:
+            consulta.execucoes += 1
+            consulta.tempo_execucao_total += tempo
+            if cache_hit:
+                consulta.cache_hits += 1
+        
+        return result
+    
+    def estatisticas(self):
+        """
+        Estatísticas por consulta, incluindo o tempo de compilação economizado
+        pelos acertos no cache de compilação
+        """
+        estatisticas = {}
+        for nome, c in self._consultas.items():
+            tempo_compilacao = c.tempo_compilacao or 0.0
+            estatisticas[nome] = {
+                'execucoes': c.execucoes,
+                'cache_hits': c.cache_hits,
+                'taxa_cache_hit': c.cache_hits / c.execucoes if c.execucoes else 0.0,
+                'tempo_compilacao_ms': tempo_compilacao * 1000,
+                'tempo_medio_execucao_ms': c.tempo_execucao_total / c.execucoes * 1000 if c.execucoes else 0.0,
+                'tempo_economizado_ms': c.cache_hits * tempo_compilacao * 1000
+            }
+        return estatisticas
+
+# Registro global
+consultas = RegistroConsultas()
+
+# As séries diárias de vendas leem o rollup vendas_diarias (rollups.py); dias em
+# que todos os pedidos foram cancelados ficam com total_pedidos = 0 e são ignorados.
+# As consultas por produto leem vendas_produto (top-N pelo índice de quantidade) e
+# as de clientes leem features_clientes (atualizada pelo job incremental)
+
+# Análises (data_analysis.RDSAnalytics)
+consultas.registrar('produtos_performance', """
+SELECT
+    p.id_produto,
+    p.nome,
+    p.categoria,
+    p.preco,
+    p.estoque,
+    COALESCE(vp.quantidade_vendida, 0) as total_vendido,
+    COALESCE(vp.receita_total, 0) as receita_total,
+    COALESCE(vp.total_pedidos, 0) as pedidos_com_produto,
+    COALESCE(vp.quantidade_vendida / NULLIF(vp.total_pedidos, 0), 0) as quantidade_media_por_pedido
+FROM produtos p
+LEFT JOIN vendas_produto vp ON p.id_produto = vp.id_produto
+WHERE p.ativo = 1
+ORDER BY receita_total DESC
+""")
+
+consultas.registrar('clientes_comportamento', """
+SELECT
+    c.id_cliente,
+    c.nome,
+    c.email,
+    c.data_cadastro,
+    COALESCE(f.total_pedidos, 0) as total_pedidos,
+    COALESCE(f.valor_total_gasto, 0) as valor_total_gasto,
+    COALESCE(f.valor_total_gasto / NULLIF(f.total_pedidos, 0), 0) as ticket_medio,
+    f.ultimo_pedido,
+    DATEDIFF(CURDATE(), f.ultimo_pedido) as dias_desde_ultimo_pedido
+FROM clientes c
+LEFT JOIN features_clientes f ON c.id_cliente = f.id_cliente
+WHERE c.ativo = 1
+ORDER BY valor_total_gasto DESC
+""")
+
+# Machine Learning (ml_integration.RDSMLIntegration)
+consultas.registrar('ml_dados_segmentacao_clientes', """
+SELECT
+    c.id_cliente,
+    c.nome,
+    DATEDIFF(CURDATE(), c.data_cadastro) as dias_desde_cadastro,
+    COALESCE(f.total_pedidos, 0) as total_pedidos,
+    COALESCE(f.valor_total_gasto, 0) as valor_total_gasto,
+    COALESCE(f.valor_total_gasto / NULLIF(f.total_pedidos, 0), 0) as ticket_medio,
+    COALESCE(f.ultimo_pedido, c.data_cadastro) as ultimo_pedido,
+    DATEDIFF(CURDATE(), COALESCE(f.ultimo_pedido, c.data_cadastro)) as dias_desde_ultimo_pedido,
+    COALESCE(f.dias_com_compras, 0) as dias_com_compras
+FROM clientes c
+LEFT JOIN features_clientes f ON c.id_cliente = f.id_cliente
+WHERE c.ativo = 1
+""")
+
+consultas.registrar('ml_features_rfm_clientes', """
+SELECT
+    c.id_cliente,
+    COALESCE(f.total_pedidos, 0) as total_pedidos,
+    COALESCE(f.valor_total_gasto, 0) as valor_total_gasto,
+    DATEDIFF(CURDATE(), COALESCE(f.ultimo_pedido, c.data_cadastro)) as dias_desde_ultimo_pedido
+FROM clientes c
+LEFT JOIN features_clientes f ON c.id_cliente = f.id_cliente
+WHERE c.id_cliente IN :ids
+AND c.ativo = 1
+""", ids=bindparam('ids', expanding=True))
+
+consultas.registrar('ml_series_vendas_produto', """
+SELECT
+    id_produto as serie,
+    data,
+    receita_total as total_vendas,
+    total_pedidos,
+    receita_total / total_pedidos as ticket_medio
+FROM vendas_produto_diarias
+WHERE data >= :desde
+AND total_pedidos > 0
+ORDER BY serie, data
+""", desde=Date)
+
+consultas.registrar('ml_series_vendas_categoria', """
+SELECT
+    COALESCE(p.categoria, 'Sem categoria') as serie,
+    v.data,
+    SUM(v.receita_total) as total_vendas,
+    SUM(v.total_pedidos) as total_pedidos,
+    SUM(v.receita_total) / SUM(v.total_pedidos) as ticket_medio
+FROM vendas_produto_diarias v
+JOIN produtos p ON p.id_produto = v.id_produto
+WHERE v.data >= :desde
+AND v.total_pedidos > 0
+GROUP BY COALESCE(p.categoria, 'Sem categoria'), v.data
+ORDER BY serie, v.data
+""", desde=Date)
+
+# Snapshots locais (snapshots.py): dias a partir de :desde atualizados desde
+# :atualizado_desde, para que as execuções seguintes busquem só o delta. Dias
+# zerados (todos os pedidos cancelados) também voltam, para substituir o valor
+# anterior no snapshot; quem lê o snapshot filtra total_pedidos > 0
+consultas.registrar('snapshot_vendas_diarias', """
+SELECT
+    data,
+    total_pedidos,
+    total_vendas,
+    total_vendas / NULLIF(total_pedidos, 0) as ticket_medio,
+    atualizado_em
+FROM vendas_diarias
+WHERE data >= :desde
+AND atualizado_em >= :atualizado_desde
+ORDER BY data
+""", desde=Date, atualizado_desde=DateTime)
+
+# Detector contínuo de anomalias (anomalias.py): só os dias fechados ainda não processados
+consultas.registrar('anomalias_vendas_novos_dias', """
+SELECT
+    data,
+    total_vendas
+FROM vendas_diarias
+WHERE data > :desde
+AND data < CURDATE()
+ORDER BY data
+""", desde=Date)
+
+# Endpoints de analytics da API (app.py)
+consultas.registrar('api_vendas_diarias', """
+SELECT
+    data,
+    total_pedidos,
+    total_vendas
+FROM vendas_diarias
+WHERE total_pedidos > 0
+ORDER BY data DESC
+LIMIT 30
+""")
+
+consultas.registrar('api_produtos_populares', """
+SELECT
+    p.nome,
+    p.categoria,
+    vp.quantidade_vendida as total_vendido,
+    vp.receita_total
+FROM vendas_produto vp
+JOIN produtos p ON p.id_produto = vp.id_produto
+WHERE vp.quantidade_vendida > 0
+ORDER BY vp.quantidade_vendida DESC
+LIMIT 10
+""")
@@ -3,16 +3,43 @@ Módulo de análise de dados para Amazon RDS
 Demonstra como realizar análises avançadas usando pandas e SQLAlchemy
 """
 
+import os
+import time
+import threading
 import pandas as pd
 import numpy as np
 from sqlalchemy import text
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import matplotlib.pyplot as plt
 import seaborn as sns
-from ..database.connection import get_db_session
-from ..database.models import LogAnalytics
+from ..database.connection import get_db_session, get_async_db_session, executar_com_retry
+from ..database.escritor_logs import escritor_logs
+from ..database.consultas import consultas
+from .snapshots import snapshots_analytics
+from .feature_store import feature_store_vendas
 import json
 
+# Linhas por chunk nas leituras em streaming
+TAMANHO_CHUNK_PADRAO = int(os.getenv('ANALYTICS_TAMANHO_CHUNK', 50000))
+
+# Tempo máximo (segundos) de cada seção do relatório completo
+TIMEOUT_SECAO_RELATORIO = float(os.getenv('ANALYTICS_TIMEOUT_SECAO', 60))
+
+def _linhas_para_dataframe(linhas, colunas, dtypes=None):
+    """
+    Monta um DataFrame a partir de um chunk de linhas, coluna a coluna
+    
+    Cada coluna é convertida uma única vez para o dtype informado (ou inferido
+    pelo pandas), sem passar por um DataFrame intermediário de objetos.
+    """
+    dtypes = dtypes or {}
+    valores = list(zip(*linhas)) if linhas else [()] * len(colunas)
+    return pd.DataFrame(
+        {coluna: pd.Series(valores[i], dtype=dtypes.get(coluna)) for i, coluna in enumerate(colunas)},
+        columns=colunas
+    )
+
 class RDSAnalytics:
     """
     Classe para realizar análises de dados no Amazon RDS
@@ -20,13 +47,16 @@ class RDSAnalytics:
     
     def __init__(self):
         self.session = None
-        
+        # Prazo (time.monotonic) das consultas da thread atual, usado pelas
+        # seções do relatório completo (ver _executar_secao)
+        self._prazos = threading.local()
+    
     def connect(self):
         """
-        Conecta com o banco de dados
+        Conecta com o banco de dados (réplica de leitura, quando disponível)
         """
         try:
-            self.session = get_db_session()
+            self.session = get_db_session(readonly=True)
             return True
         except Exception as e:
             print(f"Erro ao conectar: {e}")
@@ -35,42 +65,150 @@ class RDSAnalytics:
     def execute_query_to_dataframe(self, query, params=None):
         """
         Executa uma query SQL e retorna um DataFrame pandas
+        
+        Args:
+            query (str): Nome de uma consulta registrada em consultas.py ou SQL
+            params (dict): Parâmetros da consulta
         """
         if not self.session:
             raise Exception("Não conectado ao banco de dados")
         
+        prazo = getattr(self._prazos, 'prazo', None)
+        
+        def executar(session):
+            if prazo is not None:
+                # Interrompe a consulta no servidor no fim do prazo, liberando a conexão
+                restante_ms = max(1, int((prazo - time.monotonic()) * 1000))
+                session.execute(text("SET SESSION max_execution_time = :ms"), {'ms': restante_ms})
+            try:
+                if query in consultas:
+                    # Consulta registrada: statement pré-construído e compilação em cache
+                    result = consultas.executar(session, query, params)
+                else:
+                    result = session.execute(text(query), params or {})
+                # Converter para DataFrame
+                return pd.DataFrame(result.fetchall(), columns=result.keys())
+            finally:
+                if prazo is not None:
+                    self._restaurar_tempo_execucao(session)
+        
         try:
-            if params:
-                result = self.session.execute(text(query), params)
-            else:
-                result = self.session.execute(text(query))
-            
-            # Converter para DataFrame
-            df = pd.DataFrame(result.fetchall(), columns=result.keys())
-            return df
+            # Leitura idempotente: repetida automaticamente em falhas transitórias
+            # (failover, conexão perdida), cada tentativa em uma conexão do pool
+            return executar_com_retry(executar, readonly=True)
         except Exception as e:
             print(f"Erro ao executar query: {e}")
             return None
     
-    def analise_vendas_por_periodo(self, dias=30):
+    def _restaurar_tempo_execucao(self, session):
         """
-        Análise de vendas por período
+        Volta max_execution_time ao padrão antes de a conexão voltar ao pool; se
+        não for possível, a conexão é descartada
+        """
+        try:
+            session.execute(text("SET SESSION max_execution_time = DEFAULT"))
+        except Exception as e:
+            print(f"Erro ao restaurar max_execution_time; descartando a conexão: {e}")
+            session.invalidate()
+    
+    def execute_query_to_dataframe_chunks(self, query, params=None, tamanho_chunk=TAMANHO_CHUNK_PADRAO,
+                                          dtypes=None):
+        """
+        Executa uma query com cursor no servidor e gera DataFrames de até tamanho_chunk linhas
+        
+        Só um chunk de linhas fica em memória por vez, então extrações maiores que a
+        memória disponível podem ser processadas (ou gravadas) chunk a chunk. Usa uma
+        sessão própria, já que a conexão fica ocupada até o fim da leitura; o gerador
+        deve ser consumido até o fim ou fechado (close()) para devolver a conexão.
+        
+        Args:
+            query (str): Nome de uma consulta registrada em consultas.py ou SQL
+            params (dict): Parâmetros da consulta
+            tamanho_chunk (int): Linhas por DataFrame
+            dtypes (dict): dtype por coluna (ex.: {'total_vendas': 'float64',
+                'data': 'datetime64[ns]'}); as demais colunas têm o tipo inferido
+        """
+        statement = consultas.obter(query) if query in consultas else text(query)
+        
+        def executar(session):
+            return session.execute(
+                statement, params or {},
+                execution_options={'stream_results': True, 'yield_per': tamanho_chunk}
+            )
+        
+        # Só a execução inicial é repetida em falhas transitórias; uma falha no
+        # meio da leitura é propagada (os chunks já entregues não são repetidos)
+        session, result = executar_com_retry(executar, readonly=True, manter_sessao=True)
+        try:
+            colunas = list(result.keys())
+            vazio = True
+            for linhas in result.partitions(tamanho_chunk):
+                vazio = False
+                yield _linhas_para_dataframe(linhas, colunas, dtypes)
+            if vazio:
+                yield _linhas_para_dataframe([], colunas, dtypes)
+        finally:
+            session.close()
+    
+    def execute_query_to_dataframe_stream(self, query, params=None, tamanho_chunk=TAMANHO_CHUNK_PADRAO,
+                                          dtypes=None):
+        """
+        Versão de execute_query_to_dataframe com leitura em streaming
+        
+        As linhas são lidas em chunks (cursor no servidor) e convertidas em colunas
+        tipadas, então a lista completa de Rows nunca existe em memória; os chunks
+        são concatenados uma única vez no final.
+        
+        Returns:
+            DataFrame ou None em caso de erro
+        """
+        try:
+            chunks = list(self.execute_query_to_dataframe_chunks(query, params, tamanho_chunk, dtypes))
+            if len(chunks) == 1:
+                return chunks[0]
+            return pd.concat(chunks, ignore_index=True, copy=False)
+        except Exception as e:
+            print(f"Erro ao executar query em streaming: {e}")
+            return None
+    
+    def _carregar_vendas_diarias(self, dias):
         """
-        query = """
-        SELECT 
-            DATE(data_pedido) as data,
-            COUNT(*) as total_pedidos,
-            SUM(valor_total) as total_vendas,
-            AVG(valor_total) as ticket_medio
-        FROM pedidos 
-        WHERE data_pedido >= DATE_SUB(CURDATE(), INTERVAL :dias DAY)
-        AND status != 'cancelado'
-        GROUP BY DATE(data_pedido)
-        ORDER BY data
+        Vendas diárias dos últimos dias, do snapshot local quando disponível
+        (só os dias novos são buscados no RDS)
+        """
+        desde = date.today() - timedelta(days=dias)
+        df = snapshots_analytics.carregar(
+            'snapshot_vendas_diarias',
+            lambda params: self.execute_query_to_dataframe('snapshot_vendas_diarias', params),
+            desde
+        )
+        # Dias com todos os pedidos cancelados ficam no snapshot com total_pedidos = 0
+        return df[df['total_pedidos'] > 0].reset_index(drop=True) if df is not None else None
+    
+    async def execute_query_to_dataframe_async(self, query, params=None):
         """
+        Versão assíncrona de execute_query_to_dataframe
         
+        Usa uma AsyncSession própria (réplica de leitura, quando disponível), então
+        várias consultas podem rodar concorrentemente no mesmo processo, ex.:
+            await asyncio.gather(analytics.execute_query_to_dataframe_async(q1),
+                                 analytics.execute_query_to_dataframe_async(q2))
+        """
+        try:
+            async with get_async_db_session(readonly=True) as session:
+                statement = consultas.obter(query) if query in consultas else text(query)
+                result = await session.execute(statement, params or {})
+                return pd.DataFrame(result.fetchall(), columns=result.keys())
+        except Exception as e:
+            print(f"Erro ao executar query assíncrona: {e}")
+            return None
+    
+    def analise_vendas_por_periodo(self, dias=30):
+        """
+        Análise de vendas por período
+        """
         start_time = datetime.now()
-        df = self.execute_query_to_dataframe(query, {'dias': dias})
+        df = self._carregar_vendas_diarias(dias)
         end_time = datetime.now()
         
         if df is not None and not df.empty:
@@ -110,27 +248,8 @@ class RDSAnalytics:
         """
         Análise de performance de produtos
         """
-        query = """
-        SELECT 
-            p.id_produto,
-            p.nome,
-            p.categoria,
-            p.preco,
-            p.estoque,
-            COALESCE(SUM(ip.quantidade), 0) as total_vendido,
-            COALESCE(SUM(ip.subtotal), 0) as receita_total,
-            COALESCE(COUNT(DISTINCT ip.id_pedido), 0) as pedidos_com_produto,
-            COALESCE(AVG(ip.quantidade), 0) as quantidade_media_por_pedido
-        FROM produtos p
-        LEFT JOIN itens_pedido ip ON p.id_produto = ip.id_produto
-        LEFT JOIN pedidos ped ON ip.id_pedido = ped.id_pedido AND ped.status != 'cancelado'
-        WHERE p.ativo = 1
-        GROUP BY p.id_produto, p.nome, p.categoria, p.preco, p.estoque
-        ORDER BY receita_total DESC
-        """
-        
         start_time = datetime.now()
-        df = self.execute_query_to_dataframe(query)
+        df = self.execute_query_to_dataframe('produtos_performance')
         end_time = datetime.now()
         
         if df is not None and not df.empty:
@@ -166,26 +285,8 @@ class RDSAnalytics:
         """
         Análise de comportamento de clientes
         """
-        query = """
-        SELECT 
-            c.id_cliente,
-            c.nome,
-            c.email,
-            c.data_cadastro,
-            COUNT(p.id_pedido) as total_pedidos,
-            COALESCE(SUM(p.valor_total), 0) as valor_total_gasto,
-            COALESCE(AVG(p.valor_total), 0) as ticket_medio,
-            MAX(p.data_pedido) as ultimo_pedido,
-            DATEDIFF(CURDATE(), MAX(p.data_pedido)) as dias_desde_ultimo_pedido
-        FROM clientes c
-        LEFT JOIN pedidos p ON c.id_cliente = p.id_cliente AND p.status != 'cancelado'
-        WHERE c.ativo = 1
-        GROUP BY c.id_cliente, c.nome, c.email, c.data_cadastro
-        ORDER BY valor_total_gasto DESC
-        """
-        
         start_time = datetime.now()
-        df = self.execute_query_to_dataframe(query)
+        df = self.execute_query_to_dataframe('clientes_comportamento')
         end_time = datetime.now()
         
         if df is not None and not df.empty:
@@ -230,30 +331,18 @@ class RDSAnalytics:
         """
         Previsão simples de vendas usando média móvel
         """
-        query = """
-        SELECT 
-            DATE(data_pedido) as data,
-            SUM(valor_total) as total_vendas
-        FROM pedidos 
-        WHERE data_pedido >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-        AND status != 'cancelado'
-        GROUP BY DATE(data_pedido)
-        ORDER BY data
-        """
-        
         start_time = datetime.now()
-        df = self.execute_query_to_dataframe(query)
+        # Médias móveis já materializadas no feature store (só os dias novos são calculados)
+        feature_store_vendas.sincronizar(self._carregar_vendas_diarias)
+        df = feature_store_vendas.recentes(30)
+        proximo = feature_store_vendas.features_proximo_dia()
         end_time = datetime.now()
         
-        if df is not None and not df.empty and len(df) >= 7:
-            df['data'] = pd.to_datetime(df['data'])
-            df = df.sort_values('data')
-            
-            # Calcular média móvel de 7 dias
-            df['media_movel_7'] = df['total_vendas'].rolling(window=7).mean()
+        if df is not None and proximo is not None and len(df) >= 7:
+            df = df[['data', 'total_vendas', 'media_movel_7']]
             
             # Previsão simples baseada na média dos últimos 7 dias
-            media_ultimos_7_dias = df['total_vendas'].tail(7).mean()
+            media_ultimos_7_dias = proximo['media_movel_7']
             
             # Gerar previsões
             ultima_data = df['data'].max()
@@ -290,30 +379,88 @@ class RDSAnalytics:
     def _log_analise(self, tipo_analise, resultado, tempo_execucao):
         """
         Registra a execução de uma análise no banco de dados
+        
+        O registro é enfileirado e gravado em lote pelo escritor em segundo plano
+        (sempre no writer), então a análise não espera pelo INSERT/commit.
         """
         try:
-            log_entry = LogAnalytics(
-                tipo_analise=tipo_analise,
-                resultado=json.dumps(resultado, default=str)[:1000],  # Limitar tamanho
-                tempo_execucao=tempo_execucao
+            escritor_logs.registrar(
+                tipo_analise,
+                json.dumps(resultado, default=str)[:1000],  # Limitar tamanho
+                tempo_execucao
             )
-            self.session.add(log_entry)
-            self.session.commit()
         except Exception as e:
             print(f"Erro ao registrar log: {e}")
     
-    def gerar_relatorio_completo(self):
+    def _executar_secao(self, prazo, funcao, *args):
+        # As consultas da seção (execute_query_to_dataframe, nesta thread) ficam
+        # limitadas no servidor ao tempo restante até o prazo
+        self._prazos.prazo = prazo
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args)
+        finally:
+            self._prazos.prazo = None
+        return resultado, time.perf_counter() - inicio
+    
+    def gerar_relatorio_completo(self, timeout_secao=None):
         """
         Gera um relatório completo com todas as análises
+        
+        As seções rodam em paralelo, cada uma em sua própria conexão do pool, então
+        o relatório leva aproximadamente o tempo da seção mais lenta. Uma seção que
+        falha ou excede timeout_secao fica como None, sem derrubar as demais; o
+        status e o tempo de cada seção ficam em relatorio['secoes']. As consultas
+        das seções rodam com max_execution_time até o prazo, então a de uma seção
+        que excedeu o tempo é interrompida no servidor e a conexão volta ao pool.
+        
+        Args:
+            timeout_secao (float): Segundos por seção (padrão ANALYTICS_TIMEOUT_SECAO)
         """
-        relatorio = {
-            'data_geracao': datetime.now().isoformat(),
-            'vendas': self.analise_vendas_por_periodo(30),
-            'produtos': self.analise_produtos_performance(),
-            'clientes': self.analise_clientes_comportamento(),
-            'previsao': self.previsao_vendas_simples(7)
+        timeout_secao = timeout_secao if timeout_secao is not None else TIMEOUT_SECAO_RELATORIO
+        secoes = {
+            'vendas': (self.analise_vendas_por_periodo, 30),
+            'produtos': (self.analise_produtos_performance,),
+            'clientes': (self.analise_clientes_comportamento,),
+            'previsao': (self.previsao_vendas_simples, 7)
         }
         
+        relatorio = {'data_geracao': datetime.now().isoformat(), 'secoes': {}}
+        inicio = time.perf_counter()
+        
+        # Todas as seções começam juntas, então compartilham o mesmo prazo
+        prazo = time.monotonic() + timeout_secao
+        executor = ThreadPoolExecutor(max_workers=len(secoes), thread_name_prefix='relatorio')
+        try:
+            futuros = {
+                nome: executor.submit(self._executar_secao, prazo, *secao)
+                for nome, secao in secoes.items()
+            }
+            
+            for nome, futuro in futuros.items():
+                try:
+                    resultado, tempo = futuro.result(timeout=max(0, prazo - time.monotonic()))
+                    relatorio[nome] = resultado
+                    relatorio['secoes'][nome] = {
+                        'status': 'ok' if resultado is not None else 'sem_dados',
+                        'tempo_execucao': tempo
+                    }
+                except FuturesTimeoutError:
+                    futuro.cancel()
+                    relatorio[nome] = None
+                    relatorio['secoes'][nome] = {'status': 'timeout', 'tempo_execucao': timeout_secao}
+                except Exception as e:
+                    print(f"Erro na seção '{nome}' do relatório: {e}")
+                    relatorio[nome] = None
+                    relatorio['secoes'][nome] = {'status': 'erro', 'erro': str(e)}
+        finally:
+            # Não esperar seções que excederam o tempo: a consulta em andamento é
+            # interrompida pelo max_execution_time e a thread termina em seguida
+            executor.shutdown(wait=False)
+        
+        relatorio['tempo_total'] = time.perf_counter() - inicio
+        relatorio['completo'] = all(s['status'] == 'ok' for s in relatorio['secoes'].values())
+        
         return relatorio
     
     def close(self):
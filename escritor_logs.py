@@ -0,0 +1,167 @@
+"""
+Gravação assíncrona dos logs de analytics
+Os registros de LogAnalytics vão para uma fila limitada e uma thread em segundo
+plano grava em lotes (um INSERT multi-linha), fora do caminho das requisições
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from .connection import get_db_session
+from .models import LogAnalytics
+
+logger = logging.getLogger(__name__)
+
+class EscritorLogAnalytics:
+    """
+    Escritor em segundo plano de registros LogAnalytics
+    
+    O lote é gravado quando atinge tamanho_lote registros ou quando intervalo_ms
+    se passa desde o primeiro registro do lote. Com a fila cheia (banco lento ou
+    indisponível) os novos registros são descartados e contados, sem bloquear
+    quem está registrando.
+    """
+    
+    def __init__(self, obter_sessao, tamanho_lote=100, intervalo_ms=500, capacidade=10000):
+        """
+        Args:
+            obter_sessao (callable): Retorna uma nova sessão conectada ao writer
+            tamanho_lote (int): Máximo de registros por INSERT
+            intervalo_ms (int): Tempo máximo que um registro espera na fila
+            capacidade (int): Tamanho máximo da fila
+        """
+        self.obter_sessao = obter_sessao
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo_ms / 1000
+        self._fila = queue.Queue(maxsize=capacidade)
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_contadores = threading.Lock()
+        self._thread = None
+        self.registrados = 0
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+    
+    def _garantir_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name='escritor-log-analytics',
+                                                daemon=True)
+                self._thread.start()
+    
+    def definir_obter_sessao(self, obter_sessao):
+        """
+        Troca a fábrica de sessões usada nas próximas gravações (ex.: a API usa
+        as sessões do Flask-SQLAlchemy), mantendo a mesma fila e os contadores
+        """
+        self.obter_sessao = obter_sessao
+    
+    def registrar(self, tipo_analise, resultado, tempo_execucao):
+        """
+        Enfileira um registro de log sem acessar o banco
+        
+        Returns:
+            bool: False se o registro foi descartado por falta de espaço na fila
+        """
+        self._garantir_thread()
+        
+        try:
+            self._fila.put_nowait({
+                'tipo_analise': tipo_analise,
+                'resultado': resultado,
+                'tempo_execucao': tempo_execucao,
+                'data_execucao': datetime.utcnow()
+            })
+            with self._lock_contadores:
+                self.registrados += 1
+            return True
+        except queue.Full:
+            with self._lock_contadores:
+                self.descartados += 1
+                descartados = self.descartados
+            if descartados % 1000 == 1:
+                logger.warning(f"Fila de logs cheia; {descartados} registros descartados até agora")
+            return False
+    
+    def _executar(self):
+        while not (self._parar.is_set() and self._fila.empty()):
+            try:
+                lote = [self._fila.get(timeout=self.intervalo)]
+            except queue.Empty:
+                continue
+            
+            # Completar o lote até o tamanho máximo ou até o intervalo expirar
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.tamanho_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            
+            self._gravar(lote)
+    
+    def _gravar(self, lote):
+        session = self.obter_sessao()
+        try:
+            session.execute(LogAnalytics.__table__.insert(), lote)
+            session.commit()
+            with self._lock_contadores:
+                self.gravados += len(lote)
+        except Exception as e:
+            session.rollback()
+            with self._lock_contadores:
+                self.falhas += len(lote)
+            logger.error(f"Erro ao gravar {len(lote)} logs de analytics: {str(e)}")
+        finally:
+            session.close()
+    
+    def parar(self, timeout=5):
+        """
+        Grava o que estiver na fila e encerra a thread
+        """
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def estatisticas(self):
+        with self._lock_contadores:
+            return {
+                'registrados': self.registrados,
+                'gravados': self.gravados,
+                'descartados': self.descartados,
+                'falhas': self.falhas,
+                'na_fila': self._fila.qsize()
+            }
+
+def criar_escritor_logs(obter_sessao):
+    """
+    Cria um escritor configurado por variáveis de ambiente, encerrado na saída do processo
+    
+    Variáveis:
+        LOG_ANALYTICS_TAMANHO_LOTE: Registros por INSERT (padrão 100)
+        LOG_ANALYTICS_INTERVALO_MS: Espera máxima de um registro na fila (padrão 500)
+        LOG_ANALYTICS_CAPACIDADE: Tamanho da fila antes de descartar (padrão 10000)
+    """
+    escritor = EscritorLogAnalytics(
+        obter_sessao,
+        tamanho_lote=int(os.getenv('LOG_ANALYTICS_TAMANHO_LOTE', 100)),
+        intervalo_ms=int(os.getenv('LOG_ANALYTICS_INTERVALO_MS', 500)),
+        capacidade=int(os.getenv('LOG_ANALYTICS_CAPACIDADE', 10000))
+    )
+    atexit.register(escritor.parar)
+    return escritor
+
+# Escritor único do processo (analytics e API), usando por padrão sessões do
+# writer do RDSConnection; a API troca a fábrica com definir_obter_sessao
+escritor_logs = criar_escritor_logs(get_db_session)
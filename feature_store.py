@@ -0,0 +1,343 @@
+"""
+Feature store das séries de vendas diárias
+Lags e médias móveis usados no treino e na inferência são materializados uma
+vez por dia fechado em um arquivo Parquet versionado, com leituras
+point-in-time para o treino e leitura O(1) das features do próximo dia
+"""
+
+import os
+import logging
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Dias anteriores necessários para lags e médias móveis (média móvel de 14 dias)
+JANELA_FEATURES = 14
+
+# Versão do esquema das features: incrementar a cada mudança nas colunas ou em
+# montar_features. Arquivos do feature store e modelos de outra versão são
+# descartados (recalculados / treinados do zero)
+VERSAO_FEATURES = 2
+
+# Valores do próprio dia (o alvo e o que só se sabe quando o dia termina):
+# guardados para calcular os lags, nunca usados como features
+COLUNAS_BASE = ['total_vendas', 'total_pedidos', 'ticket_medio']
+COLUNAS_CALENDARIO = ['dia_semana', 'dia_mes', 'mes', 'trimestre', 'semana_ano']
+COLUNAS_LAG = ['vendas_lag_1', 'vendas_lag_7', 'pedidos_lag_1', 'ticket_lag_1',
+               'media_movel_7', 'media_movel_14']
+COLUNAS_FEATURES = COLUNAS_BASE + COLUNAS_CALENDARIO + COLUNAS_LAG
+
+def montar_features(vendas, pedidos, datas):
+    """
+    Features de cada série em cada dia, a partir de matrizes séries x dias
+    
+    As matrizes têm uma coluna por dia do calendário (dias sem venda = 0). As
+    features do dia d usam só os dias anteriores a d, o que se sabe antes de o
+    dia começar. Treino (calcular_features_diarias,
+    previsao_demanda.montar_features_series) e previsão
+    (ml_integration.prever_series) usam esta mesma função.
+    
+    Args:
+        vendas, pedidos (ndarray): Séries x dias
+        datas (DatetimeIndex): Dia de cada coluna
+    
+    Returns:
+        dict: Coluna de COLUNAS_CALENDARIO + COLUNAS_LAG -> matriz séries x dias
+            (NaN enquanto faltam dias anteriores)
+    """
+    vendas = np.asarray(vendas, dtype=np.float64)
+    pedidos = np.asarray(pedidos, dtype=np.float64)
+    ticket = np.divide(vendas, pedidos, out=np.zeros_like(vendas), where=pedidos > 0)
+    
+    total_dias = vendas.shape[1]
+    
+    def deslocar(m, dias):
+        deslocada = np.full(m.shape, np.nan)
+        if total_dias > dias:
+            deslocada[:, dias:] = m[:, :total_dias - dias]
+        return deslocada
+    
+    def media_anterior(m, janela):
+        # Média dos janela dias anteriores a cada coluna
+        acumulado = np.cumsum(np.concatenate([np.zeros((m.shape[0], 1)), m], axis=1), axis=1)
+        media = np.full(m.shape, np.nan)
+        if total_dias > janela:
+            media[:, janela:] = (acumulado[:, janela:total_dias] - acumulado[:, :total_dias - janela]) / janela
+        return media
+    
+    calendario = {
+        'dia_semana': datas.dayofweek,
+        'dia_mes': datas.day,
+        'mes': datas.month,
+        'trimestre': datas.quarter,
+        'semana_ano': datas.isocalendar().week
+    }
+    features = {nome: np.broadcast_to(np.asarray(valores, dtype=np.float64), vendas.shape)
+                for nome, valores in calendario.items()}
+    features.update({
+        'vendas_lag_1': deslocar(vendas, 1),
+        'vendas_lag_7': deslocar(vendas, 7),
+        'pedidos_lag_1': deslocar(pedidos, 1),
+        'ticket_lag_1': deslocar(ticket, 1),
+        'media_movel_7': media_anterior(vendas, 7),
+        'media_movel_14': media_anterior(vendas, 14)
+    })
+    return features
+
+def calcular_features_diarias(vendas, inicio, fim):
+    """
+    Features de cada dia entre inicio e fim (inclusive), por montar_features
+    
+    Args:
+        vendas (DataFrame): data, total_pedidos, total_vendas, ticket_medio
+        inicio, fim (date): Período; os primeiros JANELA_FEATURES dias servem
+            de contexto e ficam com lags incompletos (NaN)
+    """
+    datas = pd.date_range(pd.Timestamp(inicio), pd.Timestamp(fim), freq='D')
+    df = vendas[['data'] + COLUNAS_BASE].copy()
+    df['data'] = pd.to_datetime(df['data']).dt.normalize()
+    df = (df.groupby('data')[COLUNAS_BASE].sum().reindex(datas).fillna(0.0)
+          .astype(np.float64).rename_axis('data').reset_index())
+    df['ticket_medio'] = np.divide(df['total_vendas'], df['total_pedidos'],
+                                   out=np.zeros(len(df)), where=df['total_pedidos'].to_numpy() > 0)
+    
+    features = montar_features(df['total_vendas'].to_numpy()[np.newaxis],
+                               df['total_pedidos'].to_numpy()[np.newaxis], datas)
+    for coluna in COLUNAS_CALENDARIO + COLUNAS_LAG:
+        df[coluna] = features[coluna][0]
+    return df
+
+class FeatureStoreVendas:
+    """
+    Features diárias da série de vendas total, materializadas por dia fechado
+    
+    Cada sincronização grava só os dias novos e os dias de revisão cujos
+    valores mudaram, como uma nova versão (coluna materializado_em); versões
+    antigas são mantidas para leituras point-in-time (ler(como_em=...)).
+    A última versão de cada dia fica em memória, e as features do próximo dia
+    (o primeiro ainda não fechado) são calculadas na sincronização.
+    
+    Sem pyarrow (ou sem diretório) as features ficam só na memória do processo.
+    """
+    
+    def __init__(self, diretorio, dias_revisao=3, dias_iniciais=365):
+        self.diretorio = diretorio
+        self.dias_revisao = dias_revisao
+        self.dias_iniciais = dias_iniciais
+        self._lock = threading.Lock()
+        self._tabela = None  # todas as versões
+        self._atual = None   # última versão de cada dia, ordenada por data
+        self._proximo = None
+        self._modificado_disco = None  # mtime do arquivo na última leitura/gravação
+        self.sincronizacoes = 0
+        self.dias_materializados = 0
+    
+    @property
+    def disponivel(self):
+        return pq is not None and bool(self.diretorio)
+    
+    @property
+    def _caminho(self):
+        return os.path.join(self.diretorio, 'features_vendas_diarias.parquet')
+    
+    def _carregar_disco(self):
+        """
+        Relê o arquivo se ele mudou desde a última leitura ou gravação deste
+        processo (outro worker sincronizou); arquivos de outra VERSAO_FEATURES
+        são ignorados e recalculados na próxima sincronização
+        """
+        if not self.disponivel or not os.path.exists(self._caminho):
+            return
+        modificado = os.stat(self._caminho).st_mtime_ns
+        if modificado == self._modificado_disco:
+            return
+        self._modificado_disco = modificado
+        
+        arquivo = pq.read_table(self._caminho, memory_map=True)
+        versao = (arquivo.schema.metadata or {}).get(b'versao_features')
+        if versao is None or int(versao) != VERSAO_FEATURES:
+            logger.warning(f"Feature store na versão {versao and int(versao)} (atual {VERSAO_FEATURES}); "
+                           f"será recalculado")
+            return
+        self._definir_tabela(arquivo.to_pandas())
+    
+    def _gravar_disco(self):
+        if not self.disponivel:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        temporario = f"{self._caminho}.{os.getpid()}.tmp"
+        tabela = pa.Table.from_pandas(self._tabela, preserve_index=False)
+        tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}),
+                                                 b'versao_features': str(VERSAO_FEATURES).encode()})
+        pq.write_table(tabela, temporario)
+        os.replace(temporario, self._caminho)
+        self._modificado_disco = os.stat(self._caminho).st_mtime_ns
+    
+    def _definir_tabela(self, tabela):
+        self._tabela = tabela.reset_index(drop=True)
+        self._atual = self._ultimas_versoes(self._tabela)
+        self._proximo = self._calcular_proximo(self._atual)
+    
+    def _ultimas_versoes(self, tabela):
+        return (tabela.sort_values(['data', 'materializado_em'])
+                .drop_duplicates('data', keep='last').reset_index(drop=True))
+    
+    def _calcular_proximo(self, atual):
+        """
+        Features do dia seguinte ao último materializado (sem valores do próprio dia)
+        """
+        if atual is None or len(atual) < JANELA_FEATURES:
+            return None
+        datas = pd.date_range(end=atual['data'].iloc[-1] + timedelta(days=1),
+                              periods=JANELA_FEATURES + 1, freq='D')
+        janela = atual.set_index('data').reindex(datas[:-1]).fillna(0.0)
+        # O próprio dia entra com 0: montar_features só usa os dias anteriores
+        features = montar_features(np.append(janela['total_vendas'].to_numpy(), 0.0)[np.newaxis],
+                                   np.append(janela['total_pedidos'].to_numpy(), 0.0)[np.newaxis], datas)
+        proximo = {'data': datas[-1]}
+        proximo.update({coluna: float(features[coluna][0, -1]) for coluna in COLUNAS_CALENDARIO + COLUNAS_LAG})
+        return proximo
+    
+    def sincronizar(self, carregar_vendas, desde=None):
+        """
+        Materializa os dias fechados (até ontem) ainda não gravados
+        
+        Args:
+            carregar_vendas (callable): Recebe um número de dias e retorna as
+                vendas diárias desse período (data, total_pedidos, total_vendas,
+                ticket_medio), ex.: RDSMLIntegration._carregar_vendas_diarias
+            desde (date): Primeiro dia que deve estar materializado (padrão: o
+                início atual do store, ou dias_iniciais dias atrás se estiver vazio)
+        
+        Returns:
+            int: Dias gravados (novos ou revisados)
+        """
+        ontem = date.today() - timedelta(days=1)
+        with self._lock:
+            self._carregar_disco()
+            
+            if self._atual is None or self._atual.empty:
+                inicio = desde or ontem - timedelta(days=self.dias_iniciais)
+            else:
+                primeira = self._atual['data'].iloc[0].date()
+                ultima = self._atual['data'].iloc[-1].date()
+                inicio = ultima - timedelta(days=self.dias_revisao)
+                if desde is not None and desde < primeira:
+                    inicio = desde
+            if inicio > ontem:
+                return 0
+            
+            inicio_contexto = inicio - timedelta(days=JANELA_FEATURES)
+            vendas = carregar_vendas((date.today() - inicio_contexto).days)
+            if vendas is None or vendas.empty:
+                return 0
+            
+            novas = calcular_features_diarias(vendas, inicio_contexto, ontem)
+            novas = novas[novas['data'] >= pd.Timestamp(inicio)].reset_index(drop=True)
+            
+            # Dias já materializados só ganham nova versão se os valores mudaram
+            if self._atual is not None and not self._atual.empty:
+                anteriores = self._atual.set_index('data').reindex(novas['data'])[COLUNAS_FEATURES]
+                iguais = np.isclose(novas[COLUNAS_FEATURES].to_numpy(dtype=np.float64),
+                                    anteriores.to_numpy(dtype=np.float64), equal_nan=True).all(axis=1)
+                novas = novas[~iguais]
+            if novas.empty:
+                return 0
+            
+            # Relê o arquivo logo antes de mesclar: versões gravadas por outro
+            # processo durante a consulta não são perdidas na regravação
+            self._carregar_disco()
+            novas = novas.assign(materializado_em=pd.Timestamp.now())
+            tabela = novas if self._tabela is None else pd.concat([self._tabela, novas], ignore_index=True)
+            self._definir_tabela(tabela)
+            self._gravar_disco()
+            
+            self.sincronizacoes += 1
+            self.dias_materializados += len(novas)
+            return len(novas)
+    
+    def ler(self, desde=None, ate=None, como_em=None):
+        """
+        Features por dia (point-in-time quando como_em é informado)
+        
+        Args:
+            desde, ate (date): Período (inclusive)
+            como_em (datetime): Usa, para cada dia, a última versão materializada
+                até esse instante, isto é, o que se sabia naquele momento
+        
+        Returns:
+            DataFrame ordenado por data (data + COLUNAS_FEATURES), ou None se vazio
+        """
+        with self._lock:
+            self._carregar_disco()
+            if self._atual is None:
+                return None
+            if como_em is None:
+                df = self._atual
+            else:
+                df = self._ultimas_versoes(self._tabela[self._tabela['materializado_em'] <= pd.Timestamp(como_em)])
+        
+        if desde is not None:
+            df = df[df['data'] >= pd.Timestamp(desde)]
+        if ate is not None:
+            df = df[df['data'] <= pd.Timestamp(ate)]
+        if df.empty:
+            return None
+        return df[['data'] + COLUNAS_FEATURES].reset_index(drop=True)
+    
+    def recentes(self, dias=JANELA_FEATURES):
+        """
+        Últimos dias materializados (janela usada por prever_series)
+        """
+        with self._lock:
+            self._carregar_disco()
+            if self._atual is None:
+                return None
+            return self._atual[['data'] + COLUNAS_FEATURES].tail(dias).reset_index(drop=True)
+    
+    def features_proximo_dia(self):
+        """
+        Features do primeiro dia ainda não fechado, prontas para a inferência (O(1))
+        """
+        with self._lock:
+            self._carregar_disco()
+            return dict(self._proximo) if self._proximo is not None else None
+    
+    def estatisticas(self):
+        return {
+            'disponivel': self.disponivel,
+            'dias': len(self._atual) if self._atual is not None else 0,
+            'versoes': len(self._tabela) if self._tabela is not None else 0,
+            'ultimo_dia': self._atual['data'].iloc[-1].date().isoformat() if self._atual is not None else None,
+            'sincronizacoes': self.sincronizacoes,
+            'dias_materializados': self.dias_materializados
+        }
+
+def criar_feature_store(diretorio=None, dias_revisao=None):
+    """
+    Cria o feature store a partir de variáveis de ambiente
+    
+    Variáveis:
+        FEATURE_STORE_DIR: Diretório do feature store (padrão 'feature_store'; vazio: só memória)
+        FEATURE_STORE_REVISAO_DIAS: Dias fechados recalculados a cada sincronização (padrão 3)
+    """
+    diretorio = diretorio if diretorio is not None else os.getenv('FEATURE_STORE_DIR', 'feature_store')
+    dias_revisao = dias_revisao if dias_revisao is not None else int(os.getenv('FEATURE_STORE_REVISAO_DIAS', 3))
+    
+    if diretorio and pq is None:
+        logger.warning("pyarrow não está instalado; feature store apenas em memória")
+    
+    return FeatureStoreVendas(diretorio, dias_revisao)
+
+# Feature store compartilhado por RDSAnalytics e RDSMLIntegration
+feature_store_vendas = criar_feature_store()
@@ -0,0 +1,294 @@
+"""
+Ingestão em lote de pedidos para o Amazon RDS
+Usado nas importações de marketplaces: valida lotes de pedidos de forma vetorizada
+e grava pedidos e itens com INSERTs multi-linha em vez de um pedido por vez
+"""
+
+import json
+import uuid
+import logging
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text, case
+from .models import Cliente, Produto, Pedido, ItemPedido
+from .rollups import registrar_pedidos_core, registrar_itens_core
+
+logger = logging.getLogger(__name__)
+
+# Pedidos gravados por transação (e por INSERT multi-linha de pedidos)
+TAMANHO_LOTE_PADRAO = 500
+
+def _numerico(valores):
+    """
+    Converte para número; booleanos (true/false do JSON) contam como inválidos,
+    como no POST /api/pedidos
+    """
+    return pd.to_numeric(pd.Series([None if isinstance(v, bool) else v for v in valores], dtype=object),
+                         errors='coerce')
+
+def _validar_lote(session, pedidos, linhas):
+    """
+    Valida um lote de pedidos de forma vetorizada
+    
+    Returns:
+        tuple: (df_pedidos, df_itens, erros) onde erros mapeia posição no lote
+            para a mensagem de erro; df_pedidos e df_itens contêm só pedidos válidos
+    """
+    erros = {}
+    
+    df_pedidos = pd.DataFrame({
+        'pos': range(len(pedidos)),
+        'linha': linhas,
+        'id_cliente': _numerico([p.get('id_cliente') for p in pedidos]),
+        'status': [p.get('status') or 'pendente' for p in pedidos],
+        'observacoes': [p.get('observacoes') for p in pedidos],
+        'data_pedido': pd.to_datetime(pd.Series([p.get('data_pedido') for p in pedidos], dtype=object),
+                                      errors='coerce')
+    })
+    
+    itens = [
+        (pos, item.get('id_produto'), item.get('quantidade'))
+        for pos, p in enumerate(pedidos)
+        if isinstance(p.get('itens'), list)
+        for item in p['itens'] if isinstance(item, dict)
+    ]
+    df_itens = pd.DataFrame(itens, columns=['pos', 'id_produto', 'quantidade'])
+    df_itens['id_produto'] = _numerico(df_itens['id_produto']).to_numpy()
+    df_itens['quantidade'] = _numerico(df_itens['quantidade']).to_numpy()
+    
+    def marcar(posicoes, mensagem):
+        for pos in posicoes:
+            erros.setdefault(int(pos), mensagem)
+    
+    # Campos obrigatórios e tipos
+    marcar(df_pedidos.loc[df_pedidos['id_cliente'].isna(), 'pos'], "id_cliente ausente ou inválido")
+    com_data_invalida = df_pedidos['data_pedido'].isna() & pd.Series(
+        [p.get('data_pedido') is not None for p in pedidos])
+    marcar(df_pedidos.loc[com_data_invalida, 'pos'], "data_pedido inválida")
+    marcar(df_pedidos.loc[~df_pedidos['pos'].isin(df_itens['pos']), 'pos'], "pedido sem itens")
+    
+    item_invalido = (
+        df_itens['id_produto'].isna() |
+        df_itens['quantidade'].isna() |
+        (df_itens['quantidade'] <= 0) |
+        (df_itens['quantidade'] % 1 != 0)
+    )
+    marcar(df_itens.loc[item_invalido, 'pos'], "item com id_produto ou quantidade inválidos")
+    
+    # Clientes existentes (uma query para o lote inteiro)
+    ids_clientes = df_pedidos['id_cliente'].dropna().astype(int).unique().tolist()
+    clientes_existentes = set()
+    if ids_clientes:
+        clientes_existentes = {
+            row[0] for row in session.query(Cliente.id_cliente)
+            .filter(Cliente.id_cliente.in_(ids_clientes))
+        }
+    sem_cliente = df_pedidos['id_cliente'].notna() & ~df_pedidos['id_cliente'].isin(clientes_existentes)
+    marcar(df_pedidos.loc[sem_cliente, 'pos'], "cliente não encontrado")
+    
+    # Produtos (uma query, com lock das linhas para a baixa de estoque)
+    df_itens = df_itens[~item_invalido].astype({'id_produto': int, 'quantidade': int})
+    ids_produtos = sorted(df_itens['id_produto'].unique().tolist())
+    df_produtos = pd.DataFrame({
+        'id_produto': pd.Series(dtype=int),
+        'preco': pd.Series(dtype=float),
+        'estoque': pd.Series(dtype=float)
+    })
+    if ids_produtos:
+        df_produtos = pd.DataFrame(
+            session.query(Produto.id_produto, Produto.preco, Produto.estoque)
+            .filter(Produto.id_produto.in_(ids_produtos), Produto.ativo == True)
+            .order_by(Produto.id_produto)
+            .with_for_update()
+            .all(),
+            columns=['id_produto', 'preco', 'estoque']
+        )
+    df_itens = df_itens.merge(df_produtos, on='id_produto', how='left')
+    marcar(df_itens.loc[df_itens['preco'].isna(), 'pos'], "produto não encontrado ou inativo")
+    
+    # Estoque: pedidos na ordem do lote; só os aceitos consomem estoque, então
+    # um pedido recusado (por estoque ou por outro produto) não afeta os seguintes
+    df_itens = df_itens[~df_itens['pos'].isin(list(erros))].copy()
+    disponivel = df_itens.groupby('id_produto')['estoque'].first().fillna(0).to_dict()
+    por_pedido = df_itens.groupby(['pos', 'id_produto'])['quantidade'].sum()
+    for pos, quantidades in por_pedido.groupby(level='pos', sort=True):
+        quantidades = quantidades.droplevel('pos')
+        if any(quantidade > disponivel[id_produto] for id_produto, quantidade in quantidades.items()):
+            marcar([pos], "estoque insuficiente")
+            continue
+        for id_produto, quantidade in quantidades.items():
+            disponivel[id_produto] -= quantidade
+    
+    df_itens = df_itens[~df_itens['pos'].isin(list(erros))].copy()
+    df_itens['preco_unitario'] = df_itens['preco'].astype(float)
+    df_itens['subtotal'] = df_itens['quantidade'] * df_itens['preco_unitario']
+    
+    df_pedidos = df_pedidos[~df_pedidos['pos'].isin(list(erros))].copy()
+    df_pedidos['valor_total'] = df_pedidos['pos'].map(
+        df_itens.groupby('pos')['subtotal'].sum()).fillna(0.0)
+    df_pedidos['id_cliente'] = df_pedidos['id_cliente'].astype(int)
+    
+    return df_pedidos, df_itens, erros
+
+def _inserir_pedidos(session, df_pedidos):
+    """
+    Insere os pedidos do lote e retorna os ids gerados, na mesma ordem
+    
+    Um único INSERT multi-linha marca os pedidos com um lote_ingestao novo e um
+    SELECT por esse lote lê os ids de volta. Funciona em qualquer
+    innodb_autoinc_lock_mode: no modo 2 (padrão no MySQL 8 e no RDS) os ids de
+    um INSERT não são necessariamente consecutivos, mas crescem na ordem das
+    linhas, então a ordem por id é a ordem do lote.
+    
+    O INSERT é feito via Core (sem eventos do ORM), então os rollups são
+    atualizados explicitamente, na mesma transação (pedidos aqui, itens em _ingerir_lote).
+    """
+    lote = uuid.uuid4().hex
+    # Pedidos sem data recebem o horário da importação (também usado nos rollups)
+    df_pedidos['data_pedido'] = df_pedidos['data_pedido'].fillna(pd.Timestamp(datetime.utcnow()))
+    linhas = [
+        {
+            'id_cliente': int(r.id_cliente),
+            'status': r.status,
+            'observacoes': r.observacoes,
+            'valor_total': float(r.valor_total),
+            'data_pedido': r.data_pedido.to_pydatetime(),
+            'lote_ingestao': lote
+        }
+        for r in df_pedidos.itertuples(index=False)
+    ]
+    
+    registrar_pedidos_core(
+        session, ((l['status'], l['valor_total'], l['data_pedido']) for l in linhas))
+    
+    session.execute(Pedido.__table__.insert().values(linhas))
+    ids = [row[0] for row in session.execute(
+        text("SELECT id_pedido FROM pedidos WHERE lote_ingestao = :lote ORDER BY id_pedido"),
+        {'lote': lote}
+    )]
+    if len(ids) != len(linhas):
+        raise RuntimeError(f"Lote {lote}: {len(linhas)} pedidos inseridos, {len(ids)} ids lidos")
+    return ids
+
+def _ingerir_lote(session, pedidos, linhas):
+    """
+    Valida e grava um lote de pedidos na transação corrente
+    """
+    df_pedidos, df_itens, erros = _validar_lote(session, pedidos, linhas)
+    
+    ids_por_pos = {}
+    if not df_pedidos.empty:
+        ids = _inserir_pedidos(session, df_pedidos)
+        ids_por_pos = dict(zip(df_pedidos['pos'], ids))
+        
+        df_itens['id_pedido'] = df_itens['pos'].map(ids_por_pos)
+        session.execute(
+            ItemPedido.__table__.insert(),
+            df_itens[['id_pedido', 'id_produto', 'quantidade', 'preco_unitario', 'subtotal']]
+            .to_dict('records')
+        )
+        
+        pedidos_por_pos = df_pedidos.set_index('pos')
+        registrar_itens_core(session, (
+            (pedidos_por_pos.at[r.pos, 'status'], pedidos_por_pos.at[r.pos, 'data_pedido'],
+             r.id_pedido, r.id_produto, r.quantidade, r.subtotal)
+            for r in df_itens.itertuples(index=False)
+        ))
+        
+        # Baixa de estoque do lote em um único UPDATE
+        baixas = df_itens.groupby('id_produto')['quantidade'].sum()
+        baixas = {int(k): int(v) for k, v in baixas.items()}
+        session.execute(
+            Produto.__table__.update()
+            .where(Produto.id_produto.in_(baixas.keys()))
+            .values(estoque=Produto.estoque - case(baixas, value=Produto.id_produto))
+        )
+    
+    resultados = []
+    for pos, linha in enumerate(linhas):
+        if pos in erros:
+            resultados.append({'linha': linha, 'status': 'erro', 'erro': erros[pos]})
+        else:
+            resultados.append({'linha': linha, 'status': 'ok', 'id': int(ids_por_pos[pos])})
+    return resultados
+
+def ingerir_pedidos(session, pedidos, tamanho_lote=TAMANHO_LOTE_PADRAO, linhas=None, commit=True):
+    """
+    Grava uma lista de pedidos em lotes
+    
+    Args:
+        session: Sessão SQLAlchemy (conectada ao writer)
+        pedidos (list): Pedidos no mesmo formato do POST /api/pedidos
+        tamanho_lote (int): Quantidade de pedidos por transação
+        linhas (list): Número da linha de origem de cada pedido (padrão 1..n)
+        commit (bool): Faz commit a cada lote; com False apenas grava na transação corrente
+    
+    Returns:
+        list: Um resultado por pedido com 'linha', 'status' ('ok' ou 'erro') e 'id' ou 'erro'
+    """
+    if linhas is None:
+        linhas = list(range(1, len(pedidos) + 1))
+    
+    resultados = []
+    for inicio in range(0, len(pedidos), tamanho_lote):
+        lote = pedidos[inicio:inicio + tamanho_lote]
+        linhas_lote = linhas[inicio:inicio + tamanho_lote]
+        
+        # Savepoint por lote: uma falha de banco descarta só o lote atual
+        savepoint = session.begin_nested()
+        try:
+            resultados_lote = _ingerir_lote(session, lote, linhas_lote)
+            savepoint.commit()
+            if commit:
+                session.commit()
+        except Exception as e:
+            savepoint.rollback()
+            logger.error(f"Erro ao gravar lote de pedidos: {str(e)}")
+            resultados_lote = [
+                {'linha': linha, 'status': 'erro', 'erro': str(e)} for linha in linhas_lote
+            ]
+        
+        resultados.extend(resultados_lote)
+    
+    return resultados
+
+def ingerir_ndjson(session, linhas_ndjson, tamanho_lote=TAMANHO_LOTE_PADRAO, commit=True):
+    """
+    Grava pedidos recebidos em NDJSON (um pedido JSON por linha)
+    
+    Args:
+        linhas_ndjson: Iterável de linhas (str ou bytes), por exemplo um arquivo ou request.stream
+    
+    Returns:
+        list: Resultados por linha, ordenados pelo número da linha
+    """
+    resultados = []
+    pedidos = []
+    numeros = []
+    
+    for numero, linha in enumerate(linhas_ndjson, start=1):
+        if isinstance(linha, bytes):
+            linha = linha.decode('utf-8')
+        if not linha.strip():
+            continue
+        
+        try:
+            registro = json.loads(linha)
+            if not isinstance(registro, dict):
+                raise ValueError("cada linha deve ser um objeto JSON")
+        except ValueError as e:
+            resultados.append({'linha': numero, 'status': 'erro', 'erro': f"JSON inválido: {e}"})
+            continue
+        
+        pedidos.append(registro)
+        numeros.append(numero)
+        
+        if len(pedidos) >= tamanho_lote:
+            resultados.extend(ingerir_pedidos(session, pedidos, tamanho_lote, numeros, commit))
+            pedidos, numeros = [], []
+    
+    if pedidos:
+        resultados.extend(ingerir_pedidos(session, pedidos, tamanho_lote, numeros, commit))
+    
+    resultados.sort(key=lambda r: r['linha'])
+    return resultados
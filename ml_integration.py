@@ -12,11 +12,211 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import mean_squared_error, accuracy_score, classification_report
 import joblib
 import os
-from datetime import datetime, timedelta
-from ..database.connection import get_db_session
+from datetime import datetime, timedelta, date
+from ..database.connection import get_db_session, executar_com_retry
 from ..database.models import LogAnalytics
+from ..database.consultas import consultas
+from .snapshots import snapshots_analytics
+from .feature_store import (feature_store_vendas, montar_features, COLUNAS_CALENDARIO, COLUNAS_LAG,
+                            VERSAO_FEATURES)
+from .anomalias import carregar_detector, salvar_detector, processar_novos_dias, ARQUIVO_ESTADO_ANOMALIAS
+from .registro_modelos import criar_registro, resolver_artefato
 import json
 
+# Segmentos RFM, em ordem alfabética (mesma ordem de um groupby por texto)
+SEGMENTOS_RFM = ['At Risk', 'Champions', 'Lost Customers', 'Loyal Customers',
+                 'New Customers', 'Regular Customers']
+
+def _segmento_rfm(r, f, m):
+    """
+    Regras de segmentação para um trio de scores R, F, M (1-5, onde 5 é melhor)
+    """
+    if r >= 4 and f >= 4 and m >= 4:
+        return 'Champions'
+    elif r >= 3 and f >= 3 and m >= 3:
+        return 'Loyal Customers'
+    elif r >= 4 and f <= 2:
+        return 'New Customers'
+    elif r <= 2 and f >= 3:
+        return 'At Risk'
+    elif r <= 2 and f <= 2:
+        return 'Lost Customers'
+    else:
+        return 'Regular Customers'
+
+# Tabela 5x5x5 com o código do segmento de cada combinação de scores, montada
+# uma vez a partir das regras; a segmentação vira uma indexação de arrays
+_TABELA_SEGMENTOS_RFM = np.array([
+    [[SEGMENTOS_RFM.index(_segmento_rfm(r, f, m)) for m in range(1, 6)] for f in range(1, 6)]
+    for r in range(1, 6)
+], dtype=np.int8)
+
+def atribuir_segmentos_rfm(df):
+    """
+    Calcula os scores RFM e o segmento de cada cliente de forma vetorizada
+    
+    Adiciona ao DataFrame R_score, F_score e M_score (int8, 1-5), RFM_score
+    (ex.: '543') e segmento (categórico, categorias SEGMENTOS_RFM).
+    
+    Args:
+        df (DataFrame): Com dias_desde_ultimo_pedido, total_pedidos e valor_total_gasto
+    """
+    # Índice do quintil (0-4); recência menor é melhor, então o score é invertido
+    df['R_score'] = (5 - pd.qcut(df['dias_desde_ultimo_pedido'], 5, labels=False)).astype(np.int8)
+    df['F_score'] = (pd.qcut(df['total_pedidos'].rank(method='first'), 5, labels=False) + 1).astype(np.int8)
+    df['M_score'] = (pd.qcut(df['valor_total_gasto'], 5, labels=False) + 1).astype(np.int8)
+    
+    r = df['R_score'].to_numpy()
+    f = df['F_score'].to_numpy()
+    m = df['M_score'].to_numpy()
+    
+    df['RFM_score'] = (r.astype(np.int16) * 100 + f * 10 + m).astype(str)
+    df['segmento'] = pd.Categorical.from_codes(_TABELA_SEGMENTOS_RFM[r - 1, f - 1, m - 1],
+                                               categories=SEGMENTOS_RFM)
+    return df
+
+def limites_rfm(df):
+    """
+    Limites dos quintis de recência, frequência e valor de uma base de clientes
+    
+    Permitem pontuar clientes avulsos (pontuar_rfm) com os quintis da última
+    segmentação completa, sem recalcular a base inteira.
+    
+    Args:
+        df (DataFrame): Com dias_desde_ultimo_pedido, total_pedidos e valor_total_gasto
+    
+    Returns:
+        dict: Coluna -> 4 limites internos dos quintis
+    """
+    quantis = [0.2, 0.4, 0.6, 0.8]
+    return {
+        coluna: np.quantile(df[coluna].to_numpy(dtype=float), quantis).tolist()
+        for coluna in ('dias_desde_ultimo_pedido', 'total_pedidos', 'valor_total_gasto')
+    }
+
+def pontuar_rfm(df, limites):
+    """
+    Scores RFM e segmento de clientes avulsos a partir de limites_rfm
+    
+    Adiciona as mesmas colunas de atribuir_segmentos_rfm. Como os quintis são
+    fixos, empates nos limites caem no quintil inferior (atribuir_segmentos_rfm
+    desempata a frequência pela posição), então os scores de F podem diferir
+    em um ponto nos limites.
+    """
+    def quintil(coluna):
+        # Intervalos fechados à direita, como pd.qcut
+        return np.searchsorted(limites[coluna], df[coluna].to_numpy(dtype=float), side='left')
+    
+    r = (5 - quintil('dias_desde_ultimo_pedido')).astype(np.int8)
+    f = (quintil('total_pedidos') + 1).astype(np.int8)
+    m = (quintil('valor_total_gasto') + 1).astype(np.int8)
+    
+    df['R_score'] = r
+    df['F_score'] = f
+    df['M_score'] = m
+    df['RFM_score'] = (r.astype(np.int16) * 100 + f * 10 + m).astype(str)
+    df['segmento'] = pd.Categorical.from_codes(_TABELA_SEGMENTOS_RFM[r - 1, f - 1, m - 1],
+                                               categories=SEGMENTOS_RFM)
+    return df
+
+# Features do modelo de previsão de vendas, na ordem usada no treino; todas
+# calculadas por feature_store.montar_features só com os dias anteriores
+FEATURES_PREVISAO_VENDAS = COLUNAS_CALENDARIO + COLUNAS_LAG
+
+# Dias de histórico usados pelas features de lag e médias móveis
+JANELA_PREVISAO = 14
+
+def prever_series_recursivo(historico, horizonte, prever, data_final=None):
+    """
+    Previsão recursiva de várias séries e vários dias à frente, em lote
+    
+    O histórico vira matrizes séries x dias (dias sem venda = 0) e, a cada dia
+    à frente, as features de todas as séries são montadas de uma vez por
+    montar_features, a mesma função do treino, e passadas a prever. A previsão
+    de cada dia entra na janela dos dias seguintes; os pedidos dos dias
+    futuros, ainda desconhecidos, repetem os do último dia do histórico.
+    
+    Args:
+        historico (DataFrame): serie, data, total_vendas, total_pedidos
+        horizonte (int): Dias à frente
+        prever (callable): Recebe as séries (ndarray) e a matriz de features
+            (séries x FEATURES_PREVISAO_VENDAS) e retorna a previsão de cada série
+        data_final: Último dia do histórico (padrão: maior data do histórico)
+    
+    Returns:
+        DataFrame: serie, data, horizonte, vendas_previstas
+    """
+    historico = historico[['serie', 'data', 'total_vendas', 'total_pedidos']].copy()
+    historico['data'] = pd.to_datetime(historico['data']).dt.normalize()
+    
+    data_final = pd.Timestamp(data_final) if data_final is not None else historico['data'].max()
+    janela = pd.date_range(end=data_final, periods=JANELA_PREVISAO, freq='D')
+    
+    def matriz(coluna):
+        return historico.pivot_table(index='serie', columns='data', values=coluna, aggfunc='sum')
+    
+    matriz_vendas = matriz('total_vendas').reindex(columns=janela).fillna(0.0)
+    series = matriz_vendas.index.to_numpy()
+    vendas = matriz_vendas.to_numpy(dtype=np.float64)
+    pedidos = (matriz('total_pedidos').reindex(index=matriz_vendas.index, columns=janela)
+               .fillna(0.0).to_numpy(dtype=np.float64))
+    
+    datas_futuras = pd.date_range(data_final + timedelta(days=1), periods=horizonte, freq='D')
+    previsoes = np.empty((len(vendas), horizonte))
+    dia_previsto = np.zeros((len(vendas), 1))
+    
+    for passo, data in enumerate(datas_futuras):
+        # O dia previsto entra com 0: montar_features só usa os dias anteriores
+        features = montar_features(np.hstack([vendas, dia_previsto]), np.hstack([pedidos, dia_previsto]),
+                                   pd.date_range(end=data, periods=JANELA_PREVISAO + 1, freq='D'))
+        X = np.column_stack([features[f][:, -1] for f in FEATURES_PREVISAO_VENDAS])
+        
+        previsto = np.maximum(0, prever(series, X))  # Não pode ser negativo
+        previsoes[:, passo] = previsto
+        vendas = np.column_stack([vendas[:, 1:], previsto])
+        pedidos = np.column_stack([pedidos[:, 1:], pedidos[:, -1]])
+    
+    return pd.DataFrame({
+        'serie': np.repeat(series, horizonte),
+        'data': np.tile(datas_futuras.to_numpy(), len(vendas)),
+        'horizonte': np.tile(np.arange(1, horizonte + 1), len(vendas)),
+        'vendas_previstas': previsoes.ravel()
+    })
+
+def prever_series(modelo, scaler, historico, horizonte, data_final=None):
+    """
+    Previsão recursiva de várias séries com um único modelo: uma chamada de
+    scaler.transform/model.predict por dia à frente (ver prever_series_recursivo)
+    
+    Args:
+        modelo, scaler: Modelo e scaler treinados com FEATURES_PREVISAO_VENDAS
+    
+    Returns:
+        DataFrame: serie, data, horizonte, vendas_previstas
+    """
+    def prever(series, X):
+        if hasattr(scaler, 'feature_names_in_'):
+            # Scaler ajustado com um DataFrame (nomes das colunas)
+            X = pd.DataFrame(X, columns=FEATURES_PREVISAO_VENDAS)
+        return modelo.predict(scaler.transform(X))
+    
+    return prever_series_recursivo(historico, horizonte, prever, data_final)
+
+# Parâmetros do RandomForest da previsão de vendas (substituídos pelos do
+# backtesting em otimizar_modelo_previsao_vendas)
+PARAMETROS_PREVISAO_VENDAS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'random_state': 42
+}
+
+# Treino incremental do modelo de previsão de vendas
+ARVORES_POR_ATUALIZACAO = int(os.getenv('ML_ARVORES_POR_ATUALIZACAO', 10))
+MAXIMO_ARVORES = int(os.getenv('ML_MAXIMO_ARVORES', 200))
+JANELA_TREINO_INCREMENTAL = int(os.getenv('ML_JANELA_TREINO_INCREMENTAL', 60))
+LIMIAR_DRIFT_RMSE = float(os.getenv('ML_LIMIAR_DRIFT_RMSE', 1.5))  # vezes o RMSE do último treino completo
+LIMIAR_DRIFT_FEATURES = float(os.getenv('ML_LIMIAR_DRIFT_FEATURES', 3.0))  # desvios da média do treino
+
 class RDSMLIntegration:
     """
     Classe para integração de Machine Learning com dados do Amazon RDS
@@ -27,73 +227,85 @@ class RDSMLIntegration:
         self.models = {}
         self.scalers = {}
         self.encoders = {}
-        
+        self.estado_treino = {}  # estado do treino incremental por modelo
+        self.metricas = {}  # métricas do último treino por modelo (publicadas no registro)
+        self.parametros = {}  # parâmetros escolhidos no backtesting por modelo
+    
     def connect(self):
         """
-        Conecta com o banco de dados
+        Conecta com o banco de dados (réplica de leitura, quando disponível)
         """
         try:
-            self.session = get_db_session()
+            self.session = get_db_session(readonly=True)
             return True
         except Exception as e:
             print(f"Erro ao conectar: {e}")
             return False
     
+    def _consultar(self, consulta, params=None):
+        """
+        Executa uma consulta registrada e retorna um DataFrame
+        
+        Cada execução usa uma sessão de leitura nova e é repetida em falhas
+        transitórias (failover, conexão perdida) por executar_com_retry.
+        """
+        def executar(session):
+            result = consultas.executar(session, consulta, params)
+            return pd.DataFrame(result.fetchall(), columns=result.keys())
+        
+        return executar_com_retry(executar, readonly=True)
+    
+    def _carregar_vendas_diarias(self, dias):
+        """
+        Vendas diárias dos últimos dias, do snapshot local quando disponível
+        (só os dias novos são buscados no RDS)
+        """
+        def buscar(params):
+            return self._consultar('snapshot_vendas_diarias', params)
+        
+        desde = date.today() - timedelta(days=dias)
+        df = snapshots_analytics.carregar('snapshot_vendas_diarias', buscar, desde)
+        # Dias com todos os pedidos cancelados ficam no snapshot com total_pedidos = 0
+        return df[df['total_pedidos'] > 0].reset_index(drop=True) if df is not None else None
+    
     def preparar_dados_previsao_vendas(self, dias_historico=90):
         """
         Prepara dados para previsão de vendas
+        
+        As features vêm do feature store: só os dias fechados ainda não
+        materializados são calculados aqui.
         """
-        query = """
-        SELECT 
-            DATE(data_pedido) as data,
-            COUNT(*) as total_pedidos,
-            SUM(valor_total) as total_vendas,
-            AVG(valor_total) as ticket_medio,
-            DAYOFWEEK(data_pedido) as dia_semana,
-            DAY(data_pedido) as dia_mes,
-            MONTH(data_pedido) as mes,
-            YEAR(data_pedido) as ano
-        FROM pedidos 
-        WHERE data_pedido >= DATE_SUB(CURDATE(), INTERVAL :dias DAY)
-        AND status != 'cancelado'
-        GROUP BY DATE(data_pedido)
-        ORDER BY data
-        """
-        
-        result = self.session.execute(query, {'dias': dias_historico})
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        desde = date.today() - timedelta(days=dias_historico)
+        feature_store_vendas.sincronizar(self._carregar_vendas_diarias, desde)
+        df = feature_store_vendas.ler(desde=desde)
         
-        if not df.empty:
-            # Converter data
-            df['data'] = pd.to_datetime(df['data'])
-            
-            # Criar features temporais
-            df['dia_semana'] = df['data'].dt.dayofweek
-            df['dia_mes'] = df['data'].dt.day
-            df['mes'] = df['data'].dt.month
-            df['trimestre'] = df['data'].dt.quarter
-            df['semana_ano'] = df['data'].dt.isocalendar().week
-            
-            # Features de lag (valores dos dias anteriores)
-            df['vendas_lag_1'] = df['total_vendas'].shift(1)
-            df['vendas_lag_7'] = df['total_vendas'].shift(7)
-            df['pedidos_lag_1'] = df['total_pedidos'].shift(1)
-            
-            # Médias móveis
-            df['media_movel_7'] = df['total_vendas'].rolling(window=7).mean()
-            df['media_movel_14'] = df['total_vendas'].rolling(window=14).mean()
-            
-            # Remover linhas com NaN (devido aos lags)
+        if df is not None:
+            # Remover dias sem histórico suficiente para os lags
             df = df.dropna()
-            
-            return df
+            if not df.empty:
+                return df
         
         return None
     
-    def treinar_modelo_previsao_vendas(self):
+    def treinar_modelo_previsao_vendas(self, incremental=False):
         """
         Treina um modelo para prever vendas diárias
+        
+        Args:
+            incremental (bool): Com um modelo já treinado, apenas acrescenta árvores
+                treinadas nos dias novos (ver _atualizar_modelo_previsao_vendas); o
+                treino completo só acontece no primeiro treino, quando há drift ou
+                quando o estado é de outra VERSAO_FEATURES
         """
+        if incremental and 'previsao_vendas' in self.models and 'previsao_vendas' in self.estado_treino:
+            if resolver_artefato(self.estado_treino['previsao_vendas']).get('versao_features') != VERSAO_FEATURES:
+                print("Features em cache de outra versão; treinando do zero")
+            else:
+                resultado = self._atualizar_modelo_previsao_vendas()
+                if resultado is not None:
+                    self._guardar_metricas('previsao_vendas', resultado)
+                    return resultado
+        
         print("Preparando dados para previsão de vendas...")
         df = self.preparar_dados_previsao_vendas()
         
@@ -101,12 +313,7 @@ class RDSMLIntegration:
             print("Dados insuficientes para treinar o modelo")
             return None
         
-        # Features para o modelo
-        features = [
-            'total_pedidos', 'ticket_medio', 'dia_semana', 'dia_mes', 'mes', 
-            'trimestre', 'semana_ano', 'vendas_lag_1', 'vendas_lag_7', 
-            'pedidos_lag_1', 'media_movel_7', 'media_movel_14'
-        ]
+        features = FEATURES_PREVISAO_VENDAS
         
         X = df[features]
         y = df['total_vendas']
@@ -122,12 +329,8 @@ class RDSMLIntegration:
         X_test_scaled = scaler.transform(X_test)
         
         # Treinar modelo Random Forest
-        model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42,
-            n_jobs=-1
-        )
+        parametros = {**PARAMETROS_PREVISAO_VENDAS, **self.parametros.get('previsao_vendas', {})}
+        model = RandomForestRegressor(n_jobs=-1, **parametros)
         
         model.fit(X_train_scaled, y_train)
         
@@ -146,19 +349,130 @@ class RDSMLIntegration:
         self.models['previsao_vendas'] = model
         self.scalers['previsao_vendas'] = scaler
         
+        # Estado para os treinos incrementais seguintes: features já calculadas,
+        # último dia usado e erro de referência para a detecção de drift
+        self.estado_treino['previsao_vendas'] = {
+            'features': df[df['data'] < pd.Timestamp(date.today())].tail(JANELA_TREINO_INCREMENTAL),
+            'ultima_data': df['data'].max(),
+            'rmse_base': float(rmse),
+            'versao_features': VERSAO_FEATURES
+        }
+        
         resultado = {
             'modelo': 'RandomForestRegressor',
+            'modo': 'completo',
             'rmse': float(rmse),
             'mse': float(mse),
+            'parametros': parametros,
             'tamanho_treino': len(X_train),
             'tamanho_teste': len(X_test),
             'feature_importance': feature_importance.to_dict('records'),
             'data_treino': datetime.now().isoformat()
         }
         
+        self._guardar_metricas('previsao_vendas', resultado)
         print(f"Modelo treinado com sucesso! RMSE: {rmse:.2f}")
         return resultado
     
+    def otimizar_modelo_previsao_vendas(self, dias_historico=365, grade=None, n_folds=5,
+                                        tamanho_teste=14, max_workers=None):
+        """
+        Escolhe os parâmetros do modelo de previsão por backtesting (origem móvel)
+        
+        Os melhores parâmetros passam a ser usados por treinar_modelo_previsao_vendas
+        e são publicados no registro com o modelo por salvar_modelos (e lidos de
+        volta por carregar_modelos).
+        
+        Returns:
+            dict: Resultado de backtesting.backtest_previsao_vendas
+        """
+        from .backtesting import backtest_previsao_vendas
+        
+        print("Preparando dados para o backtesting...")
+        df = self.preparar_dados_previsao_vendas(dias_historico)
+        if df is None:
+            print("Dados insuficientes para o backtesting")
+            return None
+        
+        resultado = backtest_previsao_vendas(df, grade, n_folds=n_folds, tamanho_teste=tamanho_teste,
+                                             max_workers=max_workers)
+        if resultado is None:
+            print("Dados insuficientes para o backtesting")
+            return None
+        
+        melhor = resultado['candidatos'][0]
+        self.parametros['previsao_vendas'] = melhor['parametros']
+        print(f"Melhores parâmetros: {melhor['parametros']} (RMSE médio {melhor['rmse_medio']:.2f}, "
+              f"{len(resultado['candidatos'])} candidatos em {resultado['tempo_total']:.1f}s)")
+        return resultado
+    
+    def _atualizar_modelo_previsao_vendas(self):
+        """
+        Atualiza o modelo de previsão só com os dias novos desde o último treino
+        
+        As features dos dias novos (só dias fechados, nunca o dia corrente) são
+        calculadas sobre uma janela curta e acrescentadas às features em cache,
+        que guardam apenas os últimos JANELA_TREINO_INCREMENTAL dias. Sem drift,
+        o RandomForest ganha ARVORES_POR_ATUALIZACAO árvores (warm_start)
+        treinadas nessa janela, e as árvores mais antigas são descartadas acima
+        de MAXIMO_ARVORES; o scaler não muda, para que as árvores antigas
+        continuem válidas. O custo depende dos dias novos, não do histórico total.
+        
+        Returns:
+            dict com o resultado, ou None quando há drift (treino completo necessário)
+        """
+        inicio = datetime.now()
+        # Artefatos do registro chegam como proxies somente leitura: o modelo e o
+        # estado são alterados aqui, então trabalhamos com os objetos reais
+        model = self.models['previsao_vendas'] = resolver_artefato(self.models['previsao_vendas'])
+        scaler = self.scalers['previsao_vendas']
+        estado = self.estado_treino['previsao_vendas'] = resolver_artefato(self.estado_treino['previsao_vendas'])
+        ultima_data = estado['ultima_data']
+        
+        # Lags e médias móveis já vêm materializados do feature store
+        dias = (datetime.now() - ultima_data).days + 1
+        df = self.preparar_dados_previsao_vendas(dias)
+        novos = (df[(df['data'] > ultima_data) & (df['data'] < pd.Timestamp(date.today()))]
+                 if df is not None else None)
+        if novos is None or novos.empty:
+            print("Nenhum dia novo desde o último treino")
+            return {'modelo': 'RandomForestRegressor', 'modo': 'sem_dados_novos',
+                    'rmse': estado['rmse_base'], 'data_treino': datetime.now().isoformat()}
+        
+        # Drift: erro do modelo atual nos dias novos ou features fora da faixa do treino
+        X_novos = novos[FEATURES_PREVISAO_VENDAS]
+        rmse_novos = float(np.sqrt(mean_squared_error(novos['total_vendas'],
+                                                      model.predict(scaler.transform(X_novos)))))
+        deslocamento = float(np.max(np.abs((X_novos.mean().to_numpy() - scaler.mean_) / scaler.scale_)))
+        if rmse_novos > LIMIAR_DRIFT_RMSE * estado['rmse_base'] or deslocamento > LIMIAR_DRIFT_FEATURES:
+            print(f"Drift detectado (RMSE dias novos {rmse_novos:.2f}, base {estado['rmse_base']:.2f}, "
+                  f"deslocamento {deslocamento:.1f}); treinando do zero")
+            return None
+        
+        janela = pd.concat([estado['features'], novos], ignore_index=True).tail(JANELA_TREINO_INCREMENTAL)
+        
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + ARVORES_POR_ATUALIZACAO)
+        model.fit(scaler.transform(janela[FEATURES_PREVISAO_VENDAS]), janela['total_vendas'])
+        if len(model.estimators_) > MAXIMO_ARVORES:
+            model.estimators_ = model.estimators_[-MAXIMO_ARVORES:]
+            model.set_params(n_estimators=MAXIMO_ARVORES)
+        
+        estado['features'] = janela.reset_index(drop=True)
+        estado['ultima_data'] = novos['data'].max()
+        
+        tempo = (datetime.now() - inicio).total_seconds()
+        print(f"Modelo atualizado com {len(novos)} dias novos em {tempo:.1f}s")
+        return {
+            'modelo': 'RandomForestRegressor',
+            'modo': 'incremental',
+            'dias_novos': len(novos),
+            'rmse': estado['rmse_base'],
+            'rmse_dias_novos': rmse_novos,
+            'arvores': len(model.estimators_),
+            'tempo_treino': tempo,
+            'data_treino': datetime.now().isoformat()
+        }
+    
     def prever_vendas_futuras(self, dias_futuro=7):
         """
         Faz previsões de vendas para os próximos dias
@@ -167,80 +481,160 @@ class RDSMLIntegration:
             print("Modelo de previsão não encontrado. Treine o modelo primeiro.")
             return None
         
-        model = self.models['previsao_vendas']
-        scaler = self.scalers['previsao_vendas']
-        
-        # Obter dados mais recentes
-        df = self.preparar_dados_previsao_vendas(30)
+        # Janela mais recente do feature store (materializa só os dias novos)
+        feature_store_vendas.sincronizar(self._carregar_vendas_diarias)
+        df = feature_store_vendas.recentes(JANELA_PREVISAO)
         if df is None or df.empty:
             return None
         
-        # Última linha de dados
-        ultima_linha = df.iloc[-1].copy()
-        previsoes = []
+        previsto = prever_series(self.models['previsao_vendas'], self.scalers['previsao_vendas'],
+                                 df.assign(serie='total'), dias_futuro)
         
-        for i in range(dias_futuro):
-            # Preparar features para previsão
-            data_futura = ultima_linha['data'] + timedelta(days=i+1)
-            
-            # Features temporais
-            features_futuras = {
-                'total_pedidos': ultima_linha['total_pedidos'],  # Usar último valor conhecido
-                'ticket_medio': ultima_linha['ticket_medio'],
-                'dia_semana': data_futura.dayofweek,
-                'dia_mes': data_futura.day,
-                'mes': data_futura.month,
-                'trimestre': (data_futura.month - 1) // 3 + 1,
-                'semana_ano': data_futura.isocalendar()[1],
-                'vendas_lag_1': ultima_linha['total_vendas'],
-                'vendas_lag_7': df.iloc[-7]['total_vendas'] if len(df) >= 7 else ultima_linha['total_vendas'],
-                'pedidos_lag_1': ultima_linha['total_pedidos'],
-                'media_movel_7': df['total_vendas'].tail(7).mean(),
-                'media_movel_14': df['total_vendas'].tail(14).mean()
-            }
-            
-            # Converter para array
-            X_pred = np.array([list(features_futuras.values())])
-            X_pred_scaled = scaler.transform(X_pred)
-            
-            # Fazer previsão
-            vendas_previstas = model.predict(X_pred_scaled)[0]
-            
-            previsoes.append({
-                'data': data_futura.strftime('%Y-%m-%d'),
-                'vendas_previstas': float(max(0, vendas_previstas)),  # Não pode ser negativo
-                'dia_semana': data_futura.strftime('%A'),
-                'confianca': 'media'
-            })
-            
-            # Atualizar última linha para próxima iteração
-            ultima_linha['total_vendas'] = vendas_previstas
+        return [{
+            'data': data.strftime('%Y-%m-%d'),
+            'vendas_previstas': float(valor),
+            'dia_semana': data.strftime('%A'),
+            'confianca': 'media'
+        } for data, valor in zip(previsto['data'], previsto['vendas_previstas'])]
+    
+    def carregar_series_vendas(self, nivel='categoria', dias_historico=90):
+        """
+        Histórico diário de vendas por produto ou por categoria, do rollup
+        vendas_produto_diarias, no formato usado por prever_series
+        
+        Args:
+            nivel (str): 'produto' (série = id_produto) ou 'categoria'
+        """
+        consulta = {'produto': 'ml_series_vendas_produto',
+                    'categoria': 'ml_series_vendas_categoria'}[nivel]
+        desde = date.today() - timedelta(days=dias_historico)
+        df = self._consultar(consulta, {'desde': desde})
+        return df if not df.empty else None
+    
+    def treinar_modelo_series(self, nivel='categoria', dias_historico=365):
+        """
+        Treina um único modelo para todas as séries de um nível (produto ou
+        categoria), usado por prever_vendas_series
+        
+        As features são as de previsao_demanda.montar_features_series (as mesmas
+        da previsão); os últimos 20% dos dias de cada série ficam para a avaliação
+        e o modelo final é treinado com todos os dias. O modelo fica em
+        self.models['previsao_vendas_<nivel>'].
+        """
+        from .previsao_demanda import montar_features_series
+        
+        print(f"Preparando séries de vendas por {nivel}...")
+        historico = self.carregar_series_vendas(nivel, dias_historico)
+        if historico is None:
+            print("Dados insuficientes para treinar o modelo de séries")
+            return None
+        
+        series, X, y = montar_features_series(historico)
+        dias = len(X) // len(series) if len(series) else 0
+        corte = int(dias * 0.8)
+        if corte < 30 or corte == dias:
+            print("Dados insuficientes para treinar o modelo de séries")
+            return None
+        
+        nome = f'previsao_vendas_{nivel}'
+        parametros = {**PARAMETROS_PREVISAO_VENDAS, **self.parametros.get(nome, {})}
+        treino = np.tile(np.arange(dias), len(series)) < corte
+        
+        scaler = StandardScaler().fit(X[treino])
+        model = RandomForestRegressor(n_jobs=-1, **parametros)
+        model.fit(scaler.transform(X[treino]), y[treino])
+        rmse = float(np.sqrt(mean_squared_error(y[~treino], model.predict(scaler.transform(X[~treino])))))
+        
+        scaler = StandardScaler().fit(X)
+        model = RandomForestRegressor(n_jobs=-1, **parametros)
+        model.fit(scaler.transform(X), y)
+        self.models[nome] = model
+        self.scalers[nome] = scaler
+        
+        resultado = {
+            'modelo': 'RandomForestRegressor',
+            'nivel': nivel,
+            'total_series': len(series),
+            'rmse': rmse,
+            'parametros': parametros,
+            'data_treino': datetime.now().isoformat()
+        }
+        self._guardar_metricas(nome, resultado)
+        
+        print(f"Modelo de séries por {nivel} treinado com {len(series)} séries! RMSE: {rmse:.2f}")
+        return resultado
+    
+    def prever_vendas_series(self, historico, nivel='categoria', dias_futuro=7):
+        """
+        Previsões para várias séries de um nível de uma vez (ex.:
+        carregar_series_vendas), com o modelo do nível (treinar_modelo_series)
+        
+        Returns:
+            DataFrame: serie, data, horizonte, vendas_previstas
+        """
+        nome_modelo = f'previsao_vendas_{nivel}'
+        if nome_modelo not in self.models:
+            print(f"Modelo de séries por {nivel} não encontrado. Treine o modelo primeiro.")
+            return None
+        if historico is None or historico.empty:
+            return None
+        
+        return prever_series(self.models[nome_modelo], self.scalers[nome_modelo], historico, dias_futuro)
+    
+    def treinar_modelos_demanda(self, nivel='categoria', dias_historico=365, max_workers=None):
+        """
+        Treina um modelo de demanda por série (produto ou categoria) em paralelo
+        
+        O conjunto de modelos fica em self.models['demanda_<nivel>'] e é salvo
+        junto com os demais modelos.
+        """
+        from .previsao_demanda import treinar_modelos_demanda
+        
+        print(f"Preparando séries de vendas por {nivel}...")
+        historico = self.carregar_series_vendas(nivel, dias_historico)
+        if historico is None:
+            print("Dados insuficientes para treinar os modelos de demanda")
+            return None
+        
+        conjunto = treinar_modelos_demanda(historico, nivel, max_workers=max_workers)
+        self.models[f'demanda_{nivel}'] = conjunto
+        
+        rmses = [m['rmse'] for m in conjunto.metricas.values() if m['status'] == 'ok']
+        resultado = {
+            'nivel': nivel,
+            'total_series': len(conjunto.metricas),
+            'modelos_treinados': len(conjunto),
+            'series_sem_modelo': len(conjunto.metricas) - len(conjunto),
+            'rmse_mediano': float(np.median(rmses)) if rmses else None,
+            'data_treino': conjunto.data_treino
+        }
+        
+        self._guardar_metricas(f'demanda_{nivel}', resultado)
+        print(f"{len(conjunto)} modelos de demanda treinados ({nivel})")
+        return resultado
+    
+    def prever_demanda(self, nivel='categoria', dias_futuro=7):
+        """
+        Previsão de demanda de cada produto ou categoria com o seu modelo
+        
+        Returns:
+            DataFrame: serie, data, horizonte, vendas_previstas
+        """
+        conjunto = self.models.get(f'demanda_{nivel}')
+        if conjunto is None:
+            print(f"Modelos de demanda por {nivel} não encontrados. Treine os modelos primeiro.")
+            return None
         
-        return previsoes
+        historico = self.carregar_series_vendas(nivel, 30)
+        if historico is None:
+            return None
+        return conjunto.prever(historico, dias_futuro)
     
     def preparar_dados_segmentacao_clientes(self):
         """
         Prepara dados para segmentação de clientes
         """
-        query = """
-        SELECT 
-            c.id_cliente,
-            c.nome,
-            DATEDIFF(CURDATE(), c.data_cadastro) as dias_desde_cadastro,
-            COUNT(p.id_pedido) as total_pedidos,
-            COALESCE(SUM(p.valor_total), 0) as valor_total_gasto,
-            COALESCE(AVG(p.valor_total), 0) as ticket_medio,
-            COALESCE(MAX(p.data_pedido), c.data_cadastro) as ultimo_pedido,
-            DATEDIFF(CURDATE(), COALESCE(MAX(p.data_pedido), c.data_cadastro)) as dias_desde_ultimo_pedido,
-            COUNT(DISTINCT DATE(p.data_pedido)) as dias_com_compras
-        FROM clientes c
-        LEFT JOIN pedidos p ON c.id_cliente = p.id_cliente AND p.status != 'cancelado'
-        WHERE c.ativo = 1
-        GROUP BY c.id_cliente, c.nome, c.data_cadastro
-        """
-        
-        result = self.session.execute(query)
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        df = self._consultar('ml_dados_segmentacao_clientes')
         
         if not df.empty:
             # Calcular features adicionais
@@ -263,41 +657,10 @@ class RDSMLIntegration:
             print("Dados insuficientes para segmentação")
             return None
         
-        # Calcular scores RFM (1-5, onde 5 é melhor)
-        df['R_score'] = pd.qcut(df['dias_desde_ultimo_pedido'], 5, labels=[5,4,3,2,1])
-        df['F_score'] = pd.qcut(df['total_pedidos'].rank(method='first'), 5, labels=[1,2,3,4,5])
-        df['M_score'] = pd.qcut(df['valor_total_gasto'], 5, labels=[1,2,3,4,5])
-        
-        # Converter para numérico
-        df['R_score'] = df['R_score'].astype(int)
-        df['F_score'] = df['F_score'].astype(int)
-        df['M_score'] = df['M_score'].astype(int)
-        
-        # Criar score RFM combinado
-        df['RFM_score'] = df['R_score'].astype(str) + df['F_score'].astype(str) + df['M_score'].astype(str)
-        
-        # Definir segmentos baseados no score RFM
-        def definir_segmento(row):
-            score = row['RFM_score']
-            r, f, m = int(score[0]), int(score[1]), int(score[2])
-            
-            if r >= 4 and f >= 4 and m >= 4:
-                return 'Champions'
-            elif r >= 3 and f >= 3 and m >= 3:
-                return 'Loyal Customers'
-            elif r >= 4 and f <= 2:
-                return 'New Customers'
-            elif r <= 2 and f >= 3:
-                return 'At Risk'
-            elif r <= 2 and f <= 2:
-                return 'Lost Customers'
-            else:
-                return 'Regular Customers'
-        
-        df['segmento'] = df.apply(definir_segmento, axis=1)
+        atribuir_segmentos_rfm(df)
         
         # Estatísticas por segmento
-        segmentos_stats = df.groupby('segmento').agg({
+        segmentos_stats = df.groupby('segmento', observed=True).agg({
             'id_cliente': 'count',
             'valor_total_gasto': ['sum', 'mean'],
             'total_pedidos': 'mean',
@@ -308,7 +671,7 @@ class RDSMLIntegration:
         resultado = {
             'total_clientes': len(df),
             'segmentos_stats': segmentos_stats.to_dict(),
-            'distribuicao_segmentos': df['segmento'].value_counts().to_dict(),
+            'distribuicao_segmentos': df['segmento'].value_counts().loc[lambda c: c > 0].to_dict(),
             'clientes_segmentados': df[['id_cliente', 'nome', 'segmento', 'RFM_score', 
                                       'valor_total_gasto', 'total_pedidos']].to_dict('records')
         }
@@ -319,24 +682,13 @@ class RDSMLIntegration:
         """
         Detecta anomalias nas vendas usando métodos estatísticos
         """
-        query = """
-        SELECT 
-            DATE(data_pedido) as data,
-            SUM(valor_total) as total_vendas,
-            COUNT(*) as total_pedidos
-        FROM pedidos 
-        WHERE data_pedido >= DATE_SUB(CURDATE(), INTERVAL :dias DAY)
-        AND status != 'cancelado'
-        GROUP BY DATE(data_pedido)
-        ORDER BY data
-        """
-        
-        result = self.session.execute(query, {'dias': janela_dias})
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        df = self._carregar_vendas_diarias(janela_dias)
         
         if df is None or len(df) < 7:
             return None
         
+        df = df[['data', 'total_vendas', 'total_pedidos']].copy()
+        
         # Calcular estatísticas
         media = df['total_vendas'].mean()
         desvio = df['total_vendas'].std()
@@ -366,39 +718,114 @@ class RDSMLIntegration:
         
         return resultado
     
-    def salvar_modelos(self, diretorio='models'):
+    def monitorar_anomalias_vendas(self, caminho_estado=ARQUIVO_ESTADO_ANOMALIAS):
+        """
+        Versão contínua de detectar_anomalias_vendas
+        
+        Retoma o detector online salvo em caminho_estado, processa apenas os dias
+        fechados desde a última execução e salva o novo estado; o custo não depende
+        do tamanho da janela.
+        """
+        detector = carregar_detector(caminho_estado)
+        # Repetir é seguro: o detector ignora os dias que já recebeu
+        avaliacoes = executar_com_retry(lambda session: processar_novos_dias(session, detector))
+        salvar_detector(detector, caminho_estado)
+        
+        resultado = detector.resumo()
+        resultado['dias_processados'] = len(avaliacoes)
+        resultado['anomalias_detectadas'] = [a for a in avaliacoes if a['anomalia']]
+        resultado['avaliacoes'] = avaliacoes
+        return resultado
+    
+    def _guardar_metricas(self, nome, resultado):
+        """
+        Guarda o resultado de um treino (sem listas, como feature_importance)
+        e a VERSAO_FEATURES usada para os metadados da versão publicada por
+        salvar_modelos
+        """
+        self.metricas[nome] = {chave: valor for chave, valor in resultado.items()
+                               if not isinstance(valor, list)}
+        self.metricas[nome]['versao_features'] = VERSAO_FEATURES
+    
+    def salvar_modelos(self, diretorio=None):
         """
-        Salva os modelos treinados em disco
+        Publica os modelos treinados no registro de modelos (uma nova versão por
+        modelo), com as métricas do último treino e os parâmetros escolhidos (ex.:
+        pelo backtesting) de cada um nos metadados
+        
+        Args:
+            diretorio (str): Diretório do registro (padrão: ML_REGISTRO_DIR)
+        
+        Returns:
+            dict: Nome do modelo -> versão publicada
         """
-        if not os.path.exists(diretorio):
-            os.makedirs(diretorio)
+        registro = criar_registro(diretorio)
+        versoes = {}
         
         for nome, modelo in self.models.items():
-            caminho_modelo = os.path.join(diretorio, f'{nome}_model.joblib')
-            joblib.dump(modelo, caminho_modelo)
-            
+            artefatos = {'modelo': modelo}
             if nome in self.scalers:
-                caminho_scaler = os.path.join(diretorio, f'{nome}_scaler.joblib')
-                joblib.dump(self.scalers[nome], caminho_scaler)
+                artefatos['scaler'] = self.scalers[nome]
+            
+            watermark = None
+            if nome in self.estado_treino:
+                artefatos['estado'] = self.estado_treino[nome]
+                watermark = resolver_artefato(self.estado_treino[nome]).get('ultima_data')
+            elif hasattr(resolver_artefato(modelo), 'data_treino'):
+                watermark = resolver_artefato(modelo).data_treino
+            
+            versoes[nome] = registro.publicar(nome, artefatos, watermark=watermark,
+                                              metricas=self.metricas.get(nome),
+                                              parametros=self.parametros.get(nome))
         
-        print(f"Modelos salvos em: {diretorio}")
+        print(f"Modelos publicados em: {registro.diretorio} ({versoes})")
+        return versoes
     
-    def carregar_modelos(self, diretorio='models'):
+    def carregar_modelos(self, diretorio=None, versoes=None, lazy=True):
         """
-        Carrega modelos salvos do disco
-        """
-        for arquivo in os.listdir(diretorio):
-            if arquivo.endswith('_model.joblib'):
-                nome = arquivo.replace('_model.joblib', '')
-                caminho_modelo = os.path.join(diretorio, arquivo)
-                self.models[nome] = joblib.load(caminho_modelo)
-                
-                # Carregar scaler correspondente se existir
-                caminho_scaler = os.path.join(diretorio, f'{nome}_scaler.joblib')
-                if os.path.exists(caminho_scaler):
-                    self.scalers[nome] = joblib.load(caminho_scaler)
+        Carrega a versão ativa (ou a indicada em versoes) de cada modelo do registro
+        
+        Com lazy=True cada artefato só é lido do disco no primeiro uso. As
+        métricas e os parâmetros publicados com cada versão voltam para
+        self.metricas e self.parametros. Modelos treinados com outra
+        VERSAO_FEATURES não são carregados (precisam de um treino completo),
+        mas os parâmetros publicados com eles são mantidos.
+        
+        Args:
+            diretorio (str): Diretório do registro (padrão: ML_REGISTRO_DIR)
+            versoes (dict): Nome do modelo -> versão a carregar
+            lazy (bool): Carregar os artefatos sob demanda
         
-        print(f"Modelos carregados de: {diretorio}")
+        Returns:
+            dict: Nome do modelo -> metadados da versão carregada
+        """
+        registro = criar_registro(diretorio)
+        versoes = versoes or {}
+        carregados = {}
+        
+        for nome in registro.nomes():
+            artefatos, metadados = registro.carregar(nome, versoes.get(nome), lazy=lazy)
+            if artefatos is None:
+                continue
+            if metadados.get('parametros'):
+                self.parametros[nome] = metadados['parametros']
+            versao_features = metadados.get('metricas', {}).get('versao_features')
+            if versao_features != VERSAO_FEATURES:
+                print(f"Modelo {nome} v{metadados['versao']} usa features da versão {versao_features} "
+                      f"(atual {VERSAO_FEATURES}); treine-o de novo")
+                continue
+            
+            self.models[nome] = artefatos['modelo']
+            if 'scaler' in artefatos:
+                self.scalers[nome] = artefatos['scaler']
+            if 'estado' in artefatos:
+                self.estado_treino[nome] = artefatos['estado']
+            self.metricas[nome] = metadados.get('metricas', {})
+            carregados[nome] = metadados
+        
+        descricao = ', '.join(f"{nome} v{metadados['versao']}" for nome, metadados in carregados.items())
+        print(f"Modelos carregados de: {registro.diretorio} ({descricao})")
+        return carregados
     
     def close(self):
         """
@@ -3,7 +3,8 @@ Modelos de dados para o projeto Amazon RDS
 Define as tabelas e relacionamentos do banco de dados
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text, Boolean
+from sqlalchemy import (Column, Integer, BigInteger, String, Date, DateTime, Float, Numeric, ForeignKey,
+                        Text, Boolean)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .connection import Base
@@ -60,6 +61,7 @@ class Pedido(Base):
     status = Column(String(50), default='pendente')  # pendente, processando, enviado, entregue, cancelado
     valor_total = Column(Float, default=0.0)
     observacoes = Column(Text)
+    lote_ingestao = Column(String(32), index=True)  # lote da ingestão em massa que gravou o pedido
     
     # Relacionamentos
     cliente = relationship("Cliente", back_populates="pedidos")
@@ -103,6 +105,83 @@ class LogAnalytics(Base):
     def __repr__(self):
         return f"<LogAnalytics(id={self.id_log}, tipo='{self.tipo_analise}', data={self.data_execucao})>"
 
+class VendaDiaria(Base):
+    """
+    Rollup diário de vendas (pedidos não cancelados), mantido por rollups.py
+    """
+    __tablename__ = 'vendas_diarias'
+    
+    data = Column(Date, primary_key=True)
+    total_pedidos = Column(Integer, nullable=False, default=0)
+    total_vendas = Column(Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<VendaDiaria(data={self.data}, pedidos={self.total_pedidos}, vendas={self.total_vendas})>"
+
+class VendaProduto(Base):
+    """
+    Rollup de vendas por produto (totais de pedidos não cancelados), mantido por rollups.py
+    """
+    __tablename__ = 'vendas_produto'
+    
+    id_produto = Column(Integer, ForeignKey('produtos.id_produto'), primary_key=True)
+    quantidade_vendida = Column(Integer, nullable=False, default=0, index=True)
+    receita_total = Column(Numeric(14, 2, asdecimal=False), nullable=False, default=0.0, index=True)
+    total_pedidos = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<VendaProduto(produto_id={self.id_produto}, qtd={self.quantidade_vendida}, receita={self.receita_total})>"
+
+class VendaProdutoDiaria(Base):
+    """
+    Rollup de vendas por produto e dia, mantido por rollups.py
+    """
+    __tablename__ = 'vendas_produto_diarias'
+    
+    data = Column(Date, primary_key=True)
+    id_produto = Column(Integer, ForeignKey('produtos.id_produto'), primary_key=True, index=True)
+    quantidade_vendida = Column(Integer, nullable=False, default=0)
+    receita_total = Column(Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    total_pedidos = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<VendaProdutoDiaria(data={self.data}, produto_id={self.id_produto}, qtd={self.quantidade_vendida})>"
+
+class FeatureCliente(Base):
+    """
+    Estatísticas RFM por cliente (pedidos não cancelados), mantidas por rollups.py
+    """
+    __tablename__ = 'features_clientes'
+    
+    id_cliente = Column(Integer, ForeignKey('clientes.id_cliente'), primary_key=True)
+    ultimo_pedido = Column(DateTime)
+    total_pedidos = Column(Integer, nullable=False, default=0)
+    valor_total_gasto = Column(Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    dias_com_compras = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<FeatureCliente(cliente_id={self.id_cliente}, pedidos={self.total_pedidos}, valor={self.valor_total_gasto})>"
+
+class Watermark(Base):
+    """
+    Posição dos jobs incrementais (ex.: último id_pedido processado)
+    """
+    __tablename__ = 'watermarks'
+    
+    nome = Column(String(100), primary_key=True)
+    valor = Column(BigInteger, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<Watermark(nome='{self.nome}', valor={self.valor})>"
+
+# Registra os eventos do ORM que mantêm os rollups (vendas_diarias, vendas_produto,
+# features_clientes)
+from . import rollups
+
 # Funções utilitárias para trabalhar com os modelos
 
 def criar_tabelas(engine):
@@ -171,4 +250,9 @@ if __name__ == "__main__":
     print("- Pedido")
     print("- ItemPedido")
     print("- LogAnalytics")
+    print("- VendaDiaria")
+    print("- VendaProduto")
+    print("- VendaProdutoDiaria")
+    print("- FeatureCliente")
+    print("- Watermark")
 
@@ -0,0 +1,333 @@
+"""
+Predição online para a API
+Serve previsões de vendas e segmentos RFM a partir dos modelos do registro já
+carregados no processo; requisições concorrentes são agrupadas em micro-lotes
+(uma chamada de predict/consulta por lote) e os segmentos ficam em cache por cliente
+"""
+
+import os
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+import pandas as pd
+from .cache import CacheLRU
+from ..database.connection import get_db_session
+from ..database.consultas import consultas
+from ..analytics.ml_integration import (RDSMLIntegration, prever_series, limites_rfm, pontuar_rfm,
+                                        JANELA_PREVISAO)
+from ..analytics.feature_store import feature_store_vendas
+from ..analytics.registro_modelos import resolver_artefato
+
+logger = logging.getLogger(__name__)
+
+# Marcador em cache de um cliente inexistente ou inativo (cache negativo)
+_CLIENTE_DESCONHECIDO = {}
+
+class MicroBatcher:
+    """
+    Agrupa itens submetidos por várias threads em lotes processados por uma
+    única thread
+    
+    O primeiro item de um lote espera no máximo espera_maxima segundos por
+    outros itens (ou até max_lote itens); processar_lote recebe a lista de
+    itens e retorna a lista de resultados na mesma ordem. Uma exceção em
+    processar_lote, ou uma lista de resultados de tamanho diferente do lote, é
+    repassada a todos os itens do lote: nenhum Future fica sem resposta.
+    """
+    
+    def __init__(self, processar_lote, max_lote=64, espera_maxima=0.002, nome='micro-batcher'):
+        self.processar_lote = processar_lote
+        self.max_lote = max_lote
+        self.espera_maxima = espera_maxima
+        self.nome = nome
+        self._fila = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.lotes = 0
+        self.itens = 0
+        self.maior_lote = 0
+    
+    def _garantir_thread(self):
+        # Iniciada no primeiro uso e de novo após fork (workers do gunicorn):
+        # threads não sobrevivem ao fork do processo
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._fila = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._executar, name=self.nome, daemon=True)
+                self._thread.start()
+    
+    def submeter(self, item, timeout=None):
+        """
+        Envia um item e espera o resultado do lote em que ele for processado
+        """
+        self._garantir_thread()
+        futuro = Future()
+        self._fila.put((item, futuro))
+        return futuro.result(timeout)
+    
+    def _proximo_lote(self):
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + self.espera_maxima
+        while len(lote) < self.max_lote:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+    
+    def _executar(self):
+        while True:
+            lote = self._proximo_lote()
+            itens = [item for item, _ in lote]
+            try:
+                resultados = list(self.processar_lote(itens))
+                if len(resultados) != len(itens):
+                    raise RuntimeError(f"{len(resultados)} resultados para um lote de {len(itens)} itens")
+            except Exception as e:
+                logger.error(f"Erro no lote de {len(itens)} itens ({self.nome}): {e}")
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+            else:
+                for (_, futuro), resultado in zip(lote, resultados):
+                    futuro.set_result(resultado)
+            
+            self.lotes += 1
+            self.itens += len(lote)
+            self.maior_lote = max(self.maior_lote, len(lote))
+    
+    def estatisticas(self):
+        return {
+            'lotes': self.lotes,
+            'itens': self.itens,
+            'tamanho_medio_lote': self.itens / self.lotes if self.lotes else 0.0,
+            'maior_lote': self.maior_lote
+        }
+
+class ServicoPredicaoML:
+    """
+    Previsões de vendas e segmentos RFM para requisições online
+    
+    - Previsão: o histórico recente é mantido em memória e, a cada
+      ttl_historico segundos, atualizado por uma thread em segundo plano
+      (só a primeira carga é feita no lote); até a atualização terminar, os
+      lotes seguem com o histórico atual. As requisições de um micro-lote são
+      atendidas por uma única previsão com o maior horizonte pedido,
+      reaproveitada até o histórico mudar.
+    - Segmento: clientes ausentes do cache de um micro-lote são buscados em uma
+      única consulta e pontuados com os quintis da última segmentação completa
+      (limites_rfm), recalculados a cada ttl_limites segundos. Ids sem cliente
+      ativo também ficam em cache, por ttl_desconhecido segundos, para que
+      ids inválidos repetidos não voltem ao banco a cada requisição.
+    
+    O serviço não mantém sessão aberta: cada leitura do banco (histórico,
+    limites, segmentos) usa uma sessão de leitura curta, fechada ao fim.
+    """
+    
+    def __init__(self, ml=None, max_lote=64, espera_maxima=0.002, ttl_historico=60,
+                 ttl_segmento=300, ttl_limites=3600, max_clientes_cache=100000,
+                 ttl_desconhecido=60):
+        self.ml = ml or RDSMLIntegration()
+        self.ttl_historico = ttl_historico
+        self.ttl_segmento = ttl_segmento
+        self.ttl_desconhecido = ttl_desconhecido
+        self.ttl_limites = ttl_limites
+        self.cache_segmentos = CacheLRU(max_clientes_cache)
+        self.batcher_previsao = MicroBatcher(self._prever_lote, max_lote, espera_maxima, 'ml-previsao')
+        self.batcher_segmento = MicroBatcher(self._segmentar_lote, max_lote, espera_maxima, 'ml-segmento')
+        self.metadados_modelos = {}
+        self._previsao = None  # previsão do histórico atual (maior horizonte já pedido)
+        self._historico = None
+        self._historico_em = 0.0
+        self._historico_novo = None  # (histórico,) entregue pela thread de atualização
+        self._thread_historico = None
+        self._limites = None
+        self._limites_em = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def carregar(self, diretorio=None):
+        """
+        Carrega os modelos ativos do registro e os quintis RFM
+        
+        Os artefatos do modelo de previsão são resolvidos aqui, para que a
+        primeira requisição não pague a leitura do disco.
+        """
+        self.metadados_modelos = self.ml.carregar_modelos(diretorio)
+        
+        if 'previsao_vendas' in self.ml.models:
+            self.ml.models['previsao_vendas'] = resolver_artefato(self.ml.models['previsao_vendas'])
+            self.ml.scalers['previsao_vendas'] = resolver_artefato(self.ml.scalers['previsao_vendas'])
+        
+        self._atualizar_limites()
+        return True
+    
+    @property
+    def pronto(self):
+        return 'previsao_vendas' in self.ml.models
+    
+    # Previsão de vendas
+    
+    def _carregar_historico(self):
+        # Dias novos lidos por _carregar_vendas_diarias: cada consulta abre uma
+        # sessão de leitura curta (executar_com_retry), fechada ao fim, em vez
+        # de reutilizar uma sessão de longa duração entre atualizações
+        feature_store_vendas.sincronizar(self.ml._carregar_vendas_diarias)
+        df = feature_store_vendas.recentes(JANELA_PREVISAO)
+        return df.assign(serie='total') if df is not None and not df.empty else None
+    
+    def _atualizar_historico(self):
+        try:
+            self._historico_novo = (self._carregar_historico(),)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar o histórico de vendas: {e}")
+    
+    def _historico_recente(self):
+        """
+        Histórico usado pelo lote atual (chamado só pela thread do batcher)
+        
+        A thread de atualização apenas entrega o histórico novo; a troca, e o
+        descarte da previsão feita sobre o anterior, acontecem aqui.
+        """
+        novo = self._historico_novo
+        if novo is not None:
+            self._historico_novo = None
+            self._historico = novo[0]
+            self._previsao = None
+        
+        agora = time.monotonic()
+        if self._historico_em == 0.0:
+            # Primeira carga: sem histórico ainda, o lote espera por ele
+            self._historico = self._carregar_historico()
+            self._historico_em = agora
+            self._previsao = None
+        elif agora - self._historico_em > self.ttl_historico and not (
+                self._thread_historico is not None and self._thread_historico.is_alive()):
+            self._historico_em = agora
+            self._thread_historico = threading.Thread(target=self._atualizar_historico,
+                                                      name='ml-historico', daemon=True)
+            self._thread_historico.start()
+        return self._historico
+    
+    def _prever_lote(self, horizontes):
+        historico = self._historico_recente()
+        if historico is None:
+            return [None] * len(horizontes)
+        
+        maior = max(horizontes)
+        if self._previsao is None or len(self._previsao) < maior:
+            self._previsao = prever_series(self.ml.models['previsao_vendas'],
+                                           self.ml.scalers['previsao_vendas'], historico, maior)
+        
+        return [[{
+            'data': data.strftime('%Y-%m-%d'),
+            'vendas_previstas': float(valor),
+            'dia_semana': data.strftime('%A')
+        } for data, valor in zip(self._previsao['data'][:h], self._previsao['vendas_previstas'][:h])]
+            for h in horizontes]
+    
+    def prever_vendas(self, dias_futuro=7, timeout=5):
+        """
+        Previsão de vendas dos próximos dias (None sem modelo ou sem histórico)
+        """
+        if not self.pronto:
+            return None
+        return self.batcher_previsao.submeter(dias_futuro, timeout)
+    
+    # Segmentos RFM
+    
+    def _atualizar_limites(self):
+        session = get_db_session(readonly=True)
+        try:
+            result = consultas.executar(session, 'ml_dados_segmentacao_clientes')
+            df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        finally:
+            session.close()
+        if not df.empty:
+            self._limites = limites_rfm(df)
+        self._limites_em = time.monotonic()
+    
+    def _segmentar_lote(self, ids_clientes):
+        if self._limites is None or time.monotonic() - self._limites_em > self.ttl_limites:
+            self._atualizar_limites()
+        if self._limites is None:
+            return [None] * len(ids_clientes)
+        
+        session = get_db_session(readonly=True)
+        try:
+            result = consultas.executar(session, 'ml_features_rfm_clientes', {'ids': sorted(set(ids_clientes))})
+            df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        finally:
+            session.close()
+        
+        segmentos = {}
+        if not df.empty:
+            pontuar_rfm(df, self._limites)
+        for linha in df.itertuples(index=False):
+            segmento = {
+                'id_cliente': int(linha.id_cliente),
+                'segmento': linha.segmento,
+                'RFM_score': linha.RFM_score,
+                'dias_desde_ultimo_pedido': int(linha.dias_desde_ultimo_pedido),
+                'total_pedidos': int(linha.total_pedidos),
+                'valor_total_gasto': float(linha.valor_total_gasto)
+            }
+            segmentos[segmento['id_cliente']] = segmento
+            self.cache_segmentos.definir(segmento['id_cliente'], segmento, self.ttl_segmento)
+        
+        for id_cliente in set(ids_clientes) - set(segmentos):
+            self.cache_segmentos.definir(id_cliente, _CLIENTE_DESCONHECIDO, self.ttl_desconhecido)
+        return [segmentos.get(id_cliente) for id_cliente in ids_clientes]
+    
+    def segmento_cliente(self, id_cliente, timeout=5):
+        """
+        Segmento RFM de um cliente (None se o cliente não existir ou estiver inativo)
+        """
+        segmento = self.cache_segmentos.obter(id_cliente)
+        if segmento is not None:
+            self.cache_hits += 1
+            return segmento if segmento is not _CLIENTE_DESCONHECIDO else None
+        self.cache_misses += 1
+        return self.batcher_segmento.submeter(id_cliente, timeout)
+    
+    def invalidar_segmentos(self):
+        self.cache_segmentos.limpar()
+    
+    def estatisticas(self):
+        consultas_cache = self.cache_hits + self.cache_misses
+        return {
+            'modelos': {nome: m['versao'] for nome, m in self.metadados_modelos.items()},
+            'previsao': self.batcher_previsao.estatisticas(),
+            'segmento': self.batcher_segmento.estatisticas(),
+            'cache_segmentos': {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'taxa_hit': self.cache_hits / consultas_cache if consultas_cache else 0.0
+            }
+        }
+
+def criar_servico_predicao():
+    """
+    Cria o serviço de predição a partir de variáveis de ambiente
+    
+    Variáveis:
+        ML_ONLINE_MAX_LOTE: Máximo de requisições por micro-lote (padrão 64)
+        ML_ONLINE_ESPERA_MS: Espera máxima para formar um micro-lote (padrão 2 ms)
+        ML_ONLINE_TTL_SEGMENTO: TTL em segundos do segmento em cache (padrão 300)
+        ML_ONLINE_TTL_DESCONHECIDO: TTL em segundos de um id sem cliente ativo
+            em cache (padrão 60)
+    """
+    return ServicoPredicaoML(
+        max_lote=int(os.getenv('ML_ONLINE_MAX_LOTE', 64)),
+        espera_maxima=float(os.getenv('ML_ONLINE_ESPERA_MS', 2)) / 1000,
+        ttl_segmento=float(os.getenv('ML_ONLINE_TTL_SEGMENTO', 300)),
+        ttl_desconhecido=float(os.getenv('ML_ONLINE_TTL_DESCONHECIDO', 60))
+    )
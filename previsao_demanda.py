@@ -0,0 +1,225 @@
+"""
+Previsão de demanda por produto (SKU) e por categoria
+Treina um modelo por série em paralelo (um processo por núcleo), com a matriz de
+features compartilhada entre os processos por arquivos .npy mapeados em memória
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_squared_error
+from .ml_integration import FEATURES_PREVISAO_VENDAS, JANELA_PREVISAO, prever_series_recursivo
+from .feature_store import montar_features
+
+logger = logging.getLogger(__name__)
+
+# Séries com menos dias com venda que isso não recebem modelo próprio
+MINIMO_DIAS_COM_VENDA = int(os.getenv('DEMANDA_MINIMO_DIAS_COM_VENDA', 30))
+
+# Parâmetros dos modelos por série (menores que o modelo global: há milhares deles)
+PARAMETROS_MODELO_SERIE = {
+    'n_estimators': 50,
+    'max_depth': 8,
+    'min_samples_leaf': 2,
+    'random_state': 42
+}
+
+def montar_features_series(historico):
+    """
+    Monta a matriz de features de todas as séries de forma vetorizada
+    
+    Cada série é completada com os dias sem venda (0) e vira uma linha de uma
+    matriz séries x dias; as features vêm de feature_store.montar_features, a
+    mesma função usada na previsão (prever_series). Os primeiros
+    JANELA_PREVISAO dias de cada série (sem histórico para as features) são
+    descartados.
+    
+    Args:
+        historico (DataFrame): serie, data, total_vendas, total_pedidos
+    
+    Returns:
+        tuple: (series, X, y) onde X é float32 (linhas x FEATURES_PREVISAO_VENDAS),
+            y é float32 e as linhas da série i estão em [i * n, (i + 1) * n),
+            com n = X.shape[0] // len(series)
+    """
+    historico = historico.copy()
+    historico['data'] = pd.to_datetime(historico['data']).dt.normalize()
+    datas = pd.date_range(historico['data'].min(), historico['data'].max(), freq='D')
+    
+    def matriz(coluna):
+        return (historico.pivot_table(index='serie', columns='data', values=coluna, aggfunc='sum')
+                .reindex(columns=datas).fillna(0.0).to_numpy(dtype=np.float64))
+    
+    vendas = matriz('total_vendas')
+    pedidos = matriz('total_pedidos')
+    series = np.sort(historico['serie'].unique())
+    total_series, total_dias = vendas.shape
+    if total_dias <= JANELA_PREVISAO:
+        return series, np.empty((0, len(FEATURES_PREVISAO_VENDAS)), np.float32), np.empty(0, np.float32)
+    
+    colunas = montar_features(vendas, pedidos, datas)
+    
+    # (séries, dias, features) -> linhas agrupadas por série
+    X = np.stack([colunas[f][:, JANELA_PREVISAO:] for f in FEATURES_PREVISAO_VENDAS], axis=2)
+    X = X.reshape(-1, len(FEATURES_PREVISAO_VENDAS)).astype(np.float32)
+    y = vendas[:, JANELA_PREVISAO:].reshape(-1).astype(np.float32)
+    return series, X, y
+
+def _treinar_grupo_series(caminho_X, caminho_y, tarefas, linhas_por_serie, minimo_dias, parametros):
+    """
+    Treina os modelos de um grupo de séries (executado em um processo do pool)
+    
+    X e y são abertos com mmap_mode='r': cada processo lê só as linhas das suas
+    séries, sem cópia da matriz inteira pelo pickle do pool.
+    """
+    X = np.load(caminho_X, mmap_mode='r')
+    y = np.load(caminho_y, mmap_mode='r')
+    
+    resultados = []
+    for serie, indice in tarefas:
+        inicio = indice * linhas_por_serie
+        X_serie = np.asarray(X[inicio:inicio + linhas_por_serie])
+        y_serie = np.asarray(y[inicio:inicio + linhas_por_serie])
+        
+        dias_com_venda = int(np.count_nonzero(y_serie))
+        if dias_com_venda < minimo_dias:
+            resultados.append((serie, None, None, {'status': 'historico_insuficiente',
+                                                   'dias_com_venda': dias_com_venda}))
+            continue
+        
+        # Últimos 20% dos dias para avaliação, como no modelo global
+        corte = int(len(y_serie) * 0.8)
+        scaler = StandardScaler().fit(X_serie[:corte])
+        modelo = RandomForestRegressor(n_jobs=1, **parametros)
+        modelo.fit(scaler.transform(X_serie[:corte]), y_serie[:corte])
+        rmse = float(np.sqrt(mean_squared_error(y_serie[corte:], modelo.predict(scaler.transform(X_serie[corte:])))))
+        
+        # Modelo final com todos os dias
+        scaler = StandardScaler().fit(X_serie)
+        modelo = RandomForestRegressor(n_jobs=1, **parametros)
+        modelo.fit(scaler.transform(X_serie), y_serie)
+        resultados.append((serie, modelo, scaler, {'status': 'ok', 'rmse': rmse,
+                                                   'dias_com_venda': dias_com_venda}))
+    return resultados
+
+class ConjuntoModelosDemanda:
+    """
+    Modelos de previsão de demanda, um por série (produto ou categoria)
+    """
+    
+    def __init__(self, nivel, modelos=None, scalers=None, metricas=None, data_treino=None):
+        self.nivel = nivel
+        self.modelos = modelos or {}
+        self.scalers = scalers or {}
+        self.metricas = metricas or {}
+        self.data_treino = data_treino
+    
+    def __len__(self):
+        return len(self.modelos)
+    
+    def __repr__(self):
+        return f"<ConjuntoModelosDemanda(nivel='{self.nivel}', modelos={len(self.modelos)})>"
+    
+    def prever(self, historico, horizonte=7):
+        """
+        Previsão de cada série com o seu modelo (séries sem modelo são ignoradas)
+        
+        As features de todas as séries são montadas em uma matriz por dia à
+        frente (prever_series_recursivo) e normalizadas de uma vez com as médias
+        e escalas dos scalers empilhadas; só o predict é chamado modelo a modelo,
+        com a linha da sua série.
+        
+        Returns:
+            DataFrame: serie, data, horizonte, vendas_previstas
+        """
+        data_final = pd.to_datetime(historico['data']).max()
+        historico = historico[historico['serie'].isin(list(self.modelos))]
+        if historico.empty:
+            return None
+        
+        empilhados = {}
+        
+        def prever(series, X):
+            if not empilhados:
+                scalers = [self.scalers[serie] for serie in series]
+                empilhados['media'] = np.stack([s.mean_ for s in scalers])
+                empilhados['escala'] = np.stack([s.scale_ for s in scalers])
+                empilhados['modelos'] = [self.modelos[serie] for serie in series]
+            X = (X - empilhados['media']) / empilhados['escala']
+            return np.array([modelo.predict(X[i:i + 1])[0] for i, modelo in enumerate(empilhados['modelos'])])
+        
+        return prever_series_recursivo(historico, horizonte, prever, data_final)
+    
+    def salvar(self, caminho, compress=3):
+        """
+        Grava o conjunto em um único arquivo joblib comprimido
+        """
+        joblib.dump(self, caminho, compress=compress)
+    
+    @classmethod
+    def carregar(cls, caminho):
+        return joblib.load(caminho)
+
+def treinar_modelos_demanda(historico, nivel, max_workers=None, series_por_tarefa=50,
+                            minimo_dias=MINIMO_DIAS_COM_VENDA, parametros=None):
+    """
+    Treina um modelo por série em paralelo
+    
+    Args:
+        historico (DataFrame): serie, data, total_vendas, total_pedidos, ticket_medio
+            (ex.: RDSMLIntegration.carregar_series_vendas)
+        nivel (str): 'produto' ou 'categoria' (apenas informativo)
+        max_workers (int): Processos do pool (padrão: núcleos da máquina)
+        series_por_tarefa (int): Séries treinadas por tarefa enviada ao pool
+        minimo_dias (int): Dias com venda necessários para treinar uma série
+        parametros (dict): Parâmetros do RandomForestRegressor de cada série
+    
+    Returns:
+        ConjuntoModelosDemanda
+    """
+    parametros = parametros or PARAMETROS_MODELO_SERIE
+    inicio = time.perf_counter()
+    
+    series, X, y = montar_features_series(historico)
+    conjunto = ConjuntoModelosDemanda(nivel, data_treino=pd.Timestamp.now().isoformat())
+    if len(X) == 0:
+        return conjunto
+    linhas_por_serie = len(X) // len(series)
+    
+    diretorio = tempfile.mkdtemp(prefix='demanda-')
+    try:
+        caminho_X = os.path.join(diretorio, 'X.npy')
+        caminho_y = os.path.join(diretorio, 'y.npy')
+        np.save(caminho_X, X)
+        np.save(caminho_y, y)
+        del X, y
+        
+        tarefas = list(zip(series.tolist(), range(len(series))))
+        grupos = [tarefas[i:i + series_por_tarefa] for i in range(0, len(tarefas), series_por_tarefa)]
+        
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = [
+                executor.submit(_treinar_grupo_series, caminho_X, caminho_y, grupo,
+                                linhas_por_serie, minimo_dias, parametros)
+                for grupo in grupos
+            ]
+            for futuro in futuros:
+                for serie, modelo, scaler, metricas in futuro.result():
+                    conjunto.metricas[serie] = metricas
+                    if modelo is not None:
+                        conjunto.modelos[serie] = modelo
+                        conjunto.scalers[serie] = scaler
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    
+    logger.info(f"{len(conjunto)} modelos de demanda ({nivel}) treinados de {len(series)} séries "
+                f"em {time.perf_counter() - inicio:.1f}s")
+    return conjunto
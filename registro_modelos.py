@@ -0,0 +1,299 @@
+"""
+Registro versionado de modelos de ML
+Cada publicação grava uma nova versão imutável (nome + versão + watermark dos
+dados de treino) e troca a versão ativa de forma atômica; os artefatos são
+gravados sem compressão e carregados sob demanda
+"""
+
+import os
+import json
+import shutil
+import logging
+import threading
+from datetime import datetime
+import joblib
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_METADADOS = 'metadados.json'
+ARQUIVO_ATUAL = 'atual.json'
+
+class ArtefatoPreguicoso:
+    """
+    Proxy de um artefato do registro, carregado do disco só no primeiro uso
+    
+    Com mmap_mode='r' os arrays numpy gravados diretamente no artefato (ex.:
+    médias de um scaler, features em cache) são lidos do arquivo sem uma cópia
+    intermediária. Isso não vale para as árvores do scikit-learn: o
+    Tree.__setstate__ copia os nós para arrays próprios, então cada processo
+    que carrega um RandomForest tem a sua cópia em memória. O ganho para os
+    workers é carregar só os modelos que usam, quando os usam.
+    """
+    
+    def __init__(self, caminho, mmap_mode='r'):
+        object.__setattr__(self, '_caminho', caminho)
+        object.__setattr__(self, '_mmap_mode', mmap_mode)
+        object.__setattr__(self, '_objeto', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+    
+    @property
+    def carregado(self):
+        return self._objeto is not None
+    
+    def obter(self):
+        """
+        Retorna o artefato, carregando-o na primeira chamada
+        """
+        if self._objeto is None:
+            with self._lock:
+                if self._objeto is None:
+                    object.__setattr__(self, '_objeto', joblib.load(self._caminho, mmap_mode=self._mmap_mode))
+        return self._objeto
+    
+    def __getattr__(self, nome):
+        return getattr(self.obter(), nome)
+    
+    def __setattr__(self, nome, valor):
+        setattr(self.obter(), nome, valor)
+    
+    def __len__(self):
+        return len(self.obter())
+    
+    def __getitem__(self, chave):
+        return self.obter()[chave]
+    
+    def __contains__(self, chave):
+        return chave in self.obter()
+    
+    def __repr__(self):
+        if self._objeto is None:
+            return f"<ArtefatoPreguicoso(caminho='{self._caminho}', carregado=False)>"
+        return repr(self._objeto)
+
+def resolver_artefato(artefato):
+    """
+    Retorna o objeto real de um artefato (carregando-o se for um proxy)
+    """
+    if isinstance(artefato, ArtefatoPreguicoso):
+        return artefato.obter()
+    return artefato
+
+class RegistroModelos:
+    """
+    Registro de modelos em disco, com versões imutáveis e versão ativa por nome
+    
+    Layout:
+        <diretorio>/<nome>/
+            atual.json              (versão ativa e histórico de versões ativas)
+            v<n>/
+                metadados.json      (versão, watermark, métricas, parâmetros, data de publicação)
+                <artefato>.joblib   (ex.: modelo, scaler, estado)
+    
+    Uma versão é gravada em um diretório temporário e renomeada para v<n> já
+    completa; a versão ativa só muda quando atual.json é substituído
+    (os.replace), então leitores nunca veem uma versão pela metade.
+    """
+    
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+    
+    def _diretorio_modelo(self, nome):
+        return os.path.join(self.diretorio, nome)
+    
+    def _diretorio_versao(self, nome, versao):
+        return os.path.join(self._diretorio_modelo(nome), f'v{versao}')
+    
+    def _ler_json(self, caminho):
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _gravar_json_atomico(self, caminho, conteudo):
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(conteudo, f, default=str)
+        os.replace(temporario, caminho)
+    
+    def _ler_atual(self, nome):
+        return self._ler_json(os.path.join(self._diretorio_modelo(nome), ARQUIVO_ATUAL))
+    
+    def _ativar(self, nome, versao, historico):
+        self._gravar_json_atomico(os.path.join(self._diretorio_modelo(nome), ARQUIVO_ATUAL),
+                                  {'versao': versao, 'historico': historico})
+    
+    def nomes(self):
+        """
+        Nomes com ao menos uma versão ativa
+        """
+        if not os.path.isdir(self.diretorio):
+            return []
+        return sorted(nome for nome in os.listdir(self.diretorio) if self._ler_atual(nome) is not None)
+    
+    def versoes(self, nome):
+        """
+        Metadados de todas as versões publicadas de um modelo, da mais antiga à mais nova
+        """
+        diretorio = self._diretorio_modelo(nome)
+        if not os.path.isdir(diretorio):
+            return []
+        numeros = sorted(int(d[1:]) for d in os.listdir(diretorio) if d.startswith('v') and d[1:].isdigit())
+        return [self._ler_json(os.path.join(self._diretorio_versao(nome, n), ARQUIVO_METADADOS))
+                for n in numeros]
+    
+    def versao_atual(self, nome):
+        atual = self._ler_atual(nome)
+        return atual['versao'] if atual else None
+    
+    def publicar(self, nome, artefatos, watermark=None, metricas=None, parametros=None):
+        """
+        Grava uma nova versão do modelo e a torna ativa
+        
+        Args:
+            nome (str): Nome do modelo (ex.: 'previsao_vendas')
+            artefatos (dict): Nome do artefato -> objeto (ex.: {'modelo': ..., 'scaler': ...})
+            watermark: Marca dos dados de treino (ex.: último dia usado no treino)
+            metricas (dict): Métricas do treino, gravadas nos metadados
+            parametros (dict): Hiperparâmetros escolhidos para o modelo (ex.: pelo
+                backtesting), gravados nos metadados
+        
+        Returns:
+            int: Número da versão publicada
+        """
+        diretorio_modelo = self._diretorio_modelo(nome)
+        os.makedirs(diretorio_modelo, exist_ok=True)
+        temporario = os.path.join(diretorio_modelo, f".publicando-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+        
+        try:
+            # Sem compressão: arquivos comprimidos não podem ser lidos com mmap_mode
+            for artefato, objeto in artefatos.items():
+                joblib.dump(resolver_artefato(objeto), os.path.join(temporario, f'{artefato}.joblib'))
+            
+            with self._lock:
+                versoes = self.versoes(nome)
+                versao = (versoes[-1]['versao'] + 1) if versoes else 1
+                # Outro processo pode ter publicado a mesma versão: tenta a seguinte
+                while True:
+                    metadados = {
+                        'nome': nome,
+                        'versao': versao,
+                        'watermark': watermark.isoformat() if hasattr(watermark, 'isoformat') else watermark,
+                        'metricas': metricas or {},
+                        'parametros': parametros or {},
+                        'artefatos': sorted(artefatos),
+                        'publicado_em': datetime.now().isoformat()
+                    }
+                    self._gravar_json_atomico(os.path.join(temporario, ARQUIVO_METADADOS), metadados)
+                    try:
+                        os.rename(temporario, self._diretorio_versao(nome, versao))
+                        break
+                    except OSError:
+                        if not os.path.exists(self._diretorio_versao(nome, versao)):
+                            raise
+                        versao += 1
+                
+                atual = self._ler_atual(nome)
+                historico = (atual['historico'] if atual else []) + [versao]
+                self._ativar(nome, versao, historico)
+        finally:
+            shutil.rmtree(temporario, ignore_errors=True)
+        
+        logger.info(f"Modelo {nome} publicado na versão {versao} (watermark {metadados['watermark']})")
+        return versao
+    
+    def carregar(self, nome, versao=None, lazy=True, mmap_mode='r'):
+        """
+        Carrega os artefatos de uma versão (padrão: a versão ativa)
+        
+        Args:
+            lazy (bool): Retorna proxies carregados só no primeiro uso
+            mmap_mode (str): Modo de memory map dos arrays (None copia para a memória)
+        
+        Returns:
+            tuple: (dict artefato -> objeto, metadados), ou (None, None) se não existir
+        """
+        if versao is None:
+            versao = self.versao_atual(nome)
+            if versao is None:
+                return None, None
+        
+        diretorio = self._diretorio_versao(nome, versao)
+        metadados = self._ler_json(os.path.join(diretorio, ARQUIVO_METADADOS))
+        if metadados is None:
+            return None, None
+        
+        artefatos = {}
+        for artefato in metadados['artefatos']:
+            caminho = os.path.join(diretorio, f'{artefato}.joblib')
+            artefatos[artefato] = (ArtefatoPreguicoso(caminho, mmap_mode) if lazy
+                                   else joblib.load(caminho, mmap_mode=mmap_mode))
+        return artefatos, metadados
+    
+    def rollback(self, nome, versao=None):
+        """
+        Volta a versão ativa para a anterior (ou para uma versão específica)
+        
+        Returns:
+            int: Versão ativa após o rollback, ou None se não houver para onde voltar
+        """
+        with self._lock:
+            atual = self._ler_atual(nome)
+            if atual is None:
+                return None
+            historico = list(atual['historico'])
+            
+            if versao is None:
+                if len(historico) < 2:
+                    return None
+                historico.pop()
+                versao = historico[-1]
+            else:
+                if not os.path.isdir(self._diretorio_versao(nome, versao)):
+                    return None
+                historico.append(versao)
+            
+            self._ativar(nome, versao, historico)
+        
+        logger.info(f"Modelo {nome}: versão ativa voltou para {versao}")
+        return versao
+    
+    def remover_versoes_antigas(self, nome, manter=5):
+        """
+        Remove as versões mais antigas, mantendo as `manter` mais novas e a ativa
+        
+        As versões removidas saem também do histórico de atual.json (gravado
+        antes da remoção dos diretórios), então rollback() nunca volta para
+        uma versão que não existe mais.
+        
+        Returns:
+            list: Versões removidas
+        """
+        with self._lock:
+            atual = self._ler_atual(nome)
+            publicadas = [m['versao'] for m in self.versoes(nome)]
+            mantidas = set(publicadas[-manter:]) if manter > 0 else set()
+            if atual is not None:
+                mantidas.add(atual['versao'])
+                historico = [versao for versao in atual['historico'] if versao in mantidas]
+                if historico != atual['historico']:
+                    self._ativar(nome, atual['versao'], historico)
+            
+            removidas = [versao for versao in publicadas if versao not in mantidas]
+            for versao in removidas:
+                shutil.rmtree(self._diretorio_versao(nome, versao), ignore_errors=True)
+        
+        if removidas:
+            logger.info(f"Modelo {nome}: versões removidas {removidas}")
+        return removidas
+
+def criar_registro(diretorio=None):
+    """
+    Cria o registro de modelos a partir de variáveis de ambiente
+    
+    Variáveis:
+        ML_REGISTRO_DIR: Diretório do registro (padrão 'models')
+    """
+    return RegistroModelos(diretorio or os.getenv('ML_REGISTRO_DIR', 'models'))
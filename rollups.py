@@ -0,0 +1,626 @@
+"""
+Tabelas de resumo (rollups) mantidas incrementalmente
+vendas_diarias guarda, por dia, a quantidade e o valor dos pedidos não cancelados,
+vendas_produto / vendas_produto_diarias guardam quantidade, receita e pedidos por
+produto e features_clientes guarda as estatísticas RFM por cliente, então as
+análises leem linhas pré-agregadas em vez de agrupar pedidos e itens a cada chamada
+
+Os deltas de uma transação são acumulados na sessão e aplicados uma única vez,
+no commit: as linhas de rollup do dia e dos produtos mais vendidos, disputadas
+por muitos pedidos, ficam travadas só durante o commit, e não desde o primeiro
+pedido gravado
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+from .models import Pedido, ItemPedido
+
+logger = logging.getLogger(__name__)
+
+# Atributos de Pedido que alteram a contribuição do pedido nos rollups
+ATRIBUTOS_ROLLUP = ('status', 'valor_total', 'data_pedido')
+
+_SQL_APLICAR_VENDAS_DIARIAS = text("""
+INSERT INTO vendas_diarias (data, total_pedidos, total_vendas, atualizado_em)
+VALUES (:data, :total_pedidos, :total_vendas, :atualizado_em)
+ON DUPLICATE KEY UPDATE
+    total_pedidos = total_pedidos + VALUES(total_pedidos),
+    total_vendas = total_vendas + VALUES(total_vendas),
+    atualizado_em = VALUES(atualizado_em)
+""")
+
+_SQL_APLICAR_VENDAS_PRODUTO = text("""
+INSERT INTO vendas_produto (id_produto, quantidade_vendida, receita_total, total_pedidos, atualizado_em)
+VALUES (:id_produto, :quantidade, :receita, :pedidos, :atualizado_em)
+ON DUPLICATE KEY UPDATE
+    quantidade_vendida = quantidade_vendida + VALUES(quantidade_vendida),
+    receita_total = receita_total + VALUES(receita_total),
+    total_pedidos = total_pedidos + VALUES(total_pedidos),
+    atualizado_em = VALUES(atualizado_em)
+""")
+
+_SQL_APLICAR_VENDAS_PRODUTO_DIARIAS = text("""
+INSERT INTO vendas_produto_diarias (data, id_produto, quantidade_vendida, receita_total, total_pedidos)
+VALUES (:data, :id_produto, :quantidade, :receita, :pedidos)
+ON DUPLICATE KEY UPDATE
+    quantidade_vendida = quantidade_vendida + VALUES(quantidade_vendida),
+    receita_total = receita_total + VALUES(receita_total),
+    total_pedidos = total_pedidos + VALUES(total_pedidos)
+""")
+
+_SQL_ITENS_PEDIDO = text("""
+SELECT id_produto, SUM(quantidade), SUM(subtotal)
+FROM itens_pedido
+WHERE id_pedido = :id_pedido
+GROUP BY id_produto
+""")
+
+_SQL_PEDIDO_DO_ITEM = text("""
+SELECT
+    p.status,
+    p.data_pedido,
+    (SELECT COUNT(*) FROM itens_pedido
+     WHERE id_pedido = :id_pedido AND id_produto = :id_produto) as itens_mesmo_produto
+FROM pedidos p
+WHERE p.id_pedido = :id_pedido
+""")
+
+# Watermark (último id_pedido processado) do job de features de clientes
+WATERMARK_FEATURES_CLIENTES = 'features_clientes'
+
+# Maior id_pedido visto pelo job e quando (atualizado_em): limite seguro do
+# processamento depois de ATRASO_FEATURES_CLIENTES segundos
+WATERMARK_FEATURES_CLIENTES_VISTO = 'features_clientes_visto'
+
+# Duração máxima esperada de uma transação que grava pedidos
+ATRASO_FEATURES_CLIENTES = 300
+
+_SQL_ATUALIZAR_FEATURES_CLIENTES = text("""
+INSERT INTO features_clientes
+    (id_cliente, ultimo_pedido, total_pedidos, valor_total_gasto, dias_com_compras, atualizado_em)
+SELECT
+    n.id_cliente,
+    MAX(n.data_pedido),
+    COUNT(*),
+    SUM(n.valor_total),
+    COUNT(DISTINCT CASE WHEN NOT EXISTS (
+        SELECT 1 FROM pedidos a
+        WHERE a.id_cliente = n.id_cliente
+        AND a.id_pedido <= :de
+        AND a.status != 'cancelado'
+        AND a.data_pedido >= DATE(n.data_pedido)
+        AND a.data_pedido < DATE(n.data_pedido) + INTERVAL 1 DAY
+    ) THEN DATE(n.data_pedido) END),
+    UTC_TIMESTAMP()
+FROM pedidos n
+WHERE n.id_pedido > :de AND n.id_pedido <= :ate
+AND n.status != 'cancelado'
+GROUP BY n.id_cliente
+ON DUPLICATE KEY UPDATE
+    ultimo_pedido = GREATEST(COALESCE(ultimo_pedido, VALUES(ultimo_pedido)), VALUES(ultimo_pedido)),
+    total_pedidos = total_pedidos + VALUES(total_pedidos),
+    valor_total_gasto = valor_total_gasto + VALUES(valor_total_gasto),
+    dias_com_compras = dias_com_compras + VALUES(dias_com_compras),
+    atualizado_em = VALUES(atualizado_em)
+""")
+
+_SQL_RECALCULAR_FEATURE_CLIENTE = text("""
+INSERT INTO features_clientes
+    (id_cliente, ultimo_pedido, total_pedidos, valor_total_gasto, dias_com_compras, atualizado_em)
+SELECT
+    :id_cliente,
+    MAX(data_pedido),
+    COUNT(*),
+    COALESCE(SUM(valor_total), 0),
+    COUNT(DISTINCT DATE(data_pedido)),
+    UTC_TIMESTAMP()
+FROM pedidos
+WHERE id_cliente = :id_cliente
+AND status != 'cancelado'
+AND id_pedido <= (SELECT valor FROM watermarks WHERE nome = :watermark)
+ON DUPLICATE KEY UPDATE
+    ultimo_pedido = VALUES(ultimo_pedido),
+    total_pedidos = VALUES(total_pedidos),
+    valor_total_gasto = VALUES(valor_total_gasto),
+    dias_com_compras = VALUES(dias_com_compras),
+    atualizado_em = VALUES(atualizado_em)
+""")
+
+# Chave em session.info dos deltas pendentes de cada transação (SessionTransaction)
+_CHAVE_PENDENTES = 'rollups_pendentes'
+
+class DeltasPendentes:
+    """
+    Deltas dos rollups acumulados em uma transação, aplicados no commit
+    """
+    
+    def __init__(self):
+        self.diarias = defaultdict(lambda: (0, 0.0))
+        self.produto = defaultdict(lambda: (0, 0.0, 0))
+    
+    def somar(self, outros):
+        for deltas, outros_deltas in ((self.diarias, outros.diarias), (self.produto, outros.produto)):
+            for chave, valores in outros_deltas.items():
+                deltas[chave] = tuple(a + b for a, b in zip(deltas[chave], valores))
+
+def deltas_pendentes(session, transacao=None):
+    """
+    Deltas pendentes da transação corrente da sessão (a mais interna, se houver
+    savepoints), gravados ou descartados junto com ela
+    """
+    if transacao is None:
+        transacao = session.get_nested_transaction() or session.get_transaction()
+    return session.info.setdefault(_CHAVE_PENDENTES, {}).setdefault(transacao, DeltasPendentes())
+
+@event.listens_for(Session, 'before_commit')
+def _aplicar_pendentes(session):
+    """
+    No commit de um savepoint os deltas passam para a transação externa; no
+    commit da transação principal são gravados, antes do COMMIT
+    """
+    if not session.info.get(_CHAVE_PENDENTES) and not (session.new or session.dirty or session.deleted):
+        return
+    # O flush do commit ainda pode gerar deltas (eventos do ORM)
+    session.flush()
+    transacao = session.get_nested_transaction() or session.get_transaction()
+    deltas = session.info.get(_CHAVE_PENDENTES, {}).pop(transacao, None)
+    if deltas is None:
+        return
+    if transacao.nested:
+        deltas_pendentes(session, transacao.parent).somar(deltas)
+    else:
+        aplicar_vendas_diarias(session, deltas.diarias)
+        aplicar_vendas_produto(session, deltas.produto)
+
+@event.listens_for(Session, 'after_transaction_end')
+def _descartar_pendentes(session, transacao):
+    # Transações (ou savepoints) desfeitas descartam seus deltas
+    pendentes = session.info.get(_CHAVE_PENDENTES)
+    if pendentes:
+        pendentes.pop(transacao, None)
+
+def contribuicao_pedido(status, valor_total, data_pedido):
+    """
+    Contribuição de um pedido em vendas_diarias
+    
+    Returns:
+        tuple: (data, pedidos, valor) ou None se o pedido não conta (cancelado ou sem data)
+    """
+    if status == 'cancelado' or data_pedido is None:
+        return None
+    return data_pedido.date(), 1, float(valor_total or 0.0)
+
+def aplicar_vendas_diarias(conexao, deltas):
+    """
+    Soma deltas às linhas de vendas_diarias (criando os dias que não existirem)
+    
+    Chamada no commit com os deltas acumulados da transação (deltas_pendentes).
+    
+    Args:
+        conexao: Sessão ou Connection na transação que gravou os pedidos
+        deltas (dict): data -> (delta_pedidos, delta_valor)
+    """
+    # Ordem fixa das chaves para que transações concorrentes travem as linhas
+    # do rollup na mesma ordem (evita deadlocks)
+    agora = datetime.utcnow()
+    linhas = [
+        {'data': data, 'total_pedidos': pedidos, 'total_vendas': valor, 'atualizado_em': agora}
+        for data, (pedidos, valor) in sorted(deltas.items())
+        if pedidos or valor
+    ]
+    if linhas:
+        conexao.execute(_SQL_APLICAR_VENDAS_DIARIAS, linhas)
+
+def aplicar_vendas_produto(conexao, deltas):
+    """
+    Soma deltas a vendas_produto_diarias e aos totais de vendas_produto
+    
+    Chamada no commit com os deltas acumulados da transação (deltas_pendentes).
+    
+    Args:
+        conexao: Sessão ou Connection na transação que gravou os pedidos
+        deltas (dict): (data, id_produto) -> (delta_quantidade, delta_receita, delta_pedidos)
+    """
+    totais = defaultdict(lambda: (0, 0.0, 0))
+    diarias = []
+    for (data, id_produto), (quantidade, receita, pedidos) in sorted(deltas.items()):
+        if not (quantidade or receita or pedidos):
+            continue
+        diarias.append({'data': data, 'id_produto': id_produto, 'quantidade': quantidade,
+                        'receita': receita, 'pedidos': pedidos})
+        atual = totais[id_produto]
+        totais[id_produto] = (atual[0] + quantidade, atual[1] + receita, atual[2] + pedidos)
+    
+    if not diarias:
+        return
+    
+    agora = datetime.utcnow()
+    conexao.execute(_SQL_APLICAR_VENDAS_PRODUTO_DIARIAS, diarias)
+    conexao.execute(_SQL_APLICAR_VENDAS_PRODUTO, [
+        {'id_produto': id_produto, 'quantidade': q, 'receita': r, 'pedidos': p, 'atualizado_em': agora}
+        for id_produto, (q, r, p) in sorted(totais.items())
+    ])
+
+def _acumular_itens(deltas, data, itens, sinal):
+    """
+    Acumula os itens de um mesmo pedido, já agrupados por produto
+    
+    Args:
+        itens: Iterável de (id_produto, quantidade, receita)
+    """
+    for id_produto, quantidade, receita in itens:
+        chave = (data, int(id_produto))
+        atual = deltas[chave]
+        deltas[chave] = (atual[0] + sinal * int(quantidade),
+                         atual[1] + sinal * float(receita or 0.0),
+                         atual[2] + sinal)
+
+def _valores_anteriores(alvo):
+    """
+    Valores de status, valor_total e data_pedido antes das alterações pendentes
+    """
+    estado = inspect(alvo)
+    valores = {}
+    for atributo in ATRIBUTOS_ROLLUP:
+        historico = estado.attrs[atributo].history
+        if historico.deleted:
+            valores[atributo] = historico.deleted[0]
+        elif historico.unchanged:
+            valores[atributo] = historico.unchanged[0]
+        else:
+            valores[atributo] = getattr(alvo, atributo)
+    return valores
+
+def _acumular(deltas, contribuicao, sinal):
+    if contribuicao is not None:
+        data, pedidos, valor = contribuicao
+        atual = deltas[data]
+        deltas[data] = (atual[0] + sinal * pedidos, atual[1] + sinal * valor)
+
+@event.listens_for(Pedido, 'after_insert')
+def _pedido_inserido(mapper, conexao, alvo):
+    deltas = deltas_pendentes(object_session(alvo)).diarias
+    _acumular(deltas, contribuicao_pedido(alvo.status, alvo.valor_total, alvo.data_pedido), 1)
+
+@event.listens_for(Pedido, 'after_update')
+def _pedido_atualizado(mapper, conexao, alvo):
+    estado = inspect(alvo)
+    if not any(estado.attrs[a].history.has_changes() for a in ATRIBUTOS_ROLLUP):
+        return
+    
+    anteriores = _valores_anteriores(alvo)
+    deltas = deltas_pendentes(object_session(alvo)).diarias
+    _acumular(deltas, contribuicao_pedido(anteriores['status'], anteriores['valor_total'],
+                                          anteriores['data_pedido']), -1)
+    _acumular(deltas, contribuicao_pedido(alvo.status, alvo.valor_total, alvo.data_pedido), 1)
+    
+    # Rollup por produto: muda só quando o pedido passa a contar ou deixar de
+    # contar (cancelamento) ou muda de dia; os itens são relidos do banco
+    antes = contribuicao_pedido(anteriores['status'], 0, anteriores['data_pedido'])
+    depois = contribuicao_pedido(alvo.status, 0, alvo.data_pedido)
+    data_antes = antes[0] if antes else None
+    data_depois = depois[0] if depois else None
+    if data_antes != data_depois:
+        itens = conexao.execute(_SQL_ITENS_PEDIDO, {'id_pedido': alvo.id_pedido}).fetchall()
+        deltas_produto = deltas_pendentes(object_session(alvo)).produto
+        if data_antes is not None:
+            _acumular_itens(deltas_produto, data_antes, itens, -1)
+        if data_depois is not None:
+            _acumular_itens(deltas_produto, data_depois, itens, 1)
+    
+    _recalcular_feature_cliente(conexao, alvo.id_cliente)
+
+@event.listens_for(Pedido, 'after_delete')
+def _pedido_removido(mapper, conexao, alvo):
+    anteriores = _valores_anteriores(alvo)
+    deltas = deltas_pendentes(object_session(alvo)).diarias
+    _acumular(deltas, contribuicao_pedido(anteriores['status'], anteriores['valor_total'],
+                                          anteriores['data_pedido']), -1)
+    _recalcular_feature_cliente(conexao, alvo.id_cliente)
+
+def _recalcular_feature_cliente(conexao, id_cliente):
+    """
+    Recalcula as features de um cliente cujo pedido mudou (status, valor, data)
+    
+    Considera só os pedidos até o watermark, como o job incremental; pedidos
+    mais novos ainda serão somados por atualizar_features_clientes.
+    """
+    conexao.execute(_SQL_RECALCULAR_FEATURE_CLIENTE, {
+        'id_cliente': id_cliente, 'watermark': WATERMARK_FEATURES_CLIENTES})
+
+def _item_alterado(conexao, alvo, sinal):
+    """
+    Aplica um item inserido (sinal 1) ou removido (sinal -1) via ORM
+    
+    O pedido só conta uma vez por produto: o contador de pedidos muda apenas no
+    primeiro item inserido / último item removido daquele produto no pedido.
+    """
+    pedido = conexao.execute(_SQL_PEDIDO_DO_ITEM, {
+        'id_pedido': alvo.id_pedido, 'id_produto': alvo.id_produto}).first()
+    if pedido is None:
+        return
+    contribuicao = contribuicao_pedido(pedido.status, 0, pedido.data_pedido)
+    if contribuicao is None:
+        return
+    
+    novo_no_pedido = pedido.itens_mesmo_produto == (1 if sinal > 0 else 0)
+    deltas = deltas_pendentes(object_session(alvo)).produto
+    chave = (contribuicao[0], alvo.id_produto)
+    atual = deltas[chave]
+    deltas[chave] = (atual[0] + sinal * alvo.quantidade,
+                     atual[1] + sinal * float(alvo.subtotal or 0.0),
+                     atual[2] + (sinal if novo_no_pedido else 0))
+
+@event.listens_for(ItemPedido, 'after_insert')
+def _item_inserido(mapper, conexao, alvo):
+    _item_alterado(conexao, alvo, 1)
+
+@event.listens_for(ItemPedido, 'after_delete')
+def _item_removido(mapper, conexao, alvo):
+    _item_alterado(conexao, alvo, -1)
+
+# Carregar o valor anterior mesmo quando o atributo estava expirado (ex.: após
+# commit), senão o histórico não teria o que subtrair do rollup
+for _atributo in ATRIBUTOS_ROLLUP:
+    event.listen(getattr(Pedido, _atributo), 'set', lambda alvo, valor, anterior, iniciador: valor,
+                 active_history=True, retval=True)
+
+def registrar_pedidos_core(session, pedidos):
+    """
+    Atualiza os rollups para pedidos inseridos via Core (sem eventos do ORM),
+    como na ingestão em lote; os deltas são gravados no commit da sessão
+    
+    Args:
+        pedidos: Iterável de (status, valor_total, data_pedido)
+    """
+    deltas = deltas_pendentes(session).diarias
+    for status, valor_total, data_pedido in pedidos:
+        _acumular(deltas, contribuicao_pedido(status, valor_total, data_pedido), 1)
+
+def registrar_itens_core(session, itens):
+    """
+    Atualiza o rollup por produto para itens inseridos via Core, como no
+    POST /api/pedidos e na ingestão em lote; os deltas são gravados no commit
+    da sessão
+    
+    Args:
+        itens: Iterável de (status, data_pedido, id_pedido, id_produto, quantidade, subtotal)
+    """
+    por_pedido = defaultdict(lambda: [0, 0.0])
+    datas = {}
+    for status, data_pedido, id_pedido, id_produto, quantidade, subtotal in itens:
+        contribuicao = contribuicao_pedido(status, 0, data_pedido)
+        if contribuicao is None:
+            continue
+        datas[id_pedido] = contribuicao[0]
+        agregado = por_pedido[(id_pedido, id_produto)]
+        agregado[0] += quantidade
+        agregado[1] += subtotal
+    
+    deltas = deltas_pendentes(session).produto
+    for (id_pedido, id_produto), (quantidade, receita) in por_pedido.items():
+        _acumular_itens(deltas, datas[id_pedido], [(id_produto, quantidade, receita)], 1)
+
+def obter_watermark(conexao, nome, bloquear=False):
+    """
+    Retorna o valor atual de um watermark (0 se ainda não existir)
+    
+    Args:
+        bloquear (bool): Trava a linha até o fim da transação (SELECT ... FOR UPDATE),
+            para que duas execuções do mesmo job não processem o mesmo intervalo
+    """
+    if bloquear:
+        conexao.execute(text(
+            "INSERT IGNORE INTO watermarks (nome, valor, atualizado_em) VALUES (:nome, 0, UTC_TIMESTAMP())"
+        ), {'nome': nome})
+    sql = "SELECT valor FROM watermarks WHERE nome = :nome" + (" FOR UPDATE" if bloquear else "")
+    valor = conexao.execute(text(sql), {'nome': nome}).scalar()
+    return valor or 0
+
+def definir_watermark(conexao, nome, valor):
+    conexao.execute(text("""
+        INSERT INTO watermarks (nome, valor, atualizado_em) VALUES (:nome, :valor, UTC_TIMESTAMP())
+        ON DUPLICATE KEY UPDATE valor = VALUES(valor), atualizado_em = VALUES(atualizado_em)
+    """), {'nome': nome, 'valor': valor})
+
+def _limite_seguro(session, atraso_segundos):
+    """
+    Maior id_pedido que já pode ser processado (None se nenhum)
+    
+    Os ids são reservados no INSERT mas só ficam visíveis no commit, então um
+    pedido de id menor que o MAX(id_pedido) atual ainda pode aparecer. O limite
+    seguro é o MAX(id_pedido) visto há pelo menos atraso_segundos: toda
+    transação que reservou um id até ele já terminou. Lacunas definitivas
+    (rollbacks, pedidos removidos) não travam o job.
+    """
+    visto = session.execute(text("""
+        SELECT valor, TIMESTAMPDIFF(SECOND, atualizado_em, UTC_TIMESTAMP())
+        FROM watermarks WHERE nome = :nome
+    """), {'nome': WATERMARK_FEATURES_CLIENTES_VISTO}).first()
+    if visto is not None and visto[1] < atraso_segundos:
+        return None
+    
+    maximo = session.execute(text("SELECT MAX(id_pedido) FROM pedidos")).scalar() or 0
+    definir_watermark(session, WATERMARK_FEATURES_CLIENTES_VISTO, maximo)
+    return visto[0] if visto is not None else None
+
+def atualizar_features_clientes(session, tamanho_lote=50000, commit=True,
+                                atraso_segundos=ATRASO_FEATURES_CLIENTES):
+    """
+    Soma às features de clientes os pedidos criados desde o último watermark
+    
+    Job incremental (rodar periodicamente): processa os pedidos com id maior que o
+    watermark e até o limite seguro (_limite_seguro) em faixas de tamanho_lote ids,
+    um commit por faixa. Os dias com compra são exatos: um dia novo só conta se o
+    cliente não tinha pedido naquele dia até o watermark. Mudanças de status de
+    pedidos já processados são aplicadas pelos eventos do ORM
+    (_recalcular_feature_cliente).
+    
+    Args:
+        atraso_segundos (int): Duração máxima de uma transação que grava pedidos;
+            um pedido entra nas features entre atraso_segundos e 2 * atraso_segundos
+            depois de criado
+    
+    Returns:
+        int: Quantidade de pedidos (ids) processados
+    """
+    processados = 0
+    try:
+        obter_watermark(session, WATERMARK_FEATURES_CLIENTES, bloquear=True)
+        limite = _limite_seguro(session, atraso_segundos)
+        while True:
+            de = obter_watermark(session, WATERMARK_FEATURES_CLIENTES, bloquear=True)
+            if limite is None or limite <= de:
+                if commit:
+                    session.commit()
+                break
+            
+            ate = min(limite, de + tamanho_lote)
+            session.execute(_SQL_ATUALIZAR_FEATURES_CLIENTES, {'de': de, 'ate': ate})
+            definir_watermark(session, WATERMARK_FEATURES_CLIENTES, ate)
+            if commit:
+                session.commit()
+            processados += ate - de
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao atualizar features_clientes: {str(e)}")
+        raise
+    
+    logger.info(f"features_clientes atualizada: {processados} pedidos processados")
+    return processados
+
+def reconstruir_features_clientes(session, commit=True):
+    """
+    Recalcula features_clientes do zero, até o maior id_pedido atual
+    
+    Returns:
+        int: Quantidade de clientes gravados
+    """
+    try:
+        maximo = session.execute(text("SELECT MAX(id_pedido) FROM pedidos")).scalar() or 0
+        session.execute(text("DELETE FROM features_clientes"))
+        result = session.execute(text("""
+            INSERT INTO features_clientes
+                (id_cliente, ultimo_pedido, total_pedidos, valor_total_gasto, dias_com_compras, atualizado_em)
+            SELECT id_cliente, MAX(data_pedido), COUNT(*), SUM(valor_total),
+                   COUNT(DISTINCT DATE(data_pedido)), UTC_TIMESTAMP()
+            FROM pedidos
+            WHERE id_pedido <= :ate AND status != 'cancelado'
+            GROUP BY id_cliente
+        """), {'ate': maximo})
+        definir_watermark(session, WATERMARK_FEATURES_CLIENTES, maximo)
+        if commit:
+            session.commit()
+        logger.info(f"features_clientes reconstruída: {result.rowcount} clientes")
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao reconstruir features_clientes: {str(e)}")
+        raise
+
+def reconstruir_vendas_diarias(session, desde=None, commit=True):
+    """
+    Recalcula vendas_diarias a partir da tabela de pedidos
+    
+    Usado no backfill inicial e como reparo, por exemplo depois de alterações
+    feitas direto no banco (UPDATE/DELETE manuais não disparam os eventos do ORM)
+    ou de itens alterados depois de criados.
+    
+    Args:
+        session: Sessão SQLAlchemy conectada ao writer
+        desde (date): Recalcula apenas a partir deste dia (padrão: todos os dias)
+        commit (bool): Faz commit ao final
+    
+    Returns:
+        int: Quantidade de dias gravados
+    """
+    filtro_rollup = "WHERE data >= :desde" if desde else ""
+    filtro_pedidos = "AND data_pedido >= :desde" if desde else ""
+    params = {'desde': desde} if desde else {}
+    
+    try:
+        session.execute(text(f"DELETE FROM vendas_diarias {filtro_rollup}"), params)
+        result = session.execute(text(f"""
+            INSERT INTO vendas_diarias (data, total_pedidos, total_vendas, atualizado_em)
+            SELECT DATE(data_pedido), COUNT(*), SUM(valor_total), UTC_TIMESTAMP()
+            FROM pedidos
+            WHERE status != 'cancelado' {filtro_pedidos}
+            GROUP BY DATE(data_pedido)
+        """), params)
+        if commit:
+            session.commit()
+        logger.info(f"vendas_diarias reconstruída: {result.rowcount} dias")
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao reconstruir vendas_diarias: {str(e)}")
+        raise
+
+def reconstruir_vendas_produto(session, desde=None, commit=True):
+    """
+    Recalcula vendas_produto_diarias a partir de pedidos e itens e, em seguida,
+    os totais de vendas_produto a partir das linhas diárias
+    
+    Args:
+        session: Sessão SQLAlchemy conectada ao writer
+        desde (date): Recalcula as linhas diárias apenas a partir deste dia
+        commit (bool): Faz commit ao final
+    
+    Returns:
+        int: Quantidade de linhas (dia, produto) gravadas
+    """
+    filtro_rollup = "WHERE data >= :desde" if desde else ""
+    filtro_pedidos = "AND p.data_pedido >= :desde" if desde else ""
+    params = {'desde': desde} if desde else {}
+    
+    try:
+        session.execute(text(f"DELETE FROM vendas_produto_diarias {filtro_rollup}"), params)
+        result = session.execute(text(f"""
+            INSERT INTO vendas_produto_diarias (data, id_produto, quantidade_vendida, receita_total, total_pedidos)
+            SELECT DATE(p.data_pedido), ip.id_produto, SUM(ip.quantidade), SUM(ip.subtotal),
+                   COUNT(DISTINCT ip.id_pedido)
+            FROM itens_pedido ip
+            JOIN pedidos p ON p.id_pedido = ip.id_pedido
+            WHERE p.status != 'cancelado' {filtro_pedidos}
+            GROUP BY DATE(p.data_pedido), ip.id_produto
+        """), params)
+        
+        # Um pedido pertence a um único dia, então a soma dos pedidos distintos
+        # por dia é o total de pedidos distintos do produto
+        session.execute(text("DELETE FROM vendas_produto"))
+        session.execute(text("""
+            INSERT INTO vendas_produto (id_produto, quantidade_vendida, receita_total, total_pedidos, atualizado_em)
+            SELECT id_produto, SUM(quantidade_vendida), SUM(receita_total), SUM(total_pedidos), UTC_TIMESTAMP()
+            FROM vendas_produto_diarias
+            GROUP BY id_produto
+        """))
+        if commit:
+            session.commit()
+        logger.info(f"vendas_produto reconstruída: {result.rowcount} linhas diárias")
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao reconstruir vendas_produto: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    import sys
+    from .connection import get_db_session
+    
+    session = get_db_session()
+    try:
+        if 'reconstruir' in sys.argv[1:]:
+            dias = reconstruir_vendas_diarias(session)
+            print(f"vendas_diarias reconstruída: {dias} dias")
+            linhas = reconstruir_vendas_produto(session)
+            print(f"vendas_produto reconstruída: {linhas} linhas diárias")
+            clientes = reconstruir_features_clientes(session)
+            print(f"features_clientes reconstruída: {clientes} clientes")
+        else:
+            pedidos = atualizar_features_clientes(session)
+            print(f"features_clientes atualizada: {pedidos} pedidos processados")
+    finally:
+        session.close()
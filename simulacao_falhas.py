@@ -0,0 +1,162 @@
+"""
+Simulação de falhas do banco de dados
+Banco falso (SQLite em arquivo temporário) que injeta erros MySQL transitórios
+nas execuções, para verificar retry, backoff e tratamento de failover do
+RDSConnection.executar_com_retry sem um RDS real
+Execute: python -m src.database.simulacao_falhas
+"""
+
+import os
+import sqlite3
+import logging
+import tempfile
+from collections import deque
+from sqlalchemy import create_engine, event, text, exc
+from sqlalchemy.orm import sessionmaker
+from .connection import RDSConnection, classificar_erro
+
+# Mensagens dos códigos MySQL simulados (como o pymysql: args = (código, mensagem))
+MENSAGENS_ERROS = {
+    1064: "You have an error in your SQL syntax",
+    1205: "Lock wait timeout exceeded; try restarting transaction",
+    1213: "Deadlock found when trying to get lock; try restarting transaction",
+    1290: "The MySQL server is running with the --read-only option",
+    2006: "MySQL server has gone away",
+    2013: "Lost connection to MySQL server during query"
+}
+
+class FalhaSimulada(sqlite3.OperationalError):
+    """
+    Erro do driver com o código MySQL no primeiro argumento
+    
+    Por ser um OperationalError do driver em uso, o SQLAlchemy o embrulha em
+    sqlalchemy.exc.OperationalError, exatamente como um erro do pymysql.
+    """
+
+class BancoComFalhas:
+    """
+    RDSConnection sobre um banco SQLite com falhas programadas
+    
+    programar() enfileira códigos de erro MySQL (None = execução normal) que
+    são aplicados, em ordem, às próximas execuções de SQL. Contadores:
+    execucoes (SQL enviados ao banco), falhas_injetadas e failovers
+    (chamadas a tratar_failover).
+    """
+    
+    def __init__(self, tentativas=3, espera_base=0.001):
+        self._arquivo = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        self.engine = create_engine(f"sqlite:///{self._arquivo}")
+        
+        self.conexao = RDSConnection()
+        self.conexao.engine = self.engine
+        self.conexao.session_factory = sessionmaker(bind=self.engine)
+        self.conexao.retry_tentativas = tentativas
+        self.conexao.retry_espera_base = espera_base
+        self.conexao.retry_espera_max = espera_base * 10
+        
+        self._falhas = deque()
+        self.execucoes = 0
+        self.falhas_injetadas = 0
+        self.failovers = 0
+        
+        tratar_failover = self.conexao.tratar_failover
+        
+        def contar_failover(engine, erro=None):
+            self.failovers += 1
+            return tratar_failover(engine, erro)
+        
+        self.conexao.tratar_failover = contar_failover
+        
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE pedidos (id INTEGER PRIMARY KEY, valor REAL)"))
+        event.listen(self.engine, 'before_cursor_execute', self._injetar)
+    
+    def _injetar(self, conn, cursor, statement, parameters, context, executemany):
+        self.execucoes += 1
+        if self._falhas:
+            codigo = self._falhas.popleft()
+            if codigo is not None:
+                self.falhas_injetadas += 1
+                raise FalhaSimulada(codigo, MENSAGENS_ERROS.get(codigo, "falha simulada"))
+    
+    def programar(self, *codigos):
+        self._falhas.extend(codigos)
+        return self
+    
+    def reiniciar_contadores(self):
+        self._falhas.clear()
+        self.execucoes = 0
+        self.falhas_injetadas = 0
+        self.failovers = 0
+    
+    def total_pedidos(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM pedidos")).scalar()
+    
+    def fechar(self):
+        self.engine.dispose()
+        os.remove(self._arquivo)
+
+def _ler(session):
+    return session.execute(text("SELECT COUNT(*) FROM pedidos")).scalar()
+
+def _gravar(session):
+    session.execute(text("INSERT INTO pedidos (valor) VALUES (10.0)"))
+    session.commit()
+    return True
+
+def _executar(banco, operacao, **kwargs):
+    try:
+        return 'ok', banco.conexao.executar_com_retry(operacao, **kwargs)
+    except exc.DBAPIError as e:
+        return f"erro {classificar_erro(e) or 'nao_transitorio'}", None
+
+# Cenários: (nome, falhas programadas, operação, kwargs, resultado esperado,
+#            execuções esperadas, pedidos gravados esperados, failovers esperados)
+CENARIOS = [
+    ('leitura após 2 quedas de conexão', (2013, 2006), _ler, {}, 'ok', 3, 0, 2),
+    ('leitura esgota as tentativas', (2013, 2013, 2013), _ler, {}, 'erro conexao', 3, 0, 2),
+    ('escrita não idempotente após queda de conexão', (2013,), _gravar,
+     {'readonly': False}, 'erro conexao', 1, 0, 0),
+    ('escrita após deadlock', (1213,), _gravar, {'readonly': False}, 'ok', 2, 1, 0),
+    ('escrita após lock wait timeout', (1205, 1205), _gravar, {'readonly': False}, 'ok', 3, 1, 0),
+    ('escrita em instância rebaixada (failover)', (1290,), _gravar,
+     {'readonly': False}, 'ok', 2, 1, 1),
+    ('escrita idempotente após queda de conexão', (2013,), _gravar,
+     {'readonly': False, 'idempotente': True}, 'ok', 2, 1, 1),
+    ('erro não transitório não é repetido', (1064,), _ler, {}, 'erro nao_transitorio', 1, 0, 0)
+]
+
+def verificar_retry(cenarios=CENARIOS):
+    """
+    Executa os cenários de falha e compara com o comportamento esperado
+    
+    Returns:
+        list: Um dict por cenário (esperado, obtido e 'ok')
+    """
+    resultados = []
+    for nome, falhas, operacao, kwargs, esperado, execucoes, gravados, failovers in cenarios:
+        banco = BancoComFalhas()
+        try:
+            banco.programar(*falhas)
+            obtido, _ = _executar(banco, operacao, **kwargs)
+            resultado = {
+                'cenario': nome,
+                'esperado': (esperado, execucoes, gravados, failovers),
+                'obtido': (obtido, banco.execucoes, banco.total_pedidos(), banco.failovers)
+            }
+        finally:
+            banco.fechar()
+        resultado['ok'] = resultado['esperado'] == resultado['obtido']
+        resultados.append(resultado)
+    return resultados
+
+if __name__ == "__main__":
+    logging.getLogger('src.database.connection').setLevel(logging.ERROR)
+    resultados = verificar_retry()
+    for r in resultados:
+        print(f"{'OK   ' if r['ok'] else 'FALHA'} {r['cenario']}: "
+              f"esperado {r['esperado']}, obtido {r['obtido']}")
+    falhas = sum(not r['ok'] for r in resultados)
+    print(f"{len(resultados) - falhas}/{len(resultados)} cenários com o comportamento esperado")
+    raise SystemExit(1 if falhas else 0)
@@ -0,0 +1,296 @@
+"""
+Snapshots locais (Parquet) das séries usadas em analytics e ML
+Os resultados das consultas ficam em arquivos Parquet particionados por mês da
+coluna de data; execuções seguintes buscam no RDS só as linhas alteradas desde a
+última leitura (cursor na coluna de atualização) e leem do disco o resto das
+partições pedidas
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import pandas as pd
+from ..database.consultas import consultas
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cursor de uma leitura completa (todas as linhas)
+_INICIO_CURSOR = datetime(1970, 1, 1)
+
+class SnapshotConsultas:
+    """
+    Cache em disco, por consulta + parâmetros, de consultas com filtros :desde e
+    :atualizado_desde
+    
+    A consulta deve aceitar os parâmetros :desde (date) e :atualizado_desde
+    (datetime, filtro na coluna de atualização) e retornar uma linha por data,
+    com a coluna de data e a coluna de atualização. Layout em disco:
+        <diretorio>/<consulta>/<hash da SQL e dos parâmetros>/
+            manifesto.json          (inicio, cursor, partições)
+            mes=AAAA-MM.parquet     (uma partição por mês)
+    
+    O cursor é a maior data de atualização já lida; cada leitura busca as
+    linhas atualizadas desde cursor - margem_segundos (commits atrasados e
+    relógios diferentes entre servidores) e substitui as linhas das mesmas
+    datas, então pedidos atrasados e cancelamentos de qualquer dia são vistos.
+    Linhas removidas da tabela (não só atualizadas) exigem limpar().
+    
+    Partições com mais de meses_retencao meses (0 = sem limite) são removidas
+    a cada leitura, exceto as que a própria leitura pede. A leitura e a
+    mesclagem de um snapshot são serializadas entre threads (_lock) e entre
+    processos (flock em <snapshot>/.lock, onde fcntl existe).
+    """
+    
+    def __init__(self, diretorio, margem_segundos=300, meses_retencao=24):
+        self.diretorio = diretorio
+        self.margem_segundos = margem_segundos
+        self.meses_retencao = meses_retencao
+        self._lock = threading.Lock()
+        self.leituras_completas = 0
+        self.leituras_delta = 0
+        self.linhas_buscadas = 0
+        self.linhas_lidas_disco = 0
+        self.particoes_removidas = 0
+    
+    @property
+    def disponivel(self):
+        return pq is not None and bool(self.diretorio)
+    
+    def _diretorio_snapshot(self, consulta, params):
+        sql = str(consultas.obter(consulta)) if consulta in consultas else consulta
+        identificacao = json.dumps({'sql': sql, 'params': params}, sort_keys=True, default=str)
+        chave = hashlib.sha1(identificacao.encode()).hexdigest()[:16]
+        nome = consulta if consulta in consultas else 'sql'
+        return os.path.join(self.diretorio, nome, chave)
+    
+    def _ler_manifesto(self, diretorio):
+        caminho = os.path.join(diretorio, 'manifesto.json')
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding='utf-8') as f:
+            manifesto = json.load(f)
+        if 'cursor' not in manifesto:
+            # Manifesto do formato anterior (high-water mark por data): refazer
+            return None
+        manifesto['inicio'] = date.fromisoformat(manifesto['inicio'])
+        manifesto['cursor'] = datetime.fromisoformat(manifesto['cursor'])
+        return manifesto
+    
+    def _gravar_atomico(self, caminho, gravar):
+        # Grava em arquivo temporário e troca de uma vez: leitores concorrentes
+        # veem a versão anterior ou a nova, nunca um arquivo pela metade
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        gravar(temporario)
+        os.replace(temporario, caminho)
+    
+    def _gravar_manifesto(self, diretorio, manifesto):
+        def gravar(caminho):
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'inicio': manifesto['inicio'].isoformat(),
+                    'cursor': manifesto['cursor'].isoformat(),
+                    'particoes': sorted(manifesto['particoes'])
+                }, f)
+        self._gravar_atomico(os.path.join(diretorio, 'manifesto.json'), gravar)
+    
+    def _caminho_particao(self, diretorio, mes):
+        return os.path.join(diretorio, f"mes={mes}.parquet")
+    
+    def _gravar_particao(self, diretorio, mes, df):
+        tabela = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        self._gravar_atomico(self._caminho_particao(diretorio, mes),
+                             lambda caminho: pq.write_table(tabela, caminho))
+    
+    def _ler_particao(self, diretorio, mes):
+        # memory_map evita a cópia do arquivo para um buffer de leitura, mas
+        # to_pandas materializa a partição inteira em memória: por isso só as
+        # partições a partir de desde são lidas (ver _ler)
+        return pq.read_table(self._caminho_particao(diretorio, mes), memory_map=True).to_pandas()
+    
+    @contextmanager
+    def _lock_arquivo(self, diretorio):
+        """
+        Lock exclusivo do snapshot entre processos (workers, jobs agendados)
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(diretorio, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _aplicar_retencao(self, diretorio, manifesto, desde):
+        """
+        Remove as partições anteriores ao limite de retenção (nunca as pedidas
+        a partir de desde) e avança o início do snapshot
+        """
+        if not self.meses_retencao:
+            return
+        limite = min(pd.Period(date.today(), 'M') - self.meses_retencao, pd.Period(desde, 'M'))
+        antigas = {mes for mes in manifesto['particoes'] if mes < limite.strftime('%Y-%m')}
+        for mes in antigas:
+            caminho = self._caminho_particao(diretorio, mes)
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        manifesto['particoes'] -= antigas
+        self.particoes_removidas += len(antigas)
+        manifesto['inicio'] = max(manifesto['inicio'], limite.start_time.date())
+    
+    def _datas(self, df, coluna_data):
+        return pd.to_datetime(df[coluna_data]).dt.date
+    
+    def _meses(self, df, coluna_data):
+        return pd.to_datetime(df[coluna_data]).dt.strftime('%Y-%m')
+    
+    def _mesclar(self, diretorio, manifesto, novos, coluna_data, coluna_atualizacao):
+        """
+        Substitui as linhas das datas presentes em novos pelas linhas novas,
+        reescrevendo apenas as partições afetadas, e avança o cursor
+        """
+        if novos.empty:
+            return
+        datas_novas = set(self._datas(novos, coluna_data))
+        meses_novos = self._meses(novos, coluna_data)
+        
+        for mes in sorted(set(meses_novos)):
+            partes = []
+            if mes in manifesto['particoes']:
+                existente = self._ler_particao(diretorio, mes)
+                partes.append(existente[~self._datas(existente, coluna_data).isin(datas_novas)])
+            partes.append(novos[meses_novos == mes])
+            self._gravar_particao(diretorio, mes, pd.concat(partes, ignore_index=True))
+            manifesto['particoes'].add(mes)
+        
+        atualizacoes = pd.to_datetime(novos[coluna_atualizacao]).dropna()
+        if not atualizacoes.empty:
+            manifesto['cursor'] = max(manifesto['cursor'], atualizacoes.max().to_pydatetime())
+    
+    def _ler(self, diretorio, manifesto, desde, coluna_data):
+        mes_desde = desde.strftime('%Y-%m')
+        partes = [self._ler_particao(diretorio, mes)
+                  for mes in sorted(manifesto['particoes']) if mes >= mes_desde]
+        if not partes:
+            return None
+        df = pd.concat(partes, ignore_index=True)
+        df = df[self._datas(df, coluna_data) >= desde]
+        self.linhas_lidas_disco += len(df)
+        return df.sort_values(coluna_data).reset_index(drop=True)
+    
+    def carregar(self, consulta, buscar, desde, params=None, coluna_data='data',
+                 coluna_atualizacao='atualizado_em'):
+        """
+        Retorna as linhas da consulta com coluna_data >= desde
+        
+        Args:
+            consulta (str): Nome de uma consulta registrada (com parâmetros :desde
+                e :atualizado_desde)
+            buscar (callable): Recebe os parâmetros (incluindo 'desde' e
+                'atualizado_desde') e retorna um DataFrame com o resultado da
+                consulta no RDS, ou None em caso de erro
+            desde (date): Primeiro dia desejado
+            params (dict): Demais parâmetros da consulta (fazem parte da chave)
+            coluna_data (str): Coluna usada no particionamento (uma linha por data)
+            coluna_atualizacao (str): Coluna de data de atualização usada como cursor
+        
+        Returns:
+            DataFrame ordenado por coluna_data, ou None se não houver dados
+        """
+        params = dict(params or {})
+        if not self.disponivel:
+            df = buscar({**params, 'desde': desde, 'atualizado_desde': _INICIO_CURSOR})
+            return df if df is not None and not df.empty else None
+        
+        diretorio = self._diretorio_snapshot(consulta, params)
+        with self._lock, self._lock_arquivo(diretorio):
+            manifesto = self._ler_manifesto(diretorio)
+            
+            if manifesto is not None and manifesto['inicio'] <= desde:
+                # Delta: linhas atualizadas desde o cursor (menos a margem)
+                novos = buscar({**params, 'desde': manifesto['inicio'],
+                                'atualizado_desde': manifesto['cursor'] - timedelta(seconds=self.margem_segundos)})
+                if novos is None:
+                    return None
+                self.leituras_delta += 1
+            else:
+                # Sem snapshot (ou pedindo dias anteriores ao início dele): tudo de novo
+                novos = buscar({**params, 'desde': desde, 'atualizado_desde': _INICIO_CURSOR})
+                if novos is None:
+                    return None
+                self.leituras_completas += 1
+                if manifesto is not None:
+                    for mes in manifesto['particoes']:
+                        os.remove(self._caminho_particao(diretorio, mes))
+                manifesto = {'inicio': desde, 'cursor': _INICIO_CURSOR, 'particoes': set()}
+            
+            manifesto['particoes'] = set(manifesto['particoes'])
+            self.linhas_buscadas += len(novos)
+            self._mesclar(diretorio, manifesto, novos, coluna_data, coluna_atualizacao)
+            self._aplicar_retencao(diretorio, manifesto, desde)
+            self._gravar_manifesto(diretorio, manifesto)
+            
+            return self._ler(diretorio, manifesto, desde, coluna_data)
+    
+    def limpar(self, consulta=None):
+        """
+        Remove os snapshots (de uma consulta ou todos), forçando uma leitura completa
+        """
+        alvo = os.path.join(self.diretorio, consulta) if consulta else self.diretorio
+        with self._lock:
+            if alvo and os.path.exists(alvo):
+                shutil.rmtree(alvo)
+    
+    def estatisticas(self):
+        return {
+            'disponivel': self.disponivel,
+            'leituras_completas': self.leituras_completas,
+            'leituras_delta': self.leituras_delta,
+            'linhas_buscadas_rds': self.linhas_buscadas,
+            'linhas_lidas_disco': self.linhas_lidas_disco,
+            'particoes_removidas': self.particoes_removidas
+        }
+
+def criar_snapshots(diretorio=None, margem_segundos=None, meses_retencao=None):
+    """
+    Cria o cache de snapshots a partir de variáveis de ambiente
+    
+    Variáveis:
+        ANALYTICS_SNAPSHOT_DIR: Diretório dos snapshots (padrão 'snapshots'; vazio desativa)
+        ANALYTICS_SNAPSHOT_MARGEM_SEGUNDOS: Segundos antes do cursor de atualização
+            buscados de novo a cada leitura (padrão 300)
+        ANALYTICS_SNAPSHOT_MESES_RETENCAO: Meses de partições mantidos em disco
+            (padrão 24; 0 mantém todas)
+    """
+    diretorio = diretorio if diretorio is not None else os.getenv('ANALYTICS_SNAPSHOT_DIR', 'snapshots')
+    margem_segundos = (margem_segundos if margem_segundos is not None
+                       else int(os.getenv('ANALYTICS_SNAPSHOT_MARGEM_SEGUNDOS', 300)))
+    meses_retencao = (meses_retencao if meses_retencao is not None
+                      else int(os.getenv('ANALYTICS_SNAPSHOT_MESES_RETENCAO', 24)))
+    
+    if diretorio and pq is None:
+        logger.warning("pyarrow não está instalado; snapshots desativados (consultas vão direto ao RDS)")
+    
+    return SnapshotConsultas(diretorio, margem_segundos, meses_retencao)
+
+# Snapshots compartilhados por RDSAnalytics e RDSMLIntegration
+snapshots_analytics = criar_snapshots()